@@ -1,7 +1,11 @@
+import sys
+
 import matplotlib.pyplot as plt
 import file_utils
 import numpy as np
 
+import preview
+
 # 文件列表
 folder = "data/"
 fits_file_names = file_utils.get_fits_file_names(folder)
@@ -9,38 +13,56 @@ fits_file_names = file_utils.get_fits_file_names(folder)
 # 提取图像数据
 # FILE_NUM = 146 # 选择要处理的文件编号
 FILE_NUM = 49  # 选择要处理的文件编号
-image_data, hdr = file_utils.read_image_data(folder + fits_file_names[FILE_NUM])
+# 显示用的金字塔层（缩小倍数），需要全分辨率时用 file_utils.read_image_data 读取整帧
+DISPLAY_FACTOR = 4
+TITLES = {'fixed': 'fixed clipping', 'percentile': 'percentile clipping', 'statistics': 'statistics clipping'}
+
+if len(sys.argv) > 1:
+    FILE_NUM = int(sys.argv[1])
+
 
-# clip 过滤像素值
-image_data1, image_data2, image_data3 = file_utils.clip_image_data(image_data)
+def load(num):
+    # 预览（缩小的图像、三种裁剪的上下限和直方图）第一次计算后缓存在磁盘上，之后只读取小数组
+    p = preview.get(folder + fits_file_names[num], factors=(DISPLAY_FACTOR,))
+    return p, p.levels[DISPLAY_FACTOR]
 
-plt.imshow(image_data1)
+
+p, image_data = load(FILE_NUM)
+
+# 颜色范围取裁剪上下限：缩小后的平均值范围比原图窄，自动缩放会改变对比度
+plt.imshow(np.clip(image_data, *p.limits['fixed']), vmin=p.limits['fixed'][0], vmax=p.limits['fixed'][1])
 plt.show()
 
-# 手动调试固定值
-plt.figure(figsize=(12, 6))
-plt.subplot(2, 3, 1)
-plt.imshow(image_data1)
-plt.title('fixed clipping')
+# 手动调试固定值；左右方向键切换上一帧/下一帧
+fig = plt.figure(figsize=(12, 6))
+images, hists = {}, {}
+for k, mode in enumerate(preview.CLIP_MODES):
+    plt.subplot(2, 3, k + 1)
+    images[mode] = plt.imshow(np.clip(image_data, *p.limits[mode]), vmin=p.limits[mode][0], vmax=p.limits[mode][1])
+    plt.title(TITLES[mode])
+    hists[mode] = plt.subplot(2, 3, k + 4)
+    hists[mode].stairs(*p.histograms[mode], fill=True)
 
-plt.subplot(2, 3, 2)
-plt.imshow(image_data2)
-plt.title('percentile clipping')
 
-# 基于图像统计量
-plt.subplot(2, 3, 3)
-plt.title('statistics clipping')
-plt.imshow(image_data3)
+def show(num):
+    global FILE_NUM
+    FILE_NUM = num % len(fits_file_names)
+    p, image_data = load(FILE_NUM)
+    for mode in preview.CLIP_MODES:
+        images[mode].set_data(np.clip(image_data, *p.limits[mode]))
+        images[mode].set_clim(*p.limits[mode])
+        hists[mode].clear()
+        hists[mode].stairs(*p.histograms[mode], fill=True)
+    fig.suptitle(f'{FILE_NUM}: {fits_file_names[FILE_NUM]}')
+    fig.canvas.draw_idle()
 
-plt.subplot(2, 3, 4)
-plt.hist(image_data1.flatten(), bins=100)
 
-plt.subplot(2, 3, 5)
-plt.hist(image_data2.flatten(), bins=100)
+def on_key(event):
+    if event.key in ('left', 'right'):
+        show(FILE_NUM + (1 if event.key == 'right' else -1))
 
-plt.subplot(2, 3, 6)
-plt.hist(image_data3.flatten(), bins=100)
 
+fig.suptitle(f'{FILE_NUM}: {fits_file_names[FILE_NUM]}')
+fig.canvas.mpl_connect('key_press_event', on_key)
 plt.show()
 plt.close()
-
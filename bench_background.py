@@ -0,0 +1,28 @@
+import numpy as np
+
+import background
+from bench_utils import FFI_SHAPE, synthetic_frame, timeit
+from file_utils import CROP
+
+N_STARS = 20000
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    xs = rng.uniform(0, FFI_SHAPE[1], N_STARS)
+    ys = rng.uniform(0, FFI_SHAPE[0], N_STARS)
+    image_data = synthetic_frame(rng, xs, ys, rng.lognormal(8, 1, N_STARS))
+    # 加一个缓慢变化的背景梯度，更接近真实 FFI
+    image_data += np.linspace(0, 20, FFI_SHAPE[1], dtype=np.float32)[None, :]
+    image_data = image_data[CROP]
+
+    print(f'{"模式":<8}{"每帧耗时(s)":>12}{"median":>12}{"std":>10}{"median误差(σ)":>16}{"std误差(σ)":>14}')
+    for mode in background.MODES:
+        elapsed = timeit(background.background_stats, image_data, mode)
+        res = background.compare_with_exact(image_data, mode)
+        print(f'{mode:<8}{elapsed:>12.4f}{res["median"][mode]:>12.3f}{res["std"][mode]:>10.3f}'
+              f'{res["median"]["err_in_std"]:>16.2e}{res["std"]["err_in_std"]:>14.2e}')
+
+    background.background_stats(image_data, 'exact', key='frame')
+    elapsed = timeit(background.background_stats, image_data, 'exact', key='frame')
+    print(f'缓存命中耗时: {elapsed * 1e6:.1f} µs')
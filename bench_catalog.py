@@ -0,0 +1,73 @@
+import os
+import pickle
+import tempfile
+import time
+
+import numpy as np
+from astropy.table import Table
+
+import detections
+
+# 模拟逐帧检测结果：帧数、每帧检测数
+N_FRAMES = 300
+N_PER_FRAME = 2000
+# 模拟 find_star 的星点表大小
+N_SOURCES = 50000
+
+
+def dao_table(rng, n) -> Table:
+    # 与 DAOStarFinder 输出相同的列
+    return Table({
+        'id': np.arange(1, n + 1),
+        'xcentroid': rng.uniform(0, 2046, n), 'ycentroid': rng.uniform(0, 2033, n),
+        'sharpness': rng.uniform(0.2, 1, n), 'roundness1': rng.normal(0, 0.2, n),
+        'roundness2': rng.normal(0, 0.2, n), 'npix': np.full(n, 25),
+        'peak': rng.lognormal(4, 1, n), 'flux': rng.lognormal(6, 1, n), 'mag': rng.normal(-5, 1, n),
+        'daofind_mag': rng.normal(-5, 1, n),
+    })
+
+
+def dir_size(path) -> int:
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def timed(func):
+    t0 = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - t0
+
+
+def load_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    tables = [dao_table(rng, N_PER_FRAME) for _ in range(N_FRAMES)]
+    sources = dao_table(rng, N_SOURCES).as_array()
+    with tempfile.TemporaryDirectory() as folder:
+        pkl = os.path.join(folder, 'diff_sources.pkl')
+        with open(pkl, 'wb') as f:
+            pickle.dump(tables, f)
+        store = os.path.join(folder, 'detections')
+        detections.write_catalog(store, tables)
+
+        npy = os.path.join(folder, 'source_fixed.npy')
+        np.save(npy, sources)
+        src_store = os.path.join(folder, 'source_fixed')
+        detections.write_catalog(src_store, [sources])
+
+        print(f'{"数据":<20}{"格式":<10}{"大小(MB)":>10}{"加载(s)":>10}{"逐帧访问(s)":>14}')
+        old, t_load = timed(lambda: load_pickle(pkl))
+        _, t_frames = timed(lambda: [np.column_stack([t[c] for c in ('xcentroid', 'ycentroid', 'peak', 'flux')])
+                                     for t in old])
+        print(f'{"差分检测结果":<20}{"pickle":<10}{os.path.getsize(pkl) / 2**20:>10.1f}{t_load:>10.4f}{t_frames:>14.4f}')
+        cat, t_load = timed(lambda: detections.DetectionCatalog(store))
+        _, t_frames = timed(cat.frames)
+        print(f'{"差分检测结果":<20}{"列式":<10}{dir_size(store) / 2**20:>10.1f}{t_load:>10.4f}{t_frames:>14.4f}')
+
+        _, t_load = timed(lambda: np.load(npy, allow_pickle=True)['xcentroid'].sum())
+        print(f'{"星点表":<20}{"npy":<10}{os.path.getsize(npy) / 2**20:>10.1f}{t_load:>10.4f}{"-":>14}')
+        _, t_load = timed(lambda: detections.load_sources(src_store)['xcentroid'].sum())
+        print(f'{"星点表":<20}{"列式":<10}{dir_size(src_store) / 2**20:>10.1f}{t_load:>10.4f}{"-":>14}')
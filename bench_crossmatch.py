@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+from astropy.table import Table
+from astropy.wcs import WCS
+
+import gaia_catalog
+from bench_utils import make_standin_gaia, synthetic_header
+
+# 模拟参数：替代星表中的 Gaia 源数、需要匹配的星点数
+N_GAIA = 200000
+N_STARS = 20000
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_STARS
+    rng = np.random.default_rng(1)
+    header = synthetic_header(1437.0)
+    wcs = WCS(header)
+    with tempfile.TemporaryDirectory() as folder:
+        path, xy = make_standin_gaia(os.path.join(folder, 'gaia.ecsv'), header, N_GAIA)
+        cache_dir = os.path.join(folder, 'cache')
+        # 星点取替代星表中比星等上限亮的一部分源（FFI 上能找到的星），加 0.3 像素的位置误差
+        bright = np.flatnonzero(Table.read(path)['phot_g_mean_mag'] <= gaia_catalog.MAX_G_MAG)
+        pick = rng.choice(bright, n, replace=False)
+        ra, dec = wcs.all_pix2world(xy[pick, 0] + rng.normal(0, 0.3, n), xy[pick, 1] + rng.normal(0, 0.3, n), 0)
+        region = gaia_catalog.footprint(ra, dec)
+        print(f'天区: RA={region.ra:.3f} Dec={region.dec:.3f} 半径 {region.radius:.3f} 度 '
+              f'G <= {region.max_mag}，{n} 个星点')
+
+        t0 = time.perf_counter()
+        catalog = gaia_catalog.get_catalog(region, cache_dir, local_catalog=path)
+        print(f'{"导入替代星表并写入缓存":<24}{time.perf_counter() - t0:>10.3f} s  ({len(catalog)} 个源)')
+        t0 = time.perf_counter()
+        catalog = gaia_catalog.get_catalog(region, cache_dir)
+        print(f'{"从缓存读取（含建 KD 树）":<24}{time.perf_counter() - t0:>10.3f} s')
+        t0 = time.perf_counter()
+        result = catalog.crossmatch(ra, dec)
+        print(f'{"一次匹配全部星点":<24}{time.perf_counter() - t0:>10.3f} s')
+
+        # 与 astropy 的 match_to_catalog_sky 对比
+        t0 = time.perf_counter()
+        ref = SkyCoord(catalog.sources['ra'] * u.deg, catalog.sources['dec'] * u.deg)
+        idx, sep, _ = SkyCoord(ra * u.deg, dec * u.deg).match_to_catalog_sky(ref)
+        print(f'{"astropy match_to_catalog_sky":<24}{time.perf_counter() - t0:>10.3f} s')
+        same = np.mean(catalog.sources['source_id'][idx] == result['source_id'])
+        err = np.nanmax(np.abs(sep.arcsec - result['dist']))
+        truth = np.mean(result['source_id'] == Table.read(path)['source_id'][pick])
+        print(f'与 astropy 一致 {same:.2%}，距离误差 {err:.1e} 角秒，匹配到真实源 {truth:.2%}，'
+              f'有分类 {np.sum(result["best_class_name"] != "")} 个')
@@ -0,0 +1,54 @@
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+import detections
+import get_diffs
+from bench_utils import make_synthetic_fits
+
+# 模拟帧数和并行进程数
+N_FRAMES = 17
+WORKERS = (2, 4, os.cpu_count())
+TILES = (2, 2)
+
+
+def frames_per_second(func, n) -> float:
+    t0 = time.perf_counter()
+    func()
+    return n / (time.perf_counter() - t0)
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_FRAMES
+    with tempfile.TemporaryDirectory() as folder:
+        paths = make_synthetic_fits(folder, n, n_stars=2000, n_movers=50)
+        diffs, _ = get_diffs.get_diffs(paths)
+        print(f'{len(diffs)} 帧差分图像，CPU 核数 {os.cpu_count()}')
+
+        print(f'{"方式":<28}{"帧/秒":>10}')
+        print(f'{"串行":<28}{frames_per_second(lambda: get_diffs.get_diff_sources(diffs), len(diffs)):>10.2f}')
+        for w in sorted(set(w for w in WORKERS if w > 1)):
+            fps = frames_per_second(lambda: get_diffs.get_diff_sources(diffs, workers=w), len(diffs))
+            print(f'{f"按帧并行 workers={w}":<28}{fps:>10.2f}')
+            fps = frames_per_second(lambda: get_diffs.get_diff_sources(diffs, workers=w, tiles=TILES), len(diffs))
+            print(f'{f"单帧分块 {TILES} workers={w}":<28}{fps:>10.2f}')
+            fps = frames_per_second(lambda: get_diffs.stream_diff_sources(
+                paths, os.path.join(folder, 'store'), workers=w), len(diffs))
+            print(f'{f"流式按帧并行 workers={w}":<28}{fps:>10.2f}')
+
+        # 流式多进程（保留差分图像）与串行的检测结果和保存的差分相同
+        workers = max(max(WORKERS), 2)
+        for k, w in enumerate((1, workers)):
+            get_diffs.stream_diff_sources(paths, os.path.join(folder, f'check{k}'),
+                                          diffs_dir=os.path.join(folder, f'diffs{k}'), workers=w, chunksize=2)
+        serial, parallel = (detections.read_detections(os.path.join(folder, f'check{k}')) for k in (0, 1))
+        same = (all(np.array_equal(a, b) for a, b in zip(serial[0], parallel[0]))
+                and np.array_equal(serial[1], parallel[1]))
+        saved = [get_diffs.iter_saved_diffs(os.path.join(folder, f'diffs{k}')) for k in (0, 1)]
+        same_diffs = all(np.array_equal(a, b) for a, b in zip(*saved))
+        print(f'流式多进程与串行结果相同: 检测 {same}，差分图像 {same_diffs}')
@@ -0,0 +1,63 @@
+import numpy as np
+from scipy.ndimage import median_filter
+
+import background
+import filtering
+import photometry
+from bench_utils import timeit
+
+# 去边框后的 FFI 尺寸
+SHAPE = (2033, 2046)
+STAR_COUNTS = (200, 2000, 20000)
+BKG_MODE = 'fast'
+
+
+def measure(image_data, apertures, mode, regions=None):
+    # 与 light_curves.measure_frame 相同的滤波、背景估计和测光
+    filtered, stats_data = filtering.filter_frame(image_data, mode, regions, BKG_MODE)
+    mean, median, std = background.background_stats(stats_data, BKG_MODE, sigma=3.0)
+    return photometry.aperture_photometry(filtered, apertures, median)
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    image_data = rng.normal(200, 5, SHAPE).astype(np.float32)
+    # 加一些热像素，中值滤波的结果才有区别
+    hot = rng.integers(0, image_data.size, 20000)
+    image_data.ravel()[hot] += 1000
+
+    full = median_filter(image_data, size=3)
+    t_full = timeit(median_filter, image_data, size=3)
+    t_tiled = timeit(filtering.tiled_median_filter, image_data)
+    print(f'整帧滤波 {t_full:.3f} s，分块线程池 {t_tiled:.3f} s，'
+          f'结果相同: {np.array_equal(full, filtering.tiled_median_filter(image_data))}')
+    step = background.sample_step(SHAPE)
+    print(f'抽样点滤波与整帧滤波后抽样相同: '
+          f'{np.array_equal(filtering.sampled_median_filter(image_data, step), full[::step, ::step])}')
+
+    print(f'\n{"星点数":>8}{"区域数":>8}{"覆盖比例":>10}{"full(s)":>10}{"sparse(s)":>11}{"加速比":>8}{"光度相同":>10}')
+    for n in STAR_COUNTS:
+        xs = rng.uniform(0, SHAPE[1], n)
+        ys = rng.uniform(0, SHAPE[0], n)
+        apertures = photometry.box_apertures(xs, ys, SHAPE, 5)
+        regions = filtering.aperture_regions(apertures, SHAPE)
+        covered = sum((y1 - y0) * (x1 - x0) for y0, y1, x0, x1 in regions or []) / image_data.size
+        t_dense = timeit(measure, image_data, apertures, 'full')
+        t_sparse = timeit(measure, image_data, apertures, 'sparse', regions)
+        same = np.array_equal(measure(image_data, apertures, 'full'),
+                              measure(image_data, apertures, 'sparse', regions))
+        print(f'{n:>8}{len(regions or []):>8}{covered:>10.1%}{t_dense:>10.3f}{t_sparse:>11.3f}'
+              f'{t_dense / t_sparse:>8.1f}{str(same):>10}')
+
+    # 圆孔径（带背景环）贴着帧边缘和角落：窗口中权重为 0 的像素也会被取出，sparse 的输出缓冲区预先填满 nan
+    xs = np.concatenate([rng.uniform(0, SHAPE[1], 500), [0.2, 1.5, SHAPE[1] - 1.2, 2.0, SHAPE[1] - 0.6]])
+    ys = np.concatenate([rng.uniform(0, SHAPE[0], 500), [0.3, SHAPE[0] - 1.4, 1.0, SHAPE[0] - 0.5, SHAPE[0] - 2.5]])
+    for annulus in (None, (6.0, 9.0)):
+        apertures = photometry.circular_apertures(xs, ys, SHAPE, 3.0, annulus=annulus)
+        regions = filtering.aperture_regions(apertures, SHAPE)
+        sparse = filtering.sparse_median_filter(image_data, regions, out=np.full(SHAPE, np.nan, np.float32))
+        flux_full = photometry.aperture_photometry(full, apertures, 200.0)
+        flux_sparse = photometry.aperture_photometry(sparse, apertures, 200.0)
+        same = np.array_equal(flux_full, flux_sparse) and np.array_equal(
+            measure(image_data, apertures, 'full'), measure(image_data, apertures, 'sparse', regions))
+        print(f'边缘圆孔径（背景环 {annulus}）: sparse 光度全部有限 {np.isfinite(flux_sparse).all()}，与 full 相同 {same}')
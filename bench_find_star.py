@@ -0,0 +1,93 @@
+import time
+
+import numpy as np
+from photutils.detection import DAOStarFinder
+
+import background
+import file_utils
+from bench_utils import FFI_SHAPE, synthetic_frame, run_isolated
+from find_star import Variant, find_star_variants, clip_variants
+
+N_STARS = 8000
+BKG_MODE = 'fast'
+SHARPNESS = 0.3
+ROUNDNESS = 0.5
+NAMES = ('origin', 'fixed', 'percentile', 'statistics')
+# 同一种裁剪下比较多个阈值（共用一次找峰）
+SWEEP = (3.0, 5.0, 8.0)
+
+
+def _old_find_star(image_data, fwhm=3.0, threshold_factor=5.0, bkg_mode='exact', key=None):
+    # 改动前的 find_star：每次重新统计背景、构造 DAOStarFinder 并对整幅图像卷积
+    mean, median, std = background.background_stats(image_data, bkg_mode, key=key)
+    return DAOStarFinder(fwhm=fwhm, threshold=threshold_factor * std)(image_data - median)
+
+
+def old_pass(image_data):
+    background.clear_cache()
+    t0 = time.perf_counter()
+    clipped = file_utils.clip_image_data(image_data, bkg_mode=BKG_MODE, key='frame')
+    sources = [_old_find_star(image_data, bkg_mode=BKG_MODE, key='frame')]
+    sources += [_old_find_star(c, bkg_mode=BKG_MODE) for c in clipped]
+    sources = [s[(s['sharpness'] > SHARPNESS) & (np.abs(s['roundness1']) < ROUNDNESS)] for s in sources]
+    return dict(zip(NAMES, sources)), time.perf_counter() - t0
+
+
+def new_pass(image_data):
+    background.clear_cache()
+    t0 = time.perf_counter()
+    sources = find_star_variants(image_data, clip_variants(image_data, bkg_mode=BKG_MODE, key='frame'),
+                                 bkg_mode=BKG_MODE, key='frame',
+                                 sharpness_min=SHARPNESS, roundness_max=ROUNDNESS)
+    return sources, time.perf_counter() - t0
+
+
+def old_sweep(image_data):
+    background.clear_cache()
+    t0 = time.perf_counter()
+    sources = {f'{k:g}': _old_find_star(image_data, threshold_factor=k, bkg_mode=BKG_MODE, key='frame')
+               for k in SWEEP}
+    return sources, time.perf_counter() - t0
+
+
+def new_sweep(image_data):
+    background.clear_cache()
+    t0 = time.perf_counter()
+    sources = find_star_variants(image_data, [Variant(f'{k:g}', None, k) for k in SWEEP],
+                                 bkg_mode=BKG_MODE, key='frame')
+    return sources, time.perf_counter() - t0
+
+
+def compare(a, b) -> str:
+    # 按位置排序后逐列比较两张星表
+    if len(a) != len(b):
+        return f'{len(a):>7}{len(b):>7}{"数量不同":>14}'
+    a = a[np.lexsort((a['xcentroid'], a['ycentroid']))]
+    b = b[np.lexsort((b['xcentroid'], b['ycentroid']))]
+    diff = max(float(np.max(np.abs(a[c] - b[c]) / np.maximum(np.abs(a[c]), 1e-12)))
+               for c in ('xcentroid', 'ycentroid', 'sharpness', 'roundness1', 'roundness2', 'peak', 'flux'))
+    return f'{len(a):>7}{len(b):>7}{diff:>14.1e}'
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    xs = rng.uniform(0, FFI_SHAPE[1], N_STARS)
+    ys = rng.uniform(0, FFI_SHAPE[0], N_STARS)
+    image_data = synthetic_frame(rng, xs, ys, rng.lognormal(8, 1, N_STARS))[file_utils.CROP]
+
+    (old, old_time), _, old_rss = run_isolated(old_pass, image_data)
+    (new, new_time), _, new_rss = run_isolated(new_pass, image_data)
+
+    print(f'{"方案":<10}{"耗时(s)":>10}{"峰值RSS(MB)":>14}')
+    print(f'{"逐个找星":<10}{old_time:>10.2f}{old_rss:>14.0f}')
+    print(f'{"一次找星":<10}{new_time:>10.2f}{new_rss:>14.0f}')
+    print(f'加速 {old_time / new_time:.1f} 倍')
+    print(f'{"设置":<12}{"原":>7}{"新":>7}{"最大相对差":>14}')
+    for name in NAMES:
+        print(f'{name:<12}{compare(old[name], new[name])}')
+
+    (old, old_time), _, _ = run_isolated(old_sweep, image_data)
+    (new, new_time), _, _ = run_isolated(new_sweep, image_data)
+    print(f'原始图像阈值 {SWEEP}：逐个找星 {old_time:.2f} s，共用找峰 {new_time:.2f} s，加速 {old_time / new_time:.1f} 倍')
+    for name in old:
+        print(f'{name:<12}{compare(old[name], new[name])}')
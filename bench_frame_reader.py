@@ -0,0 +1,83 @@
+import sys
+import tempfile
+
+import numpy as np
+from astropy.io import fits
+
+import file_utils
+import get_diffs
+from bench_utils import make_synthetic_fits, run_isolated
+
+# 模拟帧数量，可通过命令行参数修改
+N_FRAMES = 30
+# 模拟测光时每帧读取的星点数和星点盒子大小
+N_STAMPS = 2000
+BOX = 5
+
+
+def legacy_read_image_data(path):
+    # 旧实现：读取完整头信息
+    with fits.open(path) as hdulist:
+        return hdulist[1].data[0:-45, 45:-45], hdulist[1].header
+
+
+def legacy_get_diffs(paths):
+    # 旧实现：不关闭文件、保留所有帧后再做差分
+    diffs, images, times = [], [], []
+    for file in paths:
+        hdu = fits.open(file)[1]
+        images.append(hdu.data)
+        times.append(hdu.header['TSTART'])
+    for i in range(len(images) - 1):
+        diffs.append(images[i + 1] - images[i])
+    return len(diffs), len(times)
+
+
+def stamp_pass(reader, paths):
+    # 每帧取 TSTART，并在固定位置读取 N_STAMPS 个小盒子（模拟测光的访问模式）
+    rng = np.random.default_rng(1)
+    total = 0.0
+    for path in paths:
+        image_data, header = reader(path)
+        _ = header['TSTART']
+        ys = rng.integers(0, image_data.shape[0] - BOX, N_STAMPS)
+        xs = rng.integers(0, image_data.shape[1] - BOX, N_STAMPS)
+        for x, y in zip(xs, ys):
+            total += float(image_data[y:y + BOX, x:x + BOX].sum())
+    return total
+
+
+def full_pass(reader, paths):
+    # 每帧读取全部像素
+    return sum(float(reader(path)[0].sum(dtype=np.float64)) for path in paths)
+
+
+def header_pass(reader, paths):
+    return [reader(path)[1]['TSTART'] for path in paths]
+
+
+def new_get_diffs(paths):
+    diffs, times = get_diffs.get_diffs(paths)
+    return len(diffs), len(times)
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_FRAMES
+    with tempfile.TemporaryDirectory() as folder:
+        paths = make_synthetic_fits(folder, n, n_stars=200)
+        print(f'生成 {len(paths)} 个模拟 FFI')
+
+        cases = [
+            ('只读头信息', header_pass),
+            ('稀疏小盒子读取', stamp_pass),
+            ('整帧读取', full_pass),
+        ]
+        print(f'{"场景":<12}{"实现":<18}{"耗时(s)":>10}{"峰值RSS(MB)":>14}')
+        for name, func in cases:
+            for label, reader in (('read_image_data旧', legacy_read_image_data),
+                                  ('read_frame', file_utils.read_frame)):
+                _, elapsed, rss = run_isolated(func, reader, paths)
+                print(f'{name:<12}{label:<18}{elapsed:>10.3f}{rss:>14.1f}')
+        for label, func in (('get_diffs旧', legacy_get_diffs), ('get_diffs', new_get_diffs)):
+            _, elapsed, rss = run_isolated(func, paths)
+            print(f'{"差分":<12}{label:<18}{elapsed:>10.3f}{rss:>14.1f}')
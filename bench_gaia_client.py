@@ -0,0 +1,113 @@
+import io
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from astropy.io.votable import from_table, writeto
+from astropy.table import Table
+
+import gaia_client
+
+# 模拟参数：查询的 source_id 数、其中有分类结果的比例、每次请求的延迟（秒）、请求失败率
+N_IDS = 2000
+CLASS_FRACTION = 0.1
+LATENCY = 0.05
+FAILURE_RATE = 0.2
+# 模拟时用较小的批次，以便观察并发和重试
+BATCH_SIZE = 100
+
+
+def mock_tap_server(table: Table, latency: float = LATENCY, failure_rate: float = FAILURE_RATE, seed: int = 0):
+    """
+    本地模拟 TAP 服务：解析 /sync 请求中的 source_id IN (...)，返回 table 中对应行的 VOTable
+    按 failure_rate 随机返回 HTTP 500，用于测试重试
+    :return: (服务器, TAP 地址)
+    """
+    rng = np.random.default_rng(seed)
+    lock = threading.Lock()
+    index = {int(s): k for k, s in enumerate(table['source_id'])}
+    stats = {'requests': 0, 'failures': 0, 'active': 0, 'max_active': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+            query = urllib.parse.parse_qs(body)['QUERY'][0]
+            with lock:
+                stats['requests'] += 1
+                stats['active'] += 1
+                stats['max_active'] = max(stats['max_active'], stats['active'])
+                fail = rng.random() < failure_rate
+            time.sleep(latency)
+            with lock:
+                stats['active'] -= 1
+            if fail:
+                with lock:
+                    stats['failures'] += 1
+                self.send_error(500, 'mock failure')
+                return
+            ids = re.search(r'IN\s*\(([^)]*)\)', query).group(1)
+            rows = [index[int(s)] for s in ids.split(',') if int(s) in index]
+            buf = io.BytesIO()
+            writeto(from_table(table[rows]), buf)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/xml')
+            self.end_headers()
+            self.wfile.write(buf.getvalue())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.stats = stats
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/tap'
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_IDS
+    rng = np.random.default_rng(0)
+    source_ids = rng.choice(2 ** 60, n, replace=False).astype(np.int64)
+    classified = source_ids[rng.random(n) < CLASS_FRACTION]
+    table = Table({'source_id': classified, 'best_class_name': np.full(len(classified), 'RS'),
+                   'best_class_score': rng.uniform(0.3, 1, len(classified)),
+                   'classifier_name': np.full(len(classified), 'nTransits:2+')})
+    # 重试的警告信息太长，只显示错误
+    logging.getLogger('gaia_client').setLevel(logging.ERROR)
+    server, url = mock_tap_server(table)
+    run = gaia_client.tap_runner(url)
+
+    with tempfile.TemporaryDirectory() as folder:
+        state, results = os.path.join(folder, 'state.i64'), os.path.join(folder, 'classes.csv')
+        print(f'{n} 个 source_id，{len(classified)} 个有分类，延迟 {LATENCY}s，失败率 {FAILURE_RATE:.0%}')
+
+        # 原来的方式：每个 source_id 一次查询，逐个等待（只跑一部分，按比例估算）
+        m = min(n, 200)
+        t0 = time.perf_counter()
+        for sid in source_ids[:m]:
+            while True:
+                try:
+                    run(gaia_client.CLASSIFY_QUERY.format(ids=sid))
+                    break
+                except Exception:
+                    pass
+        print(f'{"逐个查询（估算）":<20}{(time.perf_counter() - t0) * n / m:>10.2f} s')
+
+        # 先中断一次：只查询前一半，再重新运行，只查询剩下的部分
+        server.stats.update(requests=0, failures=0, max_active=0)
+        t0 = time.perf_counter()
+        gaia_client.query_source_ids(source_ids[:n // 2], state, results, run=run, batch_size=BATCH_SIZE, backoff=0.05)
+        df = gaia_client.query_source_ids(source_ids, state, results, run=run, batch_size=BATCH_SIZE, backoff=0.05)
+        elapsed = time.perf_counter() - t0
+        print(f'{"批量并发查询":<20}{elapsed:>10.2f} s  请求 {server.stats["requests"]} 次，'
+              f'失败重试 {server.stats["failures"]} 次，最大并发 {server.stats["max_active"]}')
+        done = np.fromfile(state, dtype=np.int64)
+        print(f'状态文件 {os.path.getsize(state)} 字节，记录 {len(np.unique(done))} 个 source_id；'
+              f'结果 {len(df)} 行，与模拟星表一致: {set(df["source_id"]) == set(classified.tolist())}')
+    server.shutdown()
@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from astropy.table import Table
+
+import light_curves
+import periodogram
+from bench_utils import make_synthetic_fits
+
+# 模拟参数：先下载的帧数、之后新到的帧数、星数、模拟图像尺寸
+N_FIRST = 30
+N_NEW = 10
+N_STARS = 2000
+SHAPE = (1024, 1024)
+
+
+def timed(func):
+    t0 = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    n_first = int(sys.argv[1]) if len(sys.argv) > 1 else N_FIRST
+    with tempfile.TemporaryDirectory() as folder:
+        paths = make_synthetic_fits(os.path.join(folder, 'data'), n_first + N_NEW, SHAPE, N_STARS)
+        rng = np.random.default_rng(0)
+        source = Table({'xcentroid': rng.uniform(10, SHAPE[1] - 100, N_STARS),
+                        'ycentroid': rng.uniform(10, SHAPE[0] - 60, N_STARS)})
+        store_dir = os.path.join(folder, 'store')
+        cache = os.path.join(folder, 'periodogram_cache.npz')
+
+        print(f'{"步骤":<28}{"新帧":>6}{"光变曲线(s)":>14}{"周期图(s)":>12}{"重新计算的星":>14}')
+        for label, available in (('首次运行', paths[:n_first]), (f'新到 {N_NEW} 帧', paths),
+                                 ('没有新数据', paths)):
+            (n_new, store), t_lc = timed(lambda: light_curves.update_light_curves(available, source, store_dir))
+            fs, ts = store.read()
+            (_, changed), t_ls = timed(lambda: periodogram.cached_lomb_scargle(ts, fs, cache))
+            print(f'{label:<28}{n_new:>6}{t_lc:>14.3f}{t_ls:>12.3f}{changed.sum():>14}')
+
+        # 与一次性全量提取比较
+        full, times = light_curves.get_light_curve(paths, source)
+        print(f'增量结果与全量提取一致: {np.array_equal(fs, full) and np.array_equal(ts, times)}')
@@ -0,0 +1,99 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from astropy.io import fits
+
+import inventory
+from bench_utils import FFI_SHAPE, synthetic_header
+
+N_FILES = 2000
+# 旧做法（打开整个文件）只跑一部分文件，按比例估算
+N_OLD = 50
+
+
+def image_header(header: fits.Header, shape: tuple) -> bytes:
+    hdu = fits.ImageHDU(header=header)
+    hdu.header['BITPIX'] = -32
+    hdu.header['NAXIS'] = 2
+    hdu.header['NAXIS1'] = shape[1]
+    hdu.header['NAXIS2'] = shape[0]
+    return hdu.header.tostring().encode()
+
+
+def make_sparse_ffis(folder: str, n_files: int, shape: tuple = FFI_SHAPE) -> list:
+    """
+    生成与真实 FFI 大小相同的文件（主 HDU + 校准图像 + 不确定度），像素部分是稀疏文件的空洞，不占磁盘
+    文件名与 TESS 相同，每 100 帧有一帧带动量卸载标记
+    """
+    primary = fits.PrimaryHDU().header.tostring().encode()
+    data_size = -(-shape[0] * shape[1] * 4 // inventory.BLOCK) * inventory.BLOCK
+    paths = []
+    for k in range(n_files):
+        hdr = synthetic_header(1437.0 + k / 48, shape=shape, quality=32 if k % 100 == 0 else 0)
+        path = os.path.join(folder, f'tess{2018319112938 + k * 3000}-s0005-1-4-0125-s_ffic.fits')
+        with open(path, 'wb') as f:
+            f.write(primary)
+            f.write(image_header(hdr, shape))
+            f.seek(data_size, os.SEEK_CUR)
+            f.write(image_header(fits.Header(), shape))
+            f.truncate(f.tell() + data_size)
+        paths.append(path)
+    return paths
+
+
+def open_full(paths: list) -> list:
+    # 原来 read_fits_shape 的做法：打开文件并访问每个 HDU 的数据
+    shapes = []
+    for path in paths:
+        with fits.open(path) as hdul:
+            shapes.append([hdu.data.shape if hdu.data is not None else None for hdu in hdul])
+    return shapes
+
+
+def astropy_headers(paths: list) -> list:
+    return [fits.getheader(path, 1) for path in paths]
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_FILES
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = os.path.join(tmp, 'data')
+        os.makedirs(folder)
+        paths = make_sparse_ffis(folder, n)
+        index_path = os.path.join(tmp, 'inventory.npy')
+        print(f'{n} 个 FFI 文件（每个 {os.path.getsize(paths[0]) / 2 ** 20:.1f} MB）')
+        print(f'{"方式":<28}{"耗时(s)":>10}{"文件/秒":>12}')
+
+        for name, func in (('打开文件读取数据（估算）', open_full), ('astropy 逐个读头信息（估算）', astropy_headers)):
+            t0 = time.perf_counter()
+            func(paths[:N_OLD])
+            elapsed = (time.perf_counter() - t0) * n / N_OLD
+            print(f'{name:<28}{elapsed:>10.2f}{n / elapsed:>12.0f}')
+
+        t0 = time.perf_counter()
+        inv = inventory.scan(folder, index_path)
+        elapsed = time.perf_counter() - t0
+        print(f'{"清单首次扫描":<28}{elapsed:>10.2f}{n / elapsed:>12.0f}')
+        t0 = time.perf_counter()
+        again = inventory.scan(folder, index_path)
+        print(f'{"清单重新扫描（无变化）":<28}{time.perf_counter() - t0:>10.3f}')
+        for path in paths[:10]:
+            os.utime(path)
+        t0 = time.perf_counter()
+        inventory.scan(folder, index_path)
+        print(f'{"清单重新扫描（10 个文件变化）":<28}{time.perf_counter() - t0:>10.3f}')
+
+        headers = astropy_headers(paths[:N_OLD])
+        same = all(row['tstart'] == h['TSTART'] and row['quality'] == h['DQUALITY']
+                   and (row['height'], row['width']) == (h['NAXIS2'], h['NAXIS1'])
+                   for row, h in zip(inv[:N_OLD], headers))
+        print(f'与 astropy 解析的头信息一致: {same}，重新扫描结果相同: {np.array_equal(inv, again)}，'
+              f'清单文件 {os.path.getsize(index_path) / 1024:.0f} KB')
+        print(f'扇区 {set(inv["sector"].tolist())}，相机 {set(inv["camera"].tolist())}，'
+              f'CCD {set(inv["ccd"].tolist())}，带质量标记 {np.sum(inv["quality"] != 0)} 帧')
+        t0 = time.perf_counter()
+        keep = inventory.query(inv, tmin=1440.0, tmax=1450.0, bitmask=32, skip=25)
+        print(f'按时间和质量选出 {keep.sum()} 帧，查询 {(time.perf_counter() - t0) * 1e3:.2f} ms')
@@ -0,0 +1,48 @@
+import numpy as np
+
+import photometry
+from bench_utils import timeit
+
+# 去边框后的 FFI 尺寸
+SHAPE = (2033, 2046)
+STAR_COUNTS = (1000, 10000, 50000)
+BOX = 5
+
+
+def legacy_photometry(image_data, xs, ys, median, box_size=BOX):
+    # 原 get_light_curve 中逐星循环的实现
+    fluxes = []
+    half = box_size // 2
+    for x, y in zip(xs, ys):
+        sub_image = image_data[int(y - half):int(y + half + 1), int(x - half):int(x + half + 1)]
+        fluxes.append(np.sum(sub_image - median))
+    return np.array(fluxes)
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    image_data = rng.normal(200, 5, SHAPE).astype(np.float32)
+    median = float(np.median(image_data))
+
+    print(f'{"星点数":>8}{"逐星循环(s)":>14}{"方形孔径(s)":>14}{"圆孔径+背景环(s)":>18}{"加速比":>8}{"最大误差":>12}')
+    for n in STAR_COUNTS:
+        xs = rng.uniform(10, SHAPE[1] - 10, n)
+        ys = rng.uniform(10, SHAPE[0] - 10, n)
+        box = photometry.box_apertures(xs, ys, SHAPE, BOX)
+        circ = photometry.circular_apertures(xs, ys, SHAPE, radius=2.5, annulus=(5, 8))
+
+        t_legacy = timeit(legacy_photometry, image_data, xs, ys, median, repeat=1)
+        t_box = timeit(photometry.aperture_photometry, image_data, box, median)
+        t_circ = timeit(photometry.aperture_photometry, image_data, circ)
+        err = np.max(np.abs(legacy_photometry(image_data, xs, ys, median)
+                            - photometry.aperture_photometry(image_data, box, median)))
+        print(f'{n:>8}{t_legacy:>14.4f}{t_box:>14.4f}{t_circ:>18.4f}{t_legacy / t_box:>8.1f}{err:>12.2e}')
+
+    # 偶数边长时原切片覆盖 2 * (box_size // 2) + 1 个像素
+    xs = rng.uniform(10, SHAPE[1] - 10, 2000)
+    ys = rng.uniform(10, SHAPE[0] - 10, 2000)
+    for size in (3, 4, 6):
+        err = np.max(np.abs(legacy_photometry(image_data, xs, ys, median, size)
+                            - photometry.aperture_photometry(image_data, photometry.box_apertures(xs, ys, SHAPE, size),
+                                                             median)))
+        print(f'box_size={size} 与逐星循环的最大误差 {err:.2e}')
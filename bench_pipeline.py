@@ -0,0 +1,53 @@
+import copy
+import os
+import tempfile
+import time
+import warnings
+
+import pipeline
+from bench_utils import make_synthetic_fits
+from stage_cache import StageCache
+
+# 模拟数据：帧数和图像尺寸
+N_FRAMES = 16
+SHAPE = (512, 512)
+
+
+def run(label, paths, params, cache):
+    t0 = time.perf_counter()
+    stages = pipeline.run_pipeline(paths, params, cache)
+    elapsed = time.perf_counter() - t0
+    missed = [name for name, stage in stages.items() if not stage.hit]
+    print(f'{label:<28}{elapsed:>8.2f} s  重新计算: {", ".join(missed) or "无"}')
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    params = copy.deepcopy(pipeline.PARAMS)
+    params['find_star']['frame'] = 5
+    params['light_curves']['skip'] = 2
+    params['diff_sources']['skip'] = 2
+    params['tracks']['min_length'] = 5
+    with tempfile.TemporaryDirectory() as folder:
+        paths = make_synthetic_fits(os.path.join(folder, 'data'), N_FRAMES, SHAPE, n_stars=300, n_movers=5)
+        cache = StageCache(os.path.join(folder, 'cache'))
+        run('首次运行', paths, params, cache)
+        run('参数不变', paths, params, cache)
+        params['light_curves']['box_size'] = 7
+        run('改 box_size', paths, params, cache)
+        params['periodogram']['max_period'] = 2.0
+        run('改周期范围', paths, params, cache)
+        params['tracks']['min_speed'] = 0.5
+        run('改轨迹最小速度', paths, params, cache)
+        params['find_star']['threshold_factor'] = 8.0
+        run('改找星阈值', paths, params, cache)
+        os.utime(paths[-1])
+        run('最后一帧被重新下载', paths, params, cache)
+
+        # 磁盘预算：只保留最近使用的条目
+        entries = cache.entries()
+        total = sum(size for _, size, _ in entries)
+        small = StageCache(cache.cache_dir, budget=total // 2)
+        removed = small.evict()
+        print(f'缓存 {len(entries)} 个条目 {total / 2 ** 20:.1f} MB，预算减半后淘汰 {len(removed)} 个，'
+              f'剩余 {sum(s for _, s, _ in small.entries()) / 2 ** 20:.1f} MB')
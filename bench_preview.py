@@ -0,0 +1,86 @@
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import file_utils
+import preview
+from bench_utils import make_synthetic_fits
+
+N_FRAMES = 10
+
+
+def render(images: list, hists: list) -> int:
+    # 与 ImageDisplay 相同的 2x3 图，画到内存中的 png
+    fig = Figure(figsize=(12, 6))
+    FigureCanvasAgg(fig)
+    for k, (img, vmin, vmax) in enumerate(images):
+        fig.add_subplot(2, 3, k + 1).imshow(img, vmin=vmin, vmax=vmax)
+    for k, hist in enumerate(hists):
+        ax = fig.add_subplot(2, 3, k + 4)
+        if isinstance(hist, tuple):
+            ax.stairs(*hist, fill=True)
+        else:
+            ax.hist(hist, bins=100)
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=50)
+    return buf.tell()
+
+
+def legacy_quick_look(path: str) -> int:
+    # 原来的 ImageDisplay：读取整帧，三种裁剪各复制一份，plt.hist 遍历所有像素
+    image_data, _ = file_utils.read_image_data(path)
+    clipped = file_utils.clip_image_data(image_data)
+    return render([(c, None, None) for c in clipped], [c.flatten() for c in clipped])
+
+
+def preview_quick_look(path: str, cache_dir: str) -> int:
+    p = preview.get(path, factors=(4,), cache_dir=cache_dir)
+    img = p.levels[4]
+    return render([(np.clip(img, *p.limits[m]), *p.limits[m]) for m in preview.CLIP_MODES],
+                  [p.histograms[m] for m in preview.CLIP_MODES])
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_FRAMES
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_synthetic_fits(os.path.join(tmp, 'data'), n)
+        cache_dir = os.path.join(tmp, 'preview')
+        print(f'{n} 帧，每帧 {file_utils.read_image_data(paths[0])[0].shape}')
+        print(f'{"方式":<24}{"每帧耗时(s)":>12}')
+
+        t0 = time.perf_counter()
+        for path in paths:
+            legacy_quick_look(path)
+        print(f'{"原 ImageDisplay":<24}{(time.perf_counter() - t0) / n:>12.3f}')
+        t0 = time.perf_counter()
+        preview.prepare(paths, workers=0, cache_dir=cache_dir)
+        print(f'{"计算并保存预览（一次）":<24}{(time.perf_counter() - t0) / n:>12.3f}')
+        t0 = time.perf_counter()
+        for path in paths:
+            preview.get(path, factors=(4,), cache_dir=cache_dir)
+        print(f'{"读取缓存的预览":<24}{(time.perf_counter() - t0) / n:>12.4f}')
+        t0 = time.perf_counter()
+        for path in paths:
+            preview_quick_look(path, cache_dir)
+        print(f'{"预览快速查看（含绘图）":<24}{(time.perf_counter() - t0) / n:>12.3f}')
+
+        # 与整帧计算的结果比较
+        image_data, _ = file_utils.read_image_data(paths[0])
+        p = preview.get(paths[0], cache_dir=cache_dir)
+        limits = file_utils.clip_limits(image_data)
+        same_limits = all(np.allclose(p.limits[m], limits[m]) for m in preview.CLIP_MODES)
+        diff = max(np.abs(p.histograms[m][0] - np.histogram(np.clip(image_data, *p.limits[m]), preview.HIST_BINS,
+                                                            p.limits[m])[0]).sum() for m in preview.CLIP_MODES)
+        q = np.percentile(image_data, [0.5, 5, 50, 95, 99.5])
+        q_preview = np.interp([0.5, 5, 50, 95, 99.5], preview.QUANTILES, p.quantiles)
+        size = sum(os.path.getsize(os.path.join(cache_dir, f)) for f in os.listdir(cache_dir)) / n
+        print(f'裁剪上下限一致: {same_limits}，直方图与 np.histogram 相差最多 {diff} 个像素，'
+              f'分位数最大相对误差 {np.max(np.abs(q_preview / q - 1)):.1e}')
+        print(f'每帧预览 {size / 2 ** 20:.2f} MB（整帧 {image_data.nbytes / 2 ** 20:.1f} MB），'
+              f'金字塔 {[level.shape for level in p.levels.values()]}')
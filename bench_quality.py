@@ -0,0 +1,73 @@
+import time
+
+import numpy as np
+
+import periodogram
+import quality
+from bench_periodogram import N_EPOCHS, MIN_PERIOD, MAX_PERIOD
+
+N_STARS = 20000
+# 头信息标记的坏帧（动量卸载，光度明显偏低）和没有标记、只能从共模发现的坏帧
+FLAGGED = (40, 300, 301, 700, 1100)
+UNFLAGGED = (121, 500, 880, 1010)
+# 与 astropy 比较周期的星数
+N_CHECK = 2000
+
+
+def synthetic_sector(n_stars: int, seed: int = 0) -> tuple:
+    # 一半的星带正弦变化，所有星有缓慢的共同趋势（散射光），坏帧上所有星同时偏离
+    rng = np.random.default_rng(seed)
+    t = 1437 + np.arange(N_EPOCHS) / 48
+    period = rng.uniform(0.1, 4, (n_stars, 1))
+    amp = 0.05 * (rng.random((n_stars, 1)) < 0.5)
+    level = rng.uniform(500, 5000, (n_stars, 1))
+    trend = 0.01 * np.sin(2 * np.pi * (t - t[0]) / 13.7)
+    fs = level * (1 + trend + amp * np.sin(2 * np.pi * t / period)) + rng.normal(0, 10, (n_stars, N_EPOCHS))
+    flags = np.zeros(N_EPOCHS, dtype=np.int64)
+    flags[list(FLAGGED)] = 32
+    fs[:, list(FLAGGED)] *= 0.9
+    fs[:, list(UNFLAGGED)] *= 1.03
+    return t, fs.astype(np.float32), flags, period[:, 0], amp[:, 0] > 0
+
+
+def per_star_repair(fs: np.ndarray, t: np.ndarray, bad: np.ndarray) -> np.ndarray:
+    # 对照：逐颗星插值
+    fs = [list(f) for f in fs]
+    good = np.flatnonzero(~bad)
+    for f in fs:
+        f = np.asarray(f)
+        f[bad] = np.interp(t[bad], t[good], f[good])
+    return fs
+
+
+if __name__ == '__main__':
+    t, fs, flags, true_period, variable = synthetic_sector(N_STARS)
+    raw = fs.copy()
+
+    t0 = time.perf_counter()
+    bad, reasons = quality.flag_epochs(fs, flags)
+    t_flag = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    expected = np.array([np.interp(t[bad], t[~bad], f[~bad]) for f in fs[:200]])
+    quality.repair_epochs(fs, t, bad)
+    t_repair = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    per_star_repair(raw[:2000], t, bad)
+    t_loop = (time.perf_counter() - t0) * N_STARS / 2000
+
+    injected = np.zeros(N_EPOCHS, dtype=bool)
+    injected[list(FLAGGED + UNFLAGGED)] = True
+    print(f'{N_STARS} 颗星 x {N_EPOCHS} 个历元，注入 {len(FLAGGED)} 个有质量标记、{len(UNFLAGGED)} 个没有标记的坏帧')
+    for name, n in reasons.items():
+        print(f'  {name}: {n} 个历元')
+    print(f'找到 {bad.sum()} 个坏历元，注入的坏帧找回 {np.sum(bad & injected)} / {injected.sum()}，'
+          f'误判 {np.sum(bad & ~injected)}')
+    print(f'标记 {t_flag:.2f} s，整个矩阵插值 {t_repair:.2f} s，逐颗星插值（估算）{t_loop:.2f} s，'
+          f'与 np.interp 一致: {np.allclose(fs[:200][:, bad], expected, rtol=1e-6)}')
+
+    # 坏帧对周期图的影响：变星的最佳周期与真实周期相差不到 1% 的比例
+    rows = np.flatnonzero(variable)[:N_CHECK]
+    for name, f, tt in (('原始光度', raw[rows], t), ('去掉坏历元', fs[rows][:, ~bad], t[~bad])):
+        result = periodogram.batch_lomb_scargle(tt, f, MIN_PERIOD, MAX_PERIOD)
+        right = np.abs(1 / result.best_frequency / true_period[rows] - 1) < 0.01
+        print(f'{name:<10}变星周期正确 {right.mean():.1%}')
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+import file_utils
+import reference
+from bench_utils import FFI_SHAPE, make_synthetic_fits, run_isolated
+from find_star import Variant, find_star_variants
+
+N_FRAMES = 30
+N_STARS = 8000
+VARIANT = Variant('origin', None, 5.0)
+CUTS = dict(sharpness_min=0.3, roundness_max=0.5)
+
+
+def truth_positions(seed: int = 0) -> np.ndarray:
+    # 与 make_synthetic_fits 相同的随机数顺序，得到真实的星点位置（去边框后的坐标）
+    rng = np.random.default_rng(seed)
+    xs = rng.uniform(0, FFI_SHAPE[1], N_STARS)
+    ys = rng.uniform(0, FFI_SHAPE[0], N_STARS)
+    h, w = FFI_SHAPE[0] - 45, FFI_SHAPE[1] - 90
+    xy = np.column_stack([xs - 45, ys])
+    return xy[(xy[:, 0] > 3) & (xy[:, 0] < w - 3) & (xy[:, 1] > 3) & (xy[:, 1] < h - 3)]
+
+
+def score(sources, truth: np.ndarray) -> str:
+    # 完整度：真实星点 1 像素内有检测的比例；纯度：检测 1 像素内有真实星点的比例
+    found = np.column_stack([np.asarray(sources['xcentroid']), np.asarray(sources['ycentroid'])])
+    recall = np.mean(cKDTree(found).query(truth)[0] < 1)
+    precision = np.mean(cKDTree(truth).query(found)[0] < 1)
+    return f'{len(found):>8}{recall:>10.3f}{precision:>10.3f}'
+
+
+def naive_median(paths: list) -> np.ndarray:
+    # 对照：把所有帧读进内存后求中值
+    return np.median(np.stack([np.array(file_utils.read_frame(p)[0]) for p in paths]), axis=0)
+
+
+def band_median(paths: list, memory: int) -> np.ndarray:
+    return reference.stack_frames(paths, 'median', memory=memory)
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_synthetic_fits(os.path.join(tmp, 'data'), N_FRAMES, n_stars=N_STARS)
+        truth = truth_positions()
+
+        naive, naive_time, naive_rss = run_isolated(naive_median, paths)
+        stack, band_time, band_rss = run_isolated(band_median, paths, 32 * 2 ** 20)
+        print(f'{"中值叠加":<12}{"耗时(s)":>10}{"峰值RSS(MB)":>14}')
+        print(f'{"全部读入":<12}{naive_time:>10.2f}{naive_rss:>14.0f}')
+        print(f'{"行带 32MB":<12}{band_time:>10.2f}{band_rss:>14.0f}')
+        print(f'结果相同: {np.array_equal(naive, stack)}')
+
+        single = find_star_variants(file_utils.read_frame(paths[N_FRAMES // 2])[0], [VARIANT],
+                                    bkg_mode='fast', **CUTS)[VARIANT.name]
+        stacked = find_star_variants(stack, [VARIANT], bkg_mode='fast', **CUTS)[VARIANT.name]
+        t0 = time.perf_counter()
+        catalog = reference.detect_frames(paths, os.path.join(tmp, 'frames'), VARIANT, **CUTS)
+        detect_time = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        frame_sources = reference.merge_frame_detections(catalog)
+        merged = reference.merge_catalogs(stacked, frame_sources)
+        merge_time = time.perf_counter() - t0
+
+        print(f'\n{"星表":<14}{"星点数":>8}{"完整度":>10}{"纯度":>10}')
+        print(f'{"单帧":<14}{score(single, truth)}')
+        print(f'{"中值叠加":<14}{score(stacked, truth)}')
+        print(f'{"逐帧合并":<14}{score(frame_sources, truth)}')
+        print(f'{"叠加+逐帧":<14}{score(merged, truth)}')
+        print(f'逐帧找星 {detect_time:.1f} s，合并 {len(catalog)} 个检测 {merge_time:.3f} s')
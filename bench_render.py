@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from matplotlib import pyplot as plt
+
+import render
+
+# 模拟绘图数：每个任务是一条 1200 个历元的光度曲线
+N_PLOTS = 1000
+N_EPOCHS = 1200
+
+
+def legacy(t, fs, folder):
+    # 原来的写法：每张图都用 pyplot 新建、保存、关闭
+    for i, f in enumerate(fs):
+        plt.figure(figsize=(10, 5))
+        plt.plot(t, f)
+        plt.title(f'light_curves {i}')
+        plt.xlabel('Time(day)')
+        plt.ylabel('Flux')
+        plt.grid()
+        plt.savefig(f'{folder}/light_curve_{i}.png')
+        plt.close()
+
+
+def submit_all(t, fs, folder, mode, workers, output=None):
+    # 返回 (提交完成的时间, 全部渲染完成的时间)
+    t0 = time.perf_counter()
+    renderer = render.Renderer(mode, output=output, workers=workers)
+    for i, f in enumerate(fs):
+        renderer.submit('light_curve', f'{folder}/light_curve_{i}.png', t=t, f=f, title=f'light_curves {i}')
+    t_submit = time.perf_counter() - t0
+    renderer.close()
+    return t_submit, time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_PLOTS
+    rng = np.random.default_rng(0)
+    t = 1437 + np.arange(N_EPOCHS) / 48
+    fs = 1000 + 100 * np.sin(2 * np.pi * t / rng.uniform(0.1, 4, (n, 1))) + rng.normal(0, 30, (n, N_EPOCHS))
+
+    with tempfile.TemporaryDirectory() as folder:
+        print(f'{n} 张图，CPU 核数 {os.cpu_count()}')
+        print(f'{"方式":<28}{"提交耗时(s)":>12}{"总耗时(s)":>12}')
+        t0 = time.perf_counter()
+        legacy(t, fs, folder)
+        print(f'{"pyplot 逐张（原写法）":<28}{"-":>12}{time.perf_counter() - t0:>12.2f}')
+        cases = [
+            ('png 串行（复用画布）', 'png', 0, None),
+            (f'png 进程池 x{os.cpu_count()}', 'png', None, None),
+            ('sheet 缩略图 5x5 进程池', 'sheet', None, os.path.join(folder, 'sheets')),
+            ('pdf 多页', 'pdf', None, os.path.join(folder, 'all.pdf')),
+            ('none 不绘图', 'none', None, None),
+        ]
+        for label, mode, workers, output in cases:
+            t_submit, total = submit_all(t, fs, folder, mode, workers, output)
+            print(f'{label:<28}{t_submit:>12.2f}{total:>12.2f}')
@@ -0,0 +1,93 @@
+import sys
+import time
+
+import numpy as np
+
+import periodogram
+import screening
+import transit
+from bench_periodogram import N_EPOCHS, MIN_PERIOD, MAX_PERIOD
+
+N_STARS = 10000
+# 有变化的星的比例（真实视场中绝大多数星是平的）
+VARIABLE_FRACTION = 0.05
+# 短凌星检查的星数：2 小时、深度 1.5 倍噪声的盒形凌星
+N_TRANSITS = 200
+
+
+def synthetic_field(n_stars: int, seed: int = 0) -> tuple:
+    # 大多数星只有白噪声，少数星带正弦变化（包括接近采样间隔的短周期）
+    rng = np.random.default_rng(seed)
+    t = np.sort(1437 + rng.choice(np.arange(N_EPOCHS * 1.1) / 48, N_EPOCHS, replace=False))
+    variable = rng.random(n_stars) < VARIABLE_FRACTION
+    period = rng.uniform(MIN_PERIOD, 4, (n_stars, 1))
+    amp = np.where(variable, rng.uniform(60, 300, n_stars), 0)[:, None]
+    fs = 1000 + amp * np.sin(2 * np.pi * t / period) + rng.normal(0, 30, (n_stars, N_EPOCHS))
+    return t, fs.astype(np.float32), variable
+
+
+def short_transits(n_stars: int, seed: int = 1) -> tuple:
+    # 每颗星都有持续 2 小时、深度 45（噪声 30）的凌星，30 分钟采样下每次凌星只有 4 个历元
+    rng = np.random.default_rng(seed)
+    t = np.sort(1437 + rng.choice(np.arange(N_EPOCHS * 1.1) / 48, N_EPOCHS, replace=False))
+    period = rng.uniform(0.8, MAX_PERIOD - 0.5, n_stars)
+    epoch = t[0] + rng.uniform(0, 1, n_stars) * period
+    phase = np.abs((t[None, :] - epoch[:, None] + period[:, None] / 2) % period[:, None] - period[:, None] / 2)
+    fs = 1000 - 45 * (phase < 1 / 24) + rng.normal(0, 30, (n_stars, N_EPOCHS))
+    return t, fs.astype(np.float32), period
+
+
+def features(result, ids: np.ndarray) -> set:
+    # cycle_analysis 中写入 feat.csv 的星（周期在范围内）
+    period = 1 / result.best_frequency[ids]
+    return set(ids[(period > MIN_PERIOD) & (period < MAX_PERIOD)].tolist())
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_STARS
+    t, fs, variable = synthetic_field(n)
+
+    # 原来的做法：所有星都计算周期图，之后再去掉 ptp < 100 的星
+    t0 = time.perf_counter()
+    full = periodogram.batch_lomb_scargle(t, fs, MIN_PERIOD, MAX_PERIOD)
+    ptps = np.ptp(fs, axis=1)
+    old = features(full, np.flatnonzero(ptps >= 100))
+    t_old = time.perf_counter() - t0
+
+    # 先筛选，只对候选星计算周期图
+    t0 = time.perf_counter()
+    stats = screening.variability_stats(fs)
+    t_stats = time.perf_counter() - t0
+    candidates, removed = screening.screen(stats)
+    ids = np.flatnonzero(candidates)
+    part = periodogram.batch_lomb_scargle(t, fs[candidates], MIN_PERIOD, MAX_PERIOD)
+    new = features(full, ids)
+    t_new = time.perf_counter() - t0
+
+    print(f'{n} 颗星 x {N_EPOCHS} 个历元，其中 {variable.sum()} 颗有变化')
+    for name, k in removed.items():
+        print(f'筛选条件 {name} 去掉 {k} 颗星')
+    print(f'{len(ids)} 颗星进入周期图计算，跳过 {1 - len(ids) / n:.1%}')
+    print(f'{"方式":<20}{"耗时(s)":>10}{"feat 星数":>10}')
+    print(f'{"全部计算周期图":<20}{t_old:>10.2f}{len(old):>10}')
+    print(f'{"先筛选（统计量）":<20}{t_new:>10.2f}{len(new):>10}    其中统计量 {t_stats:.2f} s')
+    print(f'候选星的周期图与全部计算时相同: '
+          f'{np.array_equal(part.best_frequency, full.best_frequency[candidates])}')
+    print(f'有变化的星保留 {np.mean(candidates[variable]):.1%}，'
+          f'原来 feat 中的变星保留 {np.mean([i in new for i in old if variable[i]]):.1%}，'
+          f'原来 feat 中去掉的白噪声星 {sum(1 for i in old - new if not variable[i])} 颗')
+
+    # 短凌星的 von Neumann 比接近白噪声，周期图的筛选会去掉它们，BLS 只按极差筛选
+    flat = fs[~variable][:N_TRANSITS * 5]
+    t_transit, fs_transit, period = short_transits(N_TRANSITS)
+    stats = screening.variability_stats(fs_transit)
+    candidates, _ = screening.screen(stats)
+    bls_candidates, _ = screening.screen(stats, screening.BLS_CUTS)
+    bls_min_period = 2 * max(transit.DURATIONS)
+    bls = transit.batch_bls(t_transit, fs_transit[bls_candidates], transit.DURATIONS, bls_min_period, MAX_PERIOD)
+    found = (bls.snr >= transit.MIN_SNR) & np.any([np.abs(bls.period / (period[bls_candidates] * m) - 1) < 0.01
+                                                   for m in (0.5, 1, 2)], axis=0)
+    false = transit.batch_bls(t, flat, transit.DURATIONS, bls_min_period, MAX_PERIOD).snr >= transit.MIN_SNR
+    print(f'{N_TRANSITS} 颗短凌星：周期图筛选保留 {candidates.sum()} 颗，BLS 筛选保留 {bls_candidates.sum()} 颗，'
+          f'BLS 找到（信噪比 >= {transit.MIN_SNR}，周期正确）{found.sum()} 颗；'
+          f'{len(flat)} 颗白噪声星中 BLS 误报 {false.sum()} 颗')
@@ -0,0 +1,49 @@
+import json
+import sys
+import time
+import warnings
+
+import numpy as np
+from astropy.wcs import WCS, FITSFixedWarning
+
+import sky
+from bench_utils import synthetic_header
+
+# 星点数：逐颗换算只跑第一档
+SIZES = (1000, 100000, 2000000)
+PER_STAR_MAX = 1000
+GRID_STEPS = (8, 16, 32, 64)
+
+
+def timed(func):
+    t0 = time.perf_counter()
+    func()
+    return time.perf_counter() - t0
+
+
+def per_star(hdr, xs, ys):
+    # 原来 query_star 的写法：每颗星重新构造 WCS 再换算
+    for x, y in zip(xs, ys):
+        WCS(hdr).all_pix2world(x, y, 0)
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore', FITSFixedWarning)
+    sizes = [int(a) for a in sys.argv[1:]] or SIZES
+    # 与 find_star 保存的 json 头信息相同的形式
+    hdr = json.loads(json.dumps(dict(synthetic_header(1437.0))))
+    rng = np.random.default_rng(0)
+
+    print(f'{"网格步长(px)":<14}{"最大误差(角秒)":>16}{"均方根误差(角秒)":>18}')
+    for step in GRID_STEPS:
+        err = sky.compare_with_exact(hdr, step)
+        print(f'{step:<14}{err["max"]:>16.2e}{err["rms"]:>18.2e}')
+
+    print(f'\n{"星点数":>10}{"逐颗(s)":>12}{"整表精确(s)":>14}{"整表网格(s)":>14}')
+    sky.pix2world(hdr, [0.0], [0.0], grid_step=sky.GRID_STEP)  # 预先建立 WCS 和网格缓存
+    for n in sizes:
+        x, y = rng.uniform(0, 2046, n), rng.uniform(0, 2033, n)
+        t_loop = f'{timed(lambda: per_star(hdr, x + 45, y)):.3f}' if n <= PER_STAR_MAX else '-'
+        t_exact = timed(lambda: sky.pix2world(hdr, x, y))
+        t_grid = timed(lambda: sky.pix2world(hdr, x, y, grid_step=sky.GRID_STEP))
+        print(f'{n:>10}{t_loop:>12}{t_exact:>14.3f}{t_grid:>14.3f}')
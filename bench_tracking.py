@@ -0,0 +1,105 @@
+import sys
+import time
+
+import numpy as np
+
+import tracking
+
+# 模拟参数：帧数、图像尺寸、移动目标数、每帧静止源（变星残差）比例
+N_FRAMES = 40
+SIZE = 2000
+N_MOVERS = 20
+STATIC_FRACTION = 0.3
+DENSITIES = (100, 1000, 5000, 20000)
+# 旧 DFS 只在低密度下运行，高密度时路径数会爆炸
+DFS_MAX_DENSITY = 1000
+
+
+def synthetic_detections(n_per_frame: int, seed: int = 0) -> tuple:
+    """
+    生成每帧的检测列表：随机噪声 + 静止源（每帧 80% 概率被检出，带 0.3 像素抖动）+ 匀速移动目标
+    :return: (每帧 (n, 4) 数组, 移动目标的真实位置 (N_MOVERS, N_FRAMES, 2))
+    """
+    rng = np.random.default_rng(seed)
+    n_static = int(n_per_frame * STATIC_FRACTION)
+    static = rng.uniform(0, SIZE, (n_static, 2))
+    start = rng.uniform(200, SIZE - 200, (N_MOVERS, 2))
+    velocity = rng.uniform(-3, 3, (N_MOVERS, 2))
+    truth = start[:, None, :] + velocity[:, None, :] * np.arange(N_FRAMES)[None, :, None]
+    frames = []
+    for k in range(N_FRAMES):
+        noise = rng.uniform(0, SIZE, (n_per_frame - n_static, 2))
+        seen = static[rng.random(n_static) < 0.8] + rng.normal(0, 0.3, (1, 2))
+        movers = truth[:, k] + rng.normal(0, 0.2, (N_MOVERS, 2))
+        xy = np.vstack([noise, seen, movers])
+        flux = rng.lognormal(6, 0.5, len(xy))
+        frames.append(np.column_stack([xy, flux / 10, flux]))
+    return frames, truth
+
+
+def to_rows(frame):
+    # 旧 dfs 按 dict 风格访问每个检测
+    return [{'xcentroid': x, 'ycentroid': y, 'peak': p, 'flux': f} for x, y, p, f in frame]
+
+
+def legacy_dfs(index, num, moving_candi, path: list, paths: list, visited: list):
+    # 改动前 find_little_star.dfs 的深度优先搜索，作为对照；visited 由调用方传入
+    if index >= len(moving_candi) - 1:
+        if len(path) >= 10:
+            paths.append(path.copy())
+        return
+
+    cur_x, cur_y = path[-1][0], path[-1][1]
+    visited[index].add(num)  # 标记当前点为已访问
+
+    has_next = False
+    for i, s in enumerate(moving_candi[index + 1]):
+        if np.hypot(s['xcentroid'] - cur_x, s['ycentroid'] - cur_y) < 5.0:
+            # 认为 s 是同一个目标的下一个点
+            path.append([s['xcentroid'], s['ycentroid'], s['peak'], s['flux']])
+            legacy_dfs(index + 1, i, moving_candi, path, paths, visited)
+            path.pop()  # 回溯
+            has_next = True
+    if not has_next and len(path) >= 10:
+        # 如果没有下一个点，记录当前路径
+        paths.append(path.copy())
+
+
+def run_dfs(frames):
+    rows = [to_rows(f) for f in frames]
+    paths = []
+    visited = [set() for _ in range(len(rows))]
+    for i, diff_source in enumerate(rows):
+        for j, point in enumerate(diff_source):
+            if j not in visited[i]:
+                legacy_dfs(0, j, rows, [[point['xcentroid'], point['ycentroid'], point['peak'], point['flux']]],
+                           paths, visited)
+    return paths
+
+
+def recovered(tracks, truth) -> int:
+    # 轨迹起点在某个移动目标真实位置 2 像素以内即视为找回
+    found = 0
+    for traj in truth:
+        for tr in tracks:
+            if len(tr.frames) >= N_FRAMES // 2 and np.hypot(*(tr.points[0, :2] - traj[tr.frames[0]])) < 2:
+                found += 1
+                break
+    return found
+
+
+if __name__ == '__main__':
+    sys.setrecursionlimit(10000)
+    print(f'{"每帧检测数":>10}{"link_tracks(s)":>16}{"找回/总数":>10}{"多余轨迹":>18}{"旧DFS(s)":>12}')
+    for n in DENSITIES:
+        frames, truth = synthetic_detections(n)
+        t0 = time.perf_counter()
+        tracks = tracking.link_tracks(frames, min_speed=0.5)
+        t_link = time.perf_counter() - t0
+        extra = len(tracks) - recovered(tracks, truth)
+        t_dfs = '-'
+        if n <= DFS_MAX_DENSITY:
+            t0 = time.perf_counter()
+            run_dfs(frames)
+            t_dfs = f'{time.perf_counter() - t0:.3f}'
+        print(f'{n:>10}{t_link:>16.3f}{recovered(tracks, truth):>6}/{N_MOVERS:<4}{extra:>18}{t_dfs:>12}')
@@ -0,0 +1,73 @@
+import sys
+import time
+
+import numpy as np
+from astropy.timeseries import BoxLeastSquares
+
+import transit
+from bench_periodogram import N_EPOCHS
+
+N_STARS = 1000
+# 与 astropy 逐颗比较的星数
+N_CHECK = 50
+MIN_PERIOD, MAX_PERIOD = 0.5, 5
+# 周期网格的频率间隔系数（BoxLeastSquares.autoperiod 的 frequency_factor）
+FREQUENCY_FACTOR = 2.0
+
+
+def synthetic_transits(n_stars: int, seed: int = 0) -> tuple:
+    # 时间带随机缺帧，一半的星带盒形凌星（食）
+    rng = np.random.default_rng(seed)
+    t = np.sort(1437 + rng.choice(np.arange(N_EPOCHS * 1.1) / 48, N_EPOCHS, replace=False))
+    has = rng.random(n_stars) < 0.5
+    period = rng.uniform(MIN_PERIOD + 0.1, MAX_PERIOD - 0.5, n_stars)
+    duration = rng.choice(np.array(transit.DURATIONS[:4]), n_stars)
+    epoch = t[0] + rng.uniform(0, 1, n_stars) * period
+    depth = np.where(has, rng.uniform(30, 120, n_stars), 0)
+    phase = np.abs((t[None, :] - epoch[:, None] + period[:, None] / 2) % period[:, None] - period[:, None] / 2)
+    fs = 1000 - depth[:, None] * (phase < duration[:, None] / 2) + rng.normal(0, 30, (n_stars, N_EPOCHS))
+    return t, fs.astype(np.float32), has, period
+
+
+def per_star(t, fs, periods):
+    result = []
+    for f in fs:
+        f = np.asarray(f, dtype=np.float64)
+        r = BoxLeastSquares(t, f, dy=np.full_like(f, f.std())).power(periods, np.array(transit.DURATIONS))
+        k = np.argmax(r.power)
+        result.append((r.period[k], r.power[k], r.depth[k], r.duration[k], r.depth_snr[k]))
+    return np.array(result)
+
+
+def recovered(found: np.ndarray, true: np.ndarray) -> np.ndarray:
+    # 找到的周期与真实周期（或其 2 倍、1/2）相差不到 1%
+    return np.any([np.abs(found / (true * m) - 1) < 0.01 for m in (0.5, 1, 2)], axis=0)
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_STARS
+    t, fs, has, true_period = synthetic_transits(n)
+    periods = transit.period_grid(t, transit.DURATIONS, MIN_PERIOD, MAX_PERIOD, FREQUENCY_FACTOR)
+
+    t0 = time.perf_counter()
+    result = transit.batch_bls(t, fs, periods=periods)
+    t_batch = time.perf_counter() - t0
+    print(f'{n} 颗星 x {N_EPOCHS} 个历元，{len(periods)} 个周期 x {len(transit.DURATIONS)} 个持续时间')
+    print(f'{"方式":<24}{"耗时(s)":>10}{"星/秒":>10}')
+    print(f'{"批量":<24}{t_batch:>10.2f}{n / t_batch:>10.1f}')
+
+    # astropy 逐颗计算只跑一部分星，按比例估算全部耗时
+    t0 = time.perf_counter()
+    ref = per_star(t, fs[:N_CHECK], periods)
+    elapsed = (time.perf_counter() - t0) * n / N_CHECK
+    print(f'{"astropy fast（估算）":<24}{elapsed:>10.2f}{n / elapsed:>10.1f}')
+
+    # 长持续时间的相位网格比 astropy 粗（起点间隔为持续时间 / oversample），纯噪声星的最佳周期是随机的，只比较有凌星的星
+    check = has[:N_CHECK]
+    same = np.isclose(result.period[:N_CHECK], ref[:, 0], rtol=1e-3) & check
+    ratio = result.power[:N_CHECK][check] / ref[check, 1]
+    print(f'前 {N_CHECK} 颗星中有凌星的 {check.sum()} 颗：最佳周期与 astropy 相同 {same.sum() / check.sum():.1%}，'
+          f'最大功率之比中位数 {np.median(ratio):.3f}（最小 {ratio.min():.3f}），'
+          f'周期相同时深度的中位相对差 {np.median(np.abs(result.depth[:N_CHECK] / ref[:, 2] - 1)[same]):.1e}')
+    print(f'有凌星的星中周期找回 批量 {recovered(result.period, true_period)[has].mean():.1%}，'
+          f'astropy {recovered(ref[:, 0], true_period[:N_CHECK])[has[:N_CHECK]].mean():.1%}（前 {N_CHECK} 颗）')
@@ -0,0 +1,141 @@
+import os
+import time
+import resource
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+
+# TESS FFI 校准图像的原始尺寸（行, 列）
+FFI_SHAPE = (2078, 2136)
+
+
+def synthetic_header(tstart: float, shape: tuple = FFI_SHAPE, quality: int = 0) -> fits.Header:
+    """
+    构造与 TESS FFI 校准 HDU 类似的头信息（时间、质量标记和带 SIP 畸变的 TAN 投影）
+    """
+    hdr = fits.Header()
+    hdr['TSTART'] = tstart
+    hdr['TSTOP'] = tstart + 1 / 48
+    hdr['DATE-OBS'] = '2018-11-15T11:30:00.000'
+    hdr['DQUALITY'] = quality
+    hdr['CAMERA'] = 1
+    hdr['CCD'] = 4
+    hdr['WCSAXES'] = 2
+    hdr['CTYPE1'] = 'RA---TAN-SIP'
+    hdr['CTYPE2'] = 'DEC--TAN-SIP'
+    hdr['CRVAL1'] = 85.0
+    hdr['CRVAL2'] = -30.0
+    hdr['CRPIX1'] = shape[1] / 2
+    hdr['CRPIX2'] = shape[0] / 2
+    hdr['CD1_1'] = -0.0059
+    hdr['CD1_2'] = 0.0003
+    hdr['CD2_1'] = 0.0003
+    hdr['CD2_2'] = 0.0059
+    hdr['A_ORDER'] = 2
+    hdr['B_ORDER'] = 2
+    hdr['A_2_0'] = 2.0e-6
+    hdr['A_0_2'] = -1.5e-6
+    hdr['A_1_1'] = 1.0e-6
+    hdr['B_2_0'] = -1.0e-6
+    hdr['B_0_2'] = 2.5e-6
+    hdr['B_1_1'] = -0.5e-6
+    return hdr
+
+
+def synthetic_frame(rng, xs, ys, fluxes, shape: tuple = FFI_SHAPE, background: float = 200.0,
+                    noise: float = 5.0, sigma: float = 1.0) -> np.ndarray:
+    # 背景 + 高斯噪声 + 每颗星一个 7x7 的高斯星像
+    img = rng.normal(background, noise, size=shape).astype(np.float32)
+    dy, dx = np.mgrid[-3:4, -3:4]
+    for x, y, f in zip(xs, ys, fluxes):
+        ix, iy = int(round(x)), int(round(y))
+        if ix < 3 or iy < 3 or ix >= shape[1] - 3 or iy >= shape[0] - 3:
+            continue
+        psf = np.exp(-((dx + ix - x) ** 2 + (dy + iy - y) ** 2) / (2 * sigma ** 2))
+        img[iy - 3:iy + 4, ix - 3:ix + 4] += f * psf / psf.sum()
+    return img
+
+
+def make_standin_gaia(path: str, header: fits.Header, n_sources: int = 200000, class_fraction: float = 0.02,
+                      seed: int = 0, shape: tuple = FFI_SHAPE) -> tuple:
+    """
+    在帧的覆盖范围内随机生成一个本地替代 Gaia 星表（含变星分类列），用于离线测试交叉匹配
+    :return: (星表路径, 像素坐标 (n, 2))
+    """
+    from astropy.table import Table
+    from astropy.wcs import WCS
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform((0, 0), (shape[1], shape[0]), (n_sources, 2))
+    ra, dec = WCS(header).all_pix2world(xy[:, 0], xy[:, 1], 0)
+    classified = rng.random(n_sources) < class_fraction
+    names = np.array(['ECL', 'RS', 'SOLAR_LIKE', 'LPV', 'DSCT|GDOR|SXPHE'])
+    Table({
+        'source_id': rng.choice(2 ** 60, n_sources, replace=False).astype(np.int64),
+        'ra': ra, 'dec': dec,
+        'phot_g_mean_mag': rng.uniform(8, 20, n_sources).astype(np.float32),
+        'best_class_name': np.where(classified, names[rng.integers(0, len(names), n_sources)], ''),
+        'best_class_score': np.where(classified, rng.uniform(0.3, 1, n_sources), np.nan),
+        'classifier_name': np.where(classified, 'nTransits:2+', ''),
+    }).write(path, overwrite=True)
+    return path, xy
+
+
+def make_synthetic_fits(folder: str, n_frames: int, shape: tuple = FFI_SHAPE, n_stars: int = 2000,
+                        n_movers: int = 0, seed: int = 0) -> list:
+    """
+    在 folder 中生成一组模拟 FFI（PrimaryHDU + 校准图像 HDU + 不确定度 HDU）
+    :param n_movers: 匀速移动目标（模拟小行星）的数量
+    :return: 生成的文件路径列表（按文件名排序）
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    xs = rng.uniform(0, shape[1], n_stars)
+    ys = rng.uniform(0, shape[0], n_stars)
+    fluxes = rng.lognormal(8, 1, n_stars)
+    mx = rng.uniform(100, shape[1] - 100, n_movers)
+    my = rng.uniform(100, shape[0] - 100, n_movers)
+    mv = rng.uniform(-1.5, 1.5, (2, n_movers))
+    paths = []
+    for k in range(n_frames):
+        frame_x = np.concatenate([xs, mx + mv[0] * k])
+        frame_y = np.concatenate([ys, my + mv[1] * k])
+        frame_f = np.concatenate([fluxes, np.full(n_movers, 5000.0)])
+        img = synthetic_frame(rng, frame_x, frame_y, frame_f, shape=shape)
+        hdr = synthetic_header(1437.0 + k / 48, shape=shape)
+        path = os.path.join(folder, f'synthetic-{k:05d}-s_ffic.fits')
+        fits.HDUList([fits.PrimaryHDU(),
+                      fits.ImageHDU(img, header=hdr, name='CAL'),
+                      fits.ImageHDU(np.full(shape, 5.0, dtype=np.float32), name='UNCERT')]
+                     ).writeto(path, overwrite=True)
+        paths.append(path)
+    return paths
+
+
+def _measure(func, args, kwargs):
+    t0 = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - t0
+    # Linux 下 ru_maxrss 单位为 KB
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result, elapsed, peak_rss
+
+
+def run_isolated(func, *args, **kwargs) -> tuple:
+    """
+    在全新的子进程中运行 func，避免不同方案之间的峰值内存互相影响
+    :return: (返回值, 耗时秒数, 峰值 RSS MB)
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context('spawn')) as pool:
+        return pool.submit(_measure, func, args, kwargs).result()
+
+
+def timeit(func, *args, repeat: int = 3, **kwargs) -> float:
+    # 返回多次运行中的最短耗时
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return best
@@ -3,13 +3,15 @@ import json
 import numpy as np
 import pandas as pd
 
-from tqdm import tqdm
-from astropy.coordinates import SkyCoord
-import astropy.units as u
-from astropy.wcs import WCS
 import logging
 from astroquery.gaia import Gaia
 
+import detections
+import gaia_catalog
+import gaia_client
+import instrument
+import sky
+
 # 设置日志记录为 error级别
 logging.getLogger('astroquery').setLevel(logging.ERROR)
 
@@ -24,80 +26,46 @@ def query_single_classify(source_id):
     return result
 
 if __name__ == '__main__':
+    instrument.start_run('classify_star')
     output_path = 'result/light_curves/data/feat_classify.csv'
+    # 离线运行时给出本地替代星表文件（csv / ecsv / fits，列见 gaia_catalog.from_table），为 None 时在线查询
+    local_catalog = None
+    # 分类结果来源：'cache' 使用天区缓存中的分类，'live' 对匹配到的 source_id 批量并发在线查询（可中断后继续）
+    classify_mode = 'cache'
 
     hdr = json.load(open('result/find_star/header_49.json', 'r'))
-    wcs = WCS(hdr)
 
-    source = np.load('result/find_star/source_fixed.npy', allow_pickle=True)
+    source = detections.load_sources('result/find_star/source_fixed')
     print(f"读取到 {len(source)} 个星点数据")
 
     ids = pd.read_csv('result/light_curves/feat.csv')['id'].tolist()
     print(f"其中需要查询的星点数量: {len(ids)}")
 
-    # 已经查询过确定没有的 source_id
-    queried_ids = pd.read_csv('result/light_curves/data/feat_classify.csv')['id'].tolist()
-    print(f"已经查询过：{queried_ids}")
-
-    for ID in tqdm(ids, desc="处理每个星点", unit="id", colour="green"):
-
-        if ID in queried_ids:
-            print(f"ID {ID} 已经查询过，跳过")
-            continue
-
-        # 假设你有一个星点的像素位置：
-        x_pix, y_pix = source[ID]['xcentroid'], source[ID]['ycentroid']
-
-        # 转为 RA/Dec（FITS 标准 origin=1）
-        ra, dec = wcs.all_pix2world(x_pix, y_pix, 1)
-        print(f"RA = {ra:.6f}, Dec = {dec:.6f}")
-
-        coord = SkyCoord(ra, dec, unit=(u.deg, u.deg), frame='icrs')
-
-        width = u.Quantity(100, u.arcsec)
-        j = Gaia.cone_search_async(coord, radius=width)
-        r = j.get_results()
-
-        r.sort('dist')
-
-        print(f"查询到 {len(r)} 个 Gaia 源, 最近的距离为 {r[0]['dist']:.4f} arcsec")
-
-        if len(r) > 0:
-            source_id = r[0]['source_id']
-            print("Matched Gaia source_id:", source_id)
+    # 所有星点的 RA/Dec：星点表中保存了 ra / dec 时直接读取，否则一次换算（像素坐标从 0 开始，加回去边框的偏移）
+    ra, dec = sky.source_sky_coords(source, hdr, ids)
+
+    # 取回覆盖所有星点的天区（优先使用本地缓存），再一次匹配所有星点，代替逐颗 cone search 和分类查询
+    with instrument.stage('classify_star.gaia_catalog') as s:
+        catalog = gaia_catalog.get_catalog(gaia_catalog.footprint(ra, dec), local_catalog=local_catalog)
+        s.items = len(catalog)
+    print(f"天区内共 {len(catalog)} 个 Gaia 源")
+    with instrument.stage('classify_star.crossmatch', items=len(ra)):
+        matched = catalog.crossmatch(ra, dec)
+
+    df = pd.DataFrame({'id': ids, **matched})
+    found = df['source_id'] >= 0
+    if classify_mode == 'live':
+        # 断点状态记录已经查询过的 source_id，重新运行时只查询新的
+        with instrument.stage('classify_star.gaia_query', items=int(found.sum())):
+            classes = gaia_client.query_source_ids(df.loc[found, 'source_id'],
+                                                   'result/light_curves/data/classify_state.i64',
+                                                   'result/light_curves/data/classify_results.csv')
+        df = df.drop(columns=['best_class_name', 'best_class_score', 'classifier_name'])
+        if len(classes):
+            df = df.merge(classes.drop_duplicates('source_id'), on='source_id', how='left')
         else:
-            print("No Gaia source found.")
-            # 将结果追加到 CSV 文件中
-            res = {
-                'id': ID,
-                'source_id': '未找到',
-                'ra': ra,
-                'dec': dec,
-                'best_class_name': '',
-                'best_class_score': '',
-            }
-            df = pd.DataFrame([res])
-            df.to_csv(output_path, mode='a', header=False, index=False)
-            continue
-
-        result = query_single_classify(source_id)
-
-        if len(result) > 0:
-            star_type = result['best_class_name'][0]
-            score = result['best_class_score'][0]
-            print(f"该星被分类为：{star_type}，置信度：{score:.2f}")
-        else:
-            print("该源未被 Gaia DR3 标记为变星")
-
-        # 将结果追加到 CSV 文件中
-        res = {
-            'id': ID,
-            'source_id': source_id,
-            'ra': ra,
-            'dec': dec,
-            'best_class_name': result['best_class_name'][0] if len(result) > 0 else "未分类",
-            'best_class_score': result['best_class_score'][0] if len(result) > 0 else "未分类",
-            'dist': r[0]['dist'],
-        }
-        df = pd.DataFrame([res])
-        df.to_csv('result/light_curves/data/feat_classify.csv', mode='a', header=False, index=False)
+            df['best_class_name'], df['best_class_score'] = '', np.nan
+        df['best_class_name'] = df['best_class_name'].fillna('')
+    print(f"匹配到 {found.sum()} 个 Gaia 源，其中 {(df['best_class_name'] != '').sum()} 个被 Gaia DR3 标记为变星")
+    gaia_catalog.write_classification(output_path, df)
+    print(f"结果已保存到 {output_path}")
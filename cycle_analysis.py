@@ -1,13 +1,18 @@
 import os
 
 import numpy as np
-from astropy.timeseries import LombScargle
 import pandas as pd
 from tqdm import tqdm
 
-from matplotlib import pyplot as plt
+import detections
+import instrument
+import periodogram
+import render
+import screening
+import transit
 
 if __name__ == '__main__':
+    instrument.start_run('cycle_analysis')
     output_csv = 'result/light_curves/feat.csv'
     figures_dir = 'result/light_curves/figures'
     os.makedirs(figures_dir, exist_ok=True)
@@ -16,55 +21,111 @@ if __name__ == '__main__':
     fs = np.load('result/light_curves/data/fluxes.npy', allow_pickle=True)
     print(f'读取到 {len(fs)} 个光度曲线数据')
 
-    sc = np.load('result/find_star/source_fixed.npy', allow_pickle=True)
+    sc = detections.load_sources('result/find_star/source_fixed')
     print(f'读取到 {len(sc)} 个星点数据')
 
     t = np.load('result/light_curves/data/times.npy', allow_pickle=True)
+    # light_curves.py 标记的坏历元（已插值修补）不参与周期图计算
+    mask_path = 'result/light_curves/data/epoch_mask.npy'
+    if os.path.exists(mask_path):
+        good = np.load(mask_path)
+        fs, t = fs[:, good], t[good]
+        print(f'去掉 {np.sum(~good)} 个坏历元，剩余 {len(t)} 个')
 
-    feat_list = []
-    for i, f in enumerate(tqdm(fs, desc='处理光度曲线')):
-
-        std = np.std(f) # 计算标准差
-        ptp = np.ptp(f) # 计算极差
-        # 定义频率范围（单位是 cycles per day）
-        min_period = 0.05 # 最小周期（day）
-        max_period = 5 # 最大周期（day）
-        frequency, power = LombScargle(t, f).autopower(
-            minimum_frequency = 1 / max_period,
-            maximum_frequency = 1 / min_period
-        )
-        # 找到周期峰值
-        best_frequency = frequency[np.argmax(power)]
-        best_period = 1 / best_frequency # 计算最佳周期（单位是天）
-        # 周期异常，说明该光度曲线没有明显的周期性
-        if best_period <= min_period or best_period >= max_period or ptp < 100:
-            continue
+    # 定义频率范围（单位是 cycles per day）
+    min_period = 0.05 # 最小周期（day）
+    max_period = 5 # 最大周期（day）
+    # 先对整个光度矩阵一次计算廉价的变化统计量，只有通过筛选的星才计算周期图
+    # 筛选条件见 screening.CUTS（阈值为 None 的条件不使用），例如 cuts['von_neumann_max'] = ('von_neumann', '<=', 1.5)
+    cuts = dict(screening.CUTS)
+    with instrument.stage('cycle_analysis.screening', items=len(fs)):
+        stats = screening.variability_stats(fs)
+        candidates, removed = screening.screen(stats, cuts)
+        bls_candidates, _ = screening.screen(stats, screening.BLS_CUTS)
+    for name, n in removed.items():
+        print(f'筛选条件 {name} 去掉 {n} 颗星')
+    print(f'{candidates.sum()} / {len(fs)} 颗星进入周期图计算，{bls_candidates.sum()} 颗星进入 BLS 搜索')
 
+    # 所有星共用同一组时间，频率网格和三角函数项只算一次，按批计算所有候选星的周期图
+    # 结果按每颗星光度曲线的摘要缓存，增量更新后只重新计算（和绘制）光度曲线有变化的星
+    with instrument.stage('cycle_analysis.periodogram', items=int(candidates.sum())):
+        result, changed = periodogram.cached_lomb_scargle(t, fs, 'result/light_curves/data/periodogram_cache.npz',
+                                                          min_period, max_period, rows=candidates)
+    print(f'重新计算了 {changed.sum()} 颗星的周期图')
+    print(f'虚警概率 1% 对应的功率阈值: {result.false_alarm_level:.4f}')
 
+    # 正弦周期图找不准食双星和凌星，再做一次批量 Box Least Squares 搜索
+    # 短凌星通不过 white_noise 筛选，BLS 的候选星只按 screening.BLS_CUTS（极差）筛选
+    # 周期网格与持续时间网格所有星共用，最短周期取最长持续时间的 2 倍
+    bls_min_period = max(min_period, 2 * max(transit.DURATIONS))
+    bls_ids = np.flatnonzero(bls_candidates)
+    with instrument.stage('cycle_analysis.bls', items=len(bls_ids)):
+        bls = transit.batch_bls(t, fs[bls_ids], transit.DURATIONS, bls_min_period, max_period)
+    print(f'BLS 搜索了 {len(bls.period_grid)} 个周期 x {len(transit.DURATIONS)} 个持续时间')
+    # 按星序号展开 BLS 结果，不在 BLS 候选星中的星（行号 -1，取到末尾补的 nan）的结果为 nan
+    bls_row = np.full(len(fs), -1)
+    bls_row[bls_ids] = np.arange(len(bls_ids))
+    bls = bls._replace(**{name: np.append(getattr(bls, name), np.nan)[bls_row]
+                          for name in bls._fields if name != 'period_grid'})
+
+    # 周期图的最佳周期在范围内，或 BLS 找到了信噪比足够的凌星（食），满足其一就写入 feat.csv
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ls_period = 1 / result.best_frequency
+    ls_valid = candidates & (ls_period > min_period) & (ls_period < max_period)
+    bls_valid = bls.snr >= transit.MIN_SNR
+    print(f'周期图 {ls_valid.sum()} 颗星，BLS {bls_valid.sum()} 颗星（其中 {np.sum(bls_valid & ~ls_valid)} 颗只有 BLS）')
+    stds = stats['std'] # 标准差
+    ptps = stats['ptp'] # 极差
+
+    # 绘图方式：'png' 每颗星一张图，'sheet' 拼成缩略图总览，'pdf' 一个多页 PDF，'none' 不绘图
+    render_mode = 'png'
+    render_output = f'{figures_dir}/light_curves.pdf' if render_mode == 'pdf' else figures_dir
+    renderer = render.Renderer(render_mode, output=render_output)
+    feat_list = []
+    for i in tqdm(np.flatnonzero(ls_valid | bls_valid), desc='处理光度曲线'):
+
+        f = fs[i]
+        std, ptp = stds[i], ptps[i]
+        # 周期图的最佳周期不在范围内时，周期图的列留空，只保留 BLS 的结果
+        ls = ls_valid[i]
+        best_frequency = result.best_frequency[i] if ls else np.nan
+        best_period = ls_period[i] if ls else np.nan
+        # 图的标题和文件名用周期图的周期，只有 BLS 结果时用 BLS 的周期
+        plot_period = best_period if ls else bls.period[i]
 
-        max_power = np.max(power) # 最大功率
         feat_list.append(
             {
                 'id': i,
                 'std': std,
                 'ptp': ptp,
-                'max_power': max_power,
+                'mad': stats['mad'][i],
+                'von_neumann': stats['von_neumann'][i],
+                'autocorr': stats['autocorr'][i],
+                'max_power': result.max_power[i] if ls else np.nan,
                 'best_frequency': best_frequency,
                 'best_period': best_period,
+                'false_alarm_probability': result.false_alarm_probability[i] if ls else np.nan,
+                'bls_period': bls.period[i],
+                'bls_power': bls.power[i],
+                'bls_depth': bls.depth[i],
+                'bls_duration': bls.duration[i],
+                'bls_epoch': bls.epoch[i],
+                'bls_snr': bls.snr[i],
                 'x_pixel': sc[i]['xcentroid'],
                 'y_pixel': sc[i]['ycentroid']
             }
         )
 
-        # 绘制光度曲线图并保存
-        plt.figure(figsize=(10, 5))
-        plt.plot(t, f)
-        plt.title(f'light_curves {i} - best_period: {best_period:.4f}')
-        plt.xlabel('Time(day)')
-        plt.ylabel('Flux')
-        plt.grid()
-        plt.savefig(f'{figures_dir}/light_curve_{i}_period-{best_period:.2f}.png')
-        plt.close()
+        # 提交绘图任务，由后台进程渲染并保存（单张图模式下光度曲线没有变化的星沿用上次的图）
+        # 只有 BLS 结果的星不在周期图缓存中，不知道光度曲线是否变化，每次都重新绘制
+        if changed[i] or not candidates[i] or render_mode != 'png':
+            with instrument.stage('cycle_analysis.render_submit', items=1):
+                renderer.submit('light_curve', f'{figures_dir}/light_curve_{i}_period-{plot_period:.2f}.png',
+                                t=t, f=f, title=f'light_curves {i} - best_period: {plot_period:.4f}')
+
+    # 等待后台进程画完所有图
+    with instrument.stage('cycle_analysis.render_wait'):
+        renderer.close()
 
     # 保存特征到 CSV 文件
     df = pd.DataFrame(feat_list)
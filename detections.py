@@ -0,0 +1,223 @@
+import os
+import pickle
+
+import numpy as np
+
+# 检测结果按列存放：每列一个只追加的二进制文件，(文件名, DAOStarFinder 列名, 数据类型)
+# frame 列不来自 DAOStarFinder，而是写入时的帧序号
+COLUMNS = (
+    ('x', 'xcentroid', np.float32),
+    ('y', 'ycentroid', np.float32),
+    ('peak', 'peak', np.float32),
+    ('flux', 'flux', np.float32),
+    ('frame', None, np.int32),
+)
+# 由其他列计算得到的附加列（如 sky.write_sky_coords 写入的天球坐标），存在时随存储一起读取
+EXTRA_COLUMNS = (
+    ('ra', np.float64),
+    ('dec', np.float64),
+)
+# 每帧结束位置（累计行数）和每帧时间
+ENDS_FILE = 'ends.i64'
+TIMES_FILE = 'times.f64'
+# 兼容 astropy Table 的列名访问
+ALIASES = {name: column for name, column, _ in COLUMNS if column is not None}
+
+
+def _column_path(store_dir: str, name: str, dtype) -> str:
+    return os.path.join(store_dir, f'{name}.{np.dtype(dtype).str[1:]}')
+
+
+def _map(path: str, dtype) -> np.ndarray:
+    # 空文件无法做内存映射
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+class DetectionWriter:
+    """
+    只追加的检测结果存储：每处理完一帧就把该帧的检测写到各列文件末尾，内存中不保留历史帧
+    中途中断后以 append=True 重新打开可以接着写
+    """
+
+    def __init__(self, store_dir: str, append: bool = False):
+        os.makedirs(store_dir, exist_ok=True)
+        self.store_dir = store_dir
+        ends_path = os.path.join(store_dir, ENDS_FILE)
+        append = append and os.path.exists(ends_path)
+        ends = np.fromfile(ends_path, dtype=np.int64) if append else []
+        self.n_frames = len(ends)
+        self.n_rows = int(ends[-1]) if len(ends) else 0
+        if append:
+            # 上次中断时可能只写了一部分列，按已经记录的帧截断
+            for name, _, dtype in COLUMNS:
+                os.truncate(_column_path(store_dir, name, dtype), self.n_rows * np.dtype(dtype).itemsize)
+            os.truncate(os.path.join(store_dir, TIMES_FILE), self.n_frames * 8)
+        # 附加列由已有的行计算得到，追加新行后失效
+        for name, dtype in EXTRA_COLUMNS:
+            if os.path.exists(_column_path(store_dir, name, dtype)):
+                os.remove(_column_path(store_dir, name, dtype))
+        mode = 'ab' if append else 'wb'
+        self._files = {name: open(_column_path(store_dir, name, dtype), mode) for name, _, dtype in COLUMNS}
+        self._ends = open(ends_path, mode)
+        self._times = open(os.path.join(store_dir, TIMES_FILE), mode)
+
+    def append(self, sources, time: float = np.nan) -> int:
+        """
+        追加一帧的检测结果
+        :param sources: DAOStarFinder 的结果（astropy Table 或结构化数组），没有检测到目标时为 None
+        :return: 该帧的序号
+        """
+        n = 0 if sources is None else len(sources)
+        for name, column, dtype in COLUMNS:
+            if n:
+                values = np.full(n, self.n_frames) if column is None else sources[column]
+                self._files[name].write(np.asarray(values, dtype=dtype).tobytes())
+            self._files[name].flush()
+        self.n_rows += n
+        self._times.write(np.float64(time).tobytes())
+        self._times.flush()
+        # 最后写入帧结束位置，作为该帧写入完成的标记
+        self._ends.write(np.int64(self.n_rows).tobytes())
+        self._ends.flush()
+        self.n_frames += 1
+        return self.n_frames - 1
+
+    def close(self):
+        for f in list(self._files.values()) + [self._ends, self._times]:
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DetectionCatalog:
+    """
+    以内存映射方式打开检测结果存储，不需要 pickle
+    catalog['x'] / catalog['xcentroid'] 返回整列，catalog[i] 返回第 i 行（dict），catalog.frame(k) 返回第 k 帧的所有检测
+    只有一帧的存储也可以当作星点表使用（find_star 的结果）
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.ends = np.fromfile(os.path.join(store_dir, ENDS_FILE), dtype=np.int64)
+        self.starts = np.concatenate([[0], self.ends[:-1]]).astype(np.int64)
+        self.times = np.fromfile(os.path.join(store_dir, TIMES_FILE), dtype=np.float64)
+        n_rows = int(self.ends[-1]) if len(self.ends) else 0
+        # 只映射已经完整写入的行
+        self.columns = {name: _map(_column_path(store_dir, name, dtype), dtype)[:n_rows]
+                        for name, _, dtype in COLUMNS}
+        for name, dtype in EXTRA_COLUMNS:
+            path = _column_path(store_dir, name, dtype)
+            if os.path.exists(path):
+                self.columns[name] = _map(path, dtype)[:n_rows]
+
+    @property
+    def n_frames(self) -> int:
+        return len(self.ends)
+
+    def __len__(self):
+        # 与 astropy Table 一致，长度为行数
+        return len(self.columns['x'])
+
+    def __getitem__(self, item):
+        if isinstance(item, str):
+            for name, column in ALIASES.items():
+                if item == column:
+                    item = name
+            return self.columns[item]
+        row = {column or name: self.columns[name][item] for name, column, _ in COLUMNS}
+        row.update({name: self.columns[name][item] for name, _ in EXTRA_COLUMNS if name in self.columns})
+        return row
+
+    def frame_slice(self, k: int) -> slice:
+        return slice(int(self.starts[k]), int(self.ends[k]))
+
+    def frame(self, k: int) -> np.ndarray:
+        # 第 k 帧的 (n, 4) 数组 [x, y, peak, flux]
+        sl = self.frame_slice(k)
+        return np.column_stack([self.columns[name][sl] for name in ('x', 'y', 'peak', 'flux')])
+
+    def frames(self) -> list:
+        return [self.frame(k) for k in range(self.n_frames)]
+
+
+def write_extra_columns(store_dir: str, **columns):
+    """
+    把附加列（EXTRA_COLUMNS 中的列，每行一个值）写入已有的存储
+    """
+    n_rows = len(DetectionCatalog(store_dir))
+    dtypes = dict(EXTRA_COLUMNS)
+    for name, values in columns.items():
+        values = np.asarray(values, dtype=dtypes[name])
+        if len(values) != n_rows:
+            raise ValueError(f'列 {name} 有 {len(values)} 个值，存储中有 {n_rows} 行')
+        values.tofile(_column_path(store_dir, name, dtypes[name]))
+
+
+def read_detections(store_dir: str) -> tuple:
+    """
+    读取检测结果存储
+    :return: (每帧一个 (n, 4) 数组 [x, y, peak, flux], 每帧时间)
+    """
+    catalog = DetectionCatalog(store_dir)
+    return catalog.frames(), catalog.times
+
+
+def write_catalog(store_dir: str, tables: list, times=None) -> DetectionCatalog:
+    """
+    把每帧一个的 DAOStarFinder 结果列表（或只含一个星点表的列表）写成列式存储
+    """
+    if times is None:
+        times = np.full(len(tables), np.nan)
+    with DetectionWriter(store_dir) as writer:
+        for sources, time in zip(tables, times):
+            writer.append(sources, time)
+    return DetectionCatalog(store_dir)
+
+
+def load_sources(path: str):
+    """
+    读取星点表：目录为列式存储（DetectionCatalog），否则按旧的 .npy 结构化数组读取
+    调用方给出不带扩展名的路径（例如 result/find_star/source_fixed）时，旧结果为 path + '.npy'
+    两者都支持 sources['xcentroid'] 和 sources[i]['xcentroid'] 的访问方式
+    """
+    if os.path.isdir(path):
+        return DetectionCatalog(path)
+    if not os.path.exists(path) and os.path.exists(path + '.npy'):
+        # np.load 不会自动补上 .npy
+        path = path + '.npy'
+    return np.load(path, allow_pickle=True)
+
+
+def load_detections(path: str, times_path: str | None = None) -> tuple:
+    """
+    读取逐帧检测结果：目录为列式存储，否则按旧的 pickle（每帧一个 astropy Table）读取
+    :return: (每帧一个 (n, 4) 数组, 每帧时间)
+    """
+    if os.path.isdir(path):
+        return read_detections(path)
+    from tracking import detections_to_array
+    with open(path, 'rb') as f:
+        tables = pickle.load(f)
+    times = np.load(times_path, allow_pickle=True) if times_path else np.full(len(tables), np.nan)
+    return [detections_to_array(t) for t in tables], times
+
+
+if __name__ == '__main__':
+
+    # 把旧的 pickle / npy 结果转换为列式存储
+    with open('result/little_star/diff_sources.pkl', 'rb') as f:
+        diff_sources = pickle.load(f)
+    times = np.load('result/little_star/times.npy', allow_pickle=True)
+    write_catalog('result/little_star/detections', diff_sources, times[:len(diff_sources)])
+    print(f'转换了 {len(diff_sources)} 帧的检测结果')
+
+    for name in ('source_fixed', 'source_percentile', 'source_statistics'):
+        sources = np.load(f'result/find_star/{name}.npy', allow_pickle=True)
+        write_catalog(f'result/find_star/{name}', [sources])
+        print(f'{name}: {len(sources)} 个星点')
@@ -1,6 +1,20 @@
 import os
+import re
 import numpy as np
-from astropy.stats import sigma_clipped_stats
+from astropy.io import fits
+
+import background
+import instrument
+
+# FFI 的去边框范围（行, 列），与 read_image_data 保持一致
+CROP = (slice(0, -45), slice(45, -45))
+# 读取帧时默认保留的头信息关键字（WCS 相关关键字总会保留）
+FRAME_HEADER_KEYS = ('TSTART', 'TSTOP', 'DATE-OBS', 'DQUALITY', 'CAMERA', 'CCD')
+WCS_KEY_PATTERN = re.compile(
+    r'^(NAXIS\d?|WCSAXES|CTYPE\d|CUNIT\d|CRVAL\d|CRPIX\d|CDELT\d|CROTA\d|CD\d_\d|PC\d_\d'
+    r'|RADESYS|EQUINOX|LONPOLE|LATPOLE|MJDREF[IF]?|A_ORDER|B_ORDER|AP_ORDER|BP_ORDER'
+    r'|A_DMAX|B_DMAX|A_\d+_\d+|B_\d+_\d+|AP_\d+_\d+|BP_\d+_\d+)$'
+)
 
 def get_fits_file_names(folder_path: str) -> list:
     try:
@@ -11,36 +25,57 @@ def get_fits_file_names(folder_path: str) -> list:
     res = [f for f in files if f.endswith('.fits')]
     return sorted(res)
 
-def read_image_data(fit_file_path: str) -> tuple[np.ndarray, dict]:
-    from astropy.io import fits
-    with fits.open(fit_file_path) as hdulist:
-        # 提取图像数据和头信息
-        image_data = hdulist[1].data
-        header = hdulist[1].header
-        # 去除边框
-        return image_data[0:-45, 45:-45], header
+def read_frame(fit_file_path: str, header_keys: tuple | None = FRAME_HEADER_KEYS) -> tuple[np.ndarray, fits.Header]:
+    """
+    以内存映射方式读取 FFI 的校准图像（HDU 1），去边框后返回零拷贝视图
+    :param fit_file_path: FITS 文件路径
+    :param header_keys: 需要保留的头信息关键字（WCS 关键字总会保留），为 None 时返回完整头信息
+    :return: 去边框后的图像视图和头信息
+    """
+    # 计时只包括头信息解析和建立映射，像素在使用时才从磁盘读入，所以只记帧数不记字节数
+    with instrument.stage('read_frame', items=1), fits.open(fit_file_path, memmap=True, lazy_load_hdus=True) as hdulist:
+        hdu = hdulist[1]
+        header = hdu.header
+        # 关闭文件后 mmap 仍被 data 引用，切片只是视图，不会复制像素
+        image_data = hdu.data[CROP]
+    if header_keys is not None:
+        header = fits.Header([card for card in header.cards
+                              if card.keyword in header_keys or WCS_KEY_PATTERN.match(card.keyword)])
+    return image_data, header
+
+def read_image_data(fit_file_path: str) -> tuple[np.ndarray, fits.Header]:
+    # 兼容旧接口：返回去边框图像和完整头信息
+    return read_frame(fit_file_path, header_keys=None)
 
 def fixed_clip_image_data(image_data: np.ndarray, a_min: float = 100, a_max: float = 400) -> np.ndarray:
     return np.clip(image_data, a_min=a_min, a_max=a_max)
 
-def stats_clip_image_data(image_data: np.ndarray, sigma: float = 3.0) -> np.ndarray:
-    mean, median, std = sigma_clipped_stats(image_data, sigma=sigma)
+def stats_clip_image_data(image_data: np.ndarray, sigma: float = 3.0, bkg_mode: str = 'exact', key=None) -> np.ndarray:
+    mean, median, std = background.background_stats(image_data, bkg_mode, sigma=sigma, key=key)
     vmin = median - 1 * std
     vmax = median + 5 * std
     return np.clip(image_data, vmin, vmax)
 
-def clip_image_data(image_data: np.ndarray) -> tuple:
-    clip_image_fixed = np.clip(image_data, a_min=100, a_max=400)
-
-    vmin = np.percentile(image_data, 1)  # 下限设为第1百分位
-    vmax = np.percentile(image_data, 99)  # 上限设为第99百分位
-    clip_image_percentile = np.clip(image_data, vmin, vmax)
-
-    mean, median, std = sigma_clipped_stats(image_data, sigma=3.0)
-    vmin = median - 1 * std
-    vmax = median + 5 * std
-    clip_image_statistics = np.clip(image_data, vmin, vmax)
+def clip_limits(image_data: np.ndarray, bkg_mode: str = 'exact', key=None) -> dict:
+    """
+    三种裁剪方式的上下限，只计算界限不复制图像（find_star.find_star_variants 在同一块缓冲区中依次裁剪）
+    :return: {'fixed': (vmin, vmax), 'percentile': (...), 'statistics': (...)}
+    """
+    # 下限设为第1百分位，上限设为第99百分位
+    p_min, p_max = np.percentile(image_data, [1, 99])
+    # 背景统计量可以与 find_star 共用（传入同一个 key）
+    mean, median, std = background.background_stats(image_data, bkg_mode, sigma=3.0, key=key)
+    return {
+        'fixed': (100, 400),
+        'percentile': (p_min, p_max),
+        'statistics': (median - 1 * std, median + 5 * std),
+    }
 
+def clip_image_data(image_data: np.ndarray, bkg_mode: str = 'exact', key=None) -> tuple:
+    limits = clip_limits(image_data, bkg_mode, key)
+    clip_image_fixed = np.clip(image_data, *limits['fixed'])
+    clip_image_percentile = np.clip(image_data, *limits['percentile'])
+    clip_image_statistics = np.clip(image_data, *limits['statistics'])
     return clip_image_fixed, clip_image_percentile, clip_image_statistics
 
 def get_fits_file_paths(folder: str) -> list:
@@ -49,6 +84,7 @@ def get_fits_file_paths(folder: str) -> list:
 
 if __name__ == '__main__':
 
+    instrument.start_run('file_utils')
     paths = get_fits_file_paths("data/")
 
     img_data, hdr = read_image_data(paths[0])
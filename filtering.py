@@ -0,0 +1,139 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.ndimage import median_filter
+
+import background
+
+# full: 整帧 scipy median_filter（原来的做法）
+# tiled: 整帧分块，由线程池并行滤波（scipy 滤波时释放 GIL），结果与 full 完全相同
+# sparse: 只对孔径窗口覆盖的分块滤波，其余像素不计算（为 0），测光结果与 full 相同
+MODES = ('full', 'tiled', 'sparse')
+# tiled 模式的分块边长
+TILE = 256
+# sparse 模式的分块边长，越小越贴合孔径
+SPARSE_TILE = 16
+# 孔径覆盖的区域超过整帧的这个比例时，sparse 模式直接分块滤波整帧
+SPARSE_MAX_COVER = 0.5
+
+
+def _filter_region(image_data: np.ndarray, out: np.ndarray, region: tuple, size: int):
+    """
+    对 [y0:y1, x0:x1] 区域滤波：读取时四周多取 size // 2 像素的晕，写回时去掉
+    晕贴着图像边缘时被截掉，由 median_filter 自己的边界处理（reflect）补齐，与整帧滤波相同
+    """
+    y0, y1, x0, x1 = region
+    h, w = image_data.shape
+    halo = size // 2
+    ry0, ry1 = max(y0 - halo, 0), min(y1 + halo, h)
+    rx0, rx1 = max(x0 - halo, 0), min(x1 + halo, w)
+    filtered = median_filter(image_data[ry0:ry1, rx0:rx1], size=size)
+    out[y0:y1, x0:x1] = filtered[y0 - ry0:y1 - ry0, x0 - rx0:x1 - rx0]
+
+
+def _run_regions(image_data: np.ndarray, regions: list, size: int, workers: int | None, out: np.ndarray | None):
+    if out is None:
+        out = np.empty_like(image_data)
+    workers = workers or os.cpu_count()
+    if workers <= 1 or len(regions) <= 1:
+        for region in regions:
+            _filter_region(image_data, out, region, size)
+        return out
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # 各分块写入 out 中互不重叠的部分
+        list(pool.map(lambda region: _filter_region(image_data, out, region, size), regions))
+    return out
+
+
+def tiled_median_filter(image_data: np.ndarray, size: int = 3, tile: int = TILE,
+                        workers: int | None = None, out: np.ndarray | None = None) -> np.ndarray:
+    """
+    分块并行的 median_filter(image_data, size)，每块带 size // 2 像素的晕，结果与整帧滤波逐像素相同
+    :param workers: 线程数，默认 CPU 核数
+    """
+    h, w = image_data.shape
+    regions = [(y, min(y + tile, h), x, min(x + tile, w)) for y in range(0, h, tile) for x in range(0, w, tile)]
+    return _run_regions(image_data, regions, size, workers, out)
+
+
+def aperture_regions(apertures, shape: tuple, tile: int = SPARSE_TILE,
+                     max_cover: float = SPARSE_MAX_COVER) -> list | None:
+    """
+    孔径（photometry.Apertures）窗口覆盖的分块，同一行中相邻的分块合并为一个区域，减少滤波调用次数
+    aperture_photometry 会取出窗口中的每个像素（包括权重为 0 的圆孔径角落和越界后指向 (0, 0) 的像素），
+    0 权重乘以未滤波的 nan 仍是 nan，所以整个窗口都要滤波，不能只取 weights > 0 的像素
+    :return: [(y0, y1, x0, x1)]，覆盖比例超过 max_cover 时为 None（星点不稀疏，整帧滤波更快）
+    """
+    ny, nx = -(-shape[0] // tile), -(-shape[1] // tile)
+    covered = np.zeros((ny, nx), dtype=bool)
+    covered[apertures.iy // tile, apertures.ix // tile] = True
+    if covered.mean() > max_cover:
+        return None
+    regions = []
+    for ty in range(ny):
+        # 每一行中连续被覆盖的分块段
+        row = np.concatenate([[False], covered[ty], [False]])
+        starts = np.flatnonzero(row[1:] & ~row[:-1])
+        ends = np.flatnonzero(~row[1:] & row[:-1])
+        for t0, t1 in zip(starts, ends):
+            regions.append((ty * tile, min((ty + 1) * tile, shape[0]), t0 * tile, min(t1 * tile, shape[1])))
+    return regions
+
+
+def sparse_median_filter(image_data: np.ndarray, regions: list, size: int = 3,
+                         workers: int | None = None, out: np.ndarray | None = None) -> np.ndarray:
+    """
+    只对 regions（见 aperture_regions）内的像素滤波，区域内结果与整帧滤波相同
+    区域外的像素没有写入：out 为 None 时新建的缓冲区为 0，传入 out 时保持原来的内容
+    """
+    if out is None:
+        out = np.zeros_like(image_data)
+    return _run_regions(image_data, regions, size, workers, out)
+
+
+def _reflect(index: np.ndarray, n: int) -> np.ndarray:
+    # scipy.ndimage 的 reflect 边界：-1 -> 0, n -> n - 1
+    index = np.where(index < 0, -index - 1, index)
+    return np.where(index >= n, 2 * n - index - 1, index)
+
+
+def sampled_median_filter(image_data: np.ndarray, step: int, size: int = 3) -> np.ndarray:
+    """
+    只计算滤波后图像在 [::step, ::step] 抽样点上的值，等于 median_filter(image_data, size)[::step, ::step]
+    供 fast 背景估计使用（见 background.sample_step），不需要整帧滤波
+    """
+    h, w = image_data.shape
+    ys, xs = np.arange(0, h, step), np.arange(0, w, step)
+    offsets = np.arange(size) - size // 2
+    iy = _reflect(ys[:, None] + offsets, h)
+    ix = _reflect(xs[:, None] + offsets, w)
+    # (行数, 列数, size, size) 的邻域
+    neighbours = image_data[iy[:, None, :, None], ix[None, :, None, :]]
+    neighbours = neighbours.reshape(len(ys), len(xs), size * size)
+    # 与 median_filter 相同，取排序后第 size * size // 2 个值
+    rank = size * size // 2
+    return np.partition(neighbours, rank, axis=2)[..., rank]
+
+
+def filter_frame(image_data: np.ndarray, mode: str = 'full', regions: list | None = None,
+                 bkg_mode: str = 'exact', size: int = 3, workers: int | None = None) -> tuple:
+    """
+    光度提取前的中值滤波，并给出用于背景估计的图像
+    sparse 模式只有 fast 背景可以在抽样点上单独计算；其他背景方式需要整帧滤波后的图像，此时退回 tiled
+    :param regions: sparse 模式下孔径覆盖的区域（aperture_regions），为 None 时退回 tiled
+    :return: (滤波后的图像, 传给 background.background_stats 的图像)
+    """
+    if mode == 'full':
+        filtered = median_filter(image_data, size=size)
+        return filtered, filtered
+    if mode == 'tiled':
+        filtered = tiled_median_filter(image_data, size, workers=workers)
+        return filtered, filtered
+    if mode != 'sparse':
+        raise ValueError(f'未知的滤波方式: {mode}，可选 {MODES}')
+    if bkg_mode != 'fast' or regions is None:
+        filtered = tiled_median_filter(image_data, size, workers=workers)
+        return filtered, filtered
+    filtered = sparse_median_filter(image_data, regions, size, workers)
+    return filtered, sampled_median_filter(image_data, background.sample_step(image_data.shape), size)
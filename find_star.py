@@ -1,47 +1,143 @@
-from photutils.detection import DAOStarFinder
-from astropy.stats import sigma_clipped_stats
+import warnings
+from collections import namedtuple
+
+from photutils.detection import DAOStarFinder, find_peaks
+from photutils.utils import NoDetectionsWarning
 import numpy as np
+from scipy import ndimage
 
+import background
+import detections
 import file_utils
+import instrument
+import sky
 import json
 
-def find_star(image_data, fwhm=3.0, threshold_factor=5.0) -> np.ndarray:
-    # 估算背景与噪声
-    mean, median, std = sigma_clipped_stats(image_data, sigma=3.0)
-    # 找星（设置合适的阈值）
-    daofind = DAOStarFinder(fwhm=fwhm, threshold=threshold_factor * std)
-    # 使用背景减去中位数来提高星点检测的准确性
-    return daofind(image_data - median)
+# 一种找星设置：裁剪上下限（None 表示不裁剪）和阈值倍数
+Variant = namedtuple('Variant', ['name', 'limits', 'threshold_factor'])
+
+
+def _subtract_background(data: np.ndarray, bkg_mode: str, key=None) -> float:
+    # 原地减去背景，返回噪声
+    mean, median, std = background.background_stats(data, bkg_mode, key=key)
+    if bkg_mode == 'mesh':
+        data -= background.background_map(data, key=key).background
+    else:
+        data -= median
+    return std
+
+
+def _shared_peaks(data: np.ndarray, fwhm: float, threshold: float):
+    """
+    与 DAOStarFinder 相同的找峰：用它的卷积核对图像卷积（边界补 0），在核的足迹内找局部最大值
+    :param threshold: 组内最低的阈值，更高阈值的峰是这些峰的子集
+    :return: (峰的表（没有峰时为 None）, 卷积核的 relerr)，峰值超过 阈值 * relerr 的峰与 DAOStarFinder 找到的相同
+    """
+    kernel = DAOStarFinder(fwhm=fwhm, threshold=threshold).kernel
+    convolved = ndimage.convolve(data, kernel.data, mode='constant', cval=0.0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', NoDetectionsWarning)
+        peaks = find_peaks(convolved, threshold * kernel.relerr, footprint=kernel.mask.astype(bool))
+    return peaks, kernel.relerr
+
+
+def find_star_variants(image_data, variants, fwhm=3.0, bkg_mode='exact', key=None,
+                       sharpness_min=None, roundness_max=None) -> dict:
+    """
+    一次找星计算多种裁剪方式 / 阈值的星表
+    所有裁剪方式在同一块缓冲区中裁剪和减背景，不保留裁剪后的图像副本；裁剪上下限相同的设置共用这块缓冲区，
+    并且只在最低阈值下找一次峰，每个阈值从中选出超过阈值的峰交给 DAOStarFinder(xycoords=...) 计算星表
+    只使用 photutils 的公开接口（DAOStarFinder、find_peaks），不依赖其内部实现
+    :param variants: Variant 列表，limits 为 None 时使用原始图像
+    :param key: 原始图像的缓存键（见 background.background_stats），裁剪后的图像不使用缓存
+    :param sharpness_min: 给出时只保留 sharpness 大于该值的星点
+    :param roundness_max: 给出时只保留 |roundness1| 小于该值的星点
+    :return: {名称: 星表（没有星点时为 None）}，与分别调用 find_star 的结果相同
+    """
+    data = np.empty(image_data.shape, dtype=np.result_type(image_data.dtype, np.float32))
+
+    groups = {}
+    for variant in variants:
+        groups.setdefault(variant.limits, []).append(variant)
+
+    result = {}
+    for limits, group in groups.items():
+        with instrument.stage('find_star.clip_background', nbytes=data.nbytes):
+            if limits is None:
+                np.copyto(data, image_data)
+                std = _subtract_background(data, bkg_mode, key)
+            else:
+                np.clip(image_data, *limits, out=data)
+                std = _subtract_background(data, bkg_mode)
+        # 组内只有一个阈值时由 DAOStarFinder 自己找峰，多个阈值时共用一次找峰
+        peaks = None
+        if len(group) > 1:
+            with instrument.stage('find_star.peaks', nbytes=data.nbytes) as s:
+                peaks, relerr = _shared_peaks(data, fwhm, min(v.threshold_factor for v in group) * std)
+                s.items = 0 if peaks is None else len(peaks)
+        for variant in group:
+            threshold = variant.threshold_factor * std
+            with instrument.stage('find_star.daofind', nbytes=data.nbytes) as s:
+                if len(group) == 1:
+                    table = DAOStarFinder(fwhm=fwhm, threshold=threshold)(data)
+                else:
+                    # find_peaks 只保留严格大于阈值的峰
+                    above = None if peaks is None else peaks[peaks['peak_value'] > threshold * relerr]
+                    table = None if above is None or not len(above) else DAOStarFinder(
+                        fwhm=fwhm, threshold=threshold,
+                        xycoords=np.transpose((above['x_peak'], above['y_peak'])))(data)
+                s.items = 0 if table is None else len(table)
+            if table is None:
+                result[variant.name] = None
+                continue
+            if sharpness_min is not None:
+                table = table[table['sharpness'] > sharpness_min]
+            if roundness_max is not None:
+                table = table[np.abs(table['roundness1']) < roundness_max]
+            result[variant.name] = table
+    return {variant.name: result[variant.name] for variant in variants}
+
+
+def find_star(image_data, fwhm=3.0, threshold_factor=5.0, bkg_mode='exact', key=None) -> np.ndarray:
+    # 估算背景与噪声（bkg_mode 见 background.MODES，给出 key 时与其他阶段共用同一帧的结果）
+    # 减去背景后找星（设置合适的阈值）：mesh 减去网格背景图，适合背景不均匀的图像；其他方式减去中位数
+    return find_star_variants(image_data, [Variant('origin', None, threshold_factor)],
+                              fwhm, bkg_mode, key)['origin']
+
+
+def clip_variants(image_data, threshold_factor=5.0, bkg_mode='exact', key=None) -> list:
+    # find_star.py 使用的四种设置：原始图像和 file_utils.clip_image_data 的三种裁剪
+    limits = file_utils.clip_limits(image_data, bkg_mode, key)
+    return [Variant('origin', None, threshold_factor)] + [
+        Variant(name, limits[name], threshold_factor) for name in ('fixed', 'percentile', 'statistics')]
 
 if __name__ == '__main__':
 
+    instrument.start_run('find_star')
     paths = file_utils.get_fits_file_paths('data/')
 
     FILE_NUM = 49  # 选择要处理的文件编号
-    img_data, hdr = file_utils.read_image_data(paths[FILE_NUM])  # 选择第50张图像
-
-    clip_image_fixed, clip_image_percentile, clip_image_statistics = file_utils.clip_image_data(img_data)
-
-    source0 = find_star(img_data)
-    source1 = find_star(clip_image_fixed)
-    source2 = find_star(clip_image_percentile)
-    source3 = find_star(clip_image_statistics)
+    img_data, hdr = file_utils.read_frame(paths[FILE_NUM])  # 选择第50张图像
 
-    # 过滤 sharpness 太低 或 roundness1 太大的星点
+    BKG_MODE = 'fast'  # 背景估计方式，见 background.MODES
+    frame_key = paths[FILE_NUM]
+    # 背景、裁剪界限和卷积核只算一次，四种设置依次在同一块缓冲区中找星并过滤 sharpness 太低 或 roundness1 太大的星点
     roundness_threshold = 0.5
     sharpness_threshold = 0.3
-    source0 = source0[(source0['sharpness'] > sharpness_threshold) & (np.abs(source0['roundness1']) < roundness_threshold)]
-    source1 = source1[(source1['sharpness'] > sharpness_threshold) & (np.abs(source1['roundness1']) < roundness_threshold)]
-    source2 = source2[(source2['sharpness'] > sharpness_threshold) & (np.abs(source2['roundness1']) < roundness_threshold)]
-    source3 = source3[(source3['sharpness'] > sharpness_threshold) & (np.abs(source3['roundness1']) < roundness_threshold)]
+    sources = find_star_variants(img_data, clip_variants(img_data, bkg_mode=BKG_MODE, key=frame_key),
+                                 bkg_mode=BKG_MODE, key=frame_key,
+                                 sharpness_min=sharpness_threshold, roundness_max=roundness_threshold)
+    source0, source1, source2, source3 = (sources[name] for name in ('origin', 'fixed', 'percentile', 'statistics'))
 
     # 将 header 保存到json文件
     with open(f'result/find_star/header_{FILE_NUM}.json', 'w') as f:
         json.dump(dict(hdr), f, indent=4)
 
-    np.save('result/find_star/source_fixed.npy', source1)
-    np.save('result/find_star/source_percentile.npy', source2)
-    np.save('result/find_star/source_statistics.npy', source3)
+    # 以列式存储保存（内存映射读取，不需要 pickle），见 detections.py
+    for name in ('fixed', 'percentile', 'statistics'):
+        detections.write_catalog(f'result/find_star/source_{name}', [sources[name]])
+        # 天球坐标与星点表一起保存，后续交叉匹配不需要再换算
+        sky.write_sky_coords(f'result/find_star/source_{name}', hdr)
 
     print(f'原始图像找到 {len(source0)} 个星点')
     print(f'固定值裁剪找到 {len(source1)} 个星点')
@@ -69,7 +165,7 @@ if __name__ == '__main__':
     # plt.title('Original Image Stars')
     # plt.legend()
     # plt.subplot(2, 2, 2)
-    plt.imshow(clip_image_fixed, origin='lower')
+    plt.imshow(file_utils.fixed_clip_image_data(img_data), origin='lower')
     plt.scatter(top_flux_fixed['xcentroid'],
                 top_flux_fixed['ycentroid'],
                 s=top_flux_fixed['npix'],
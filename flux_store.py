@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+from astropy.io import fits
+
+# 光度按帧追加：每帧所有星的光度（float32）依次写到 fluxes.f4 末尾，frames.tsv 每行记录一帧的文件名和 TSTART
+FLUX_FILE = 'fluxes.f4'
+FRAMES_FILE = 'frames.tsv'
+META_FILE = 'meta.json'
+
+
+def store_signature(xs, ys, params: dict) -> str:
+    """
+    星点位置和测光参数的摘要：星数不变但位置或孔径、背景、滤波设置变化时，已有的列不能再与新帧拼接
+    :param params: 影响光度数值的参数（可 JSON 序列化）
+    """
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(xs, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(ys, dtype=np.float64).tobytes())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def read_tstart(path: str) -> float:
+    # 只解析校准 HDU 的头信息，不读取像素
+    return float(fits.getheader(path, 1)['TSTART'])
+
+
+class FluxStore:
+    """
+    可追加的光度存储：星点集合固定，每处理一帧追加一列，已处理的帧按 (文件名, TSTART) 记录
+    先写光度再写帧记录，中断后重新打开时按帧记录截断多写的光度
+    """
+
+    def __init__(self, store_dir: str, n_stars: int, signature: str | None = None):
+        """
+        :param signature: 星点位置和测光参数的摘要（store_signature），与存储中记录的不同时抛出 ValueError
+        """
+        os.makedirs(store_dir, exist_ok=True)
+        self.store_dir = store_dir
+        meta_path = os.path.join(store_dir, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta['n_stars'] != n_stars:
+                raise ValueError(f'光度存储 {store_dir} 中有 {meta["n_stars"]} 颗星，当前星点表有 {n_stars} 颗，'
+                                 f'星点表变化后需要删除存储重新提取')
+            if signature is not None and meta.get('signature') != signature:
+                raise ValueError(f'光度存储 {store_dir} 的星点位置或测光参数与当前不同（或存储没有记录摘要），'
+                                 f'需要删除存储重新提取')
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump({'n_stars': n_stars, 'signature': signature}, f)
+        self.n_stars = n_stars
+        self.names, self.times = [], []
+        frames_path = os.path.join(store_dir, FRAMES_FILE)
+        if os.path.exists(frames_path):
+            with open(frames_path) as f:
+                for line in f:
+                    name, time = line.rstrip('\n').split('\t')
+                    self.names.append(name)
+                    self.times.append(float(time))
+        flux_path = os.path.join(store_dir, FLUX_FILE)
+        if os.path.exists(flux_path):
+            os.truncate(flux_path, len(self.names) * n_stars * 4)
+        self._seen_names = set(self.names)
+        self._seen_times = set(self.times)
+
+    @property
+    def n_frames(self) -> int:
+        return len(self.names)
+
+    def new_frames(self, paths: list) -> list:
+        """
+        还没有处理过的帧：文件名没有出现过、且 TSTART 也没有出现过（同一帧换了文件名不重复处理）
+        已经处理过的文件名不读取头信息，没有新数据时几乎不花时间
+        """
+        new = []
+        for path in paths:
+            name = os.path.basename(path)
+            if name in self._seen_names:
+                continue
+            if read_tstart(path) in self._seen_times:
+                continue
+            new.append(path)
+        return new
+
+    def append(self, paths: list, fluxes: np.ndarray, times: list):
+        """
+        追加若干帧
+        :param fluxes: (stars × frames) 的光度，列与 paths 一一对应
+        """
+        fluxes = np.asarray(fluxes, dtype=np.float32)
+        with open(os.path.join(self.store_dir, FLUX_FILE), 'ab') as f:
+            # 按帧存放，追加时只需写到文件末尾
+            f.write(np.ascontiguousarray(fluxes.T).tobytes())
+        with open(os.path.join(self.store_dir, FRAMES_FILE), 'a') as f:
+            for path, time in zip(paths, times):
+                f.write(f'{os.path.basename(path)}\t{float(time)!r}\n')
+        for path, time in zip(paths, times):
+            self.names.append(os.path.basename(path))
+            self.times.append(float(time))
+            self._seen_names.add(os.path.basename(path))
+            self._seen_times.add(float(time))
+
+    def read(self) -> tuple:
+        """
+        :return: (stars × frames) float32 光度数组和时间数组，帧按 TSTART 排序（新帧不一定按时间顺序到达）
+        """
+        path = os.path.join(self.store_dir, FLUX_FILE)
+        if self.n_frames == 0:
+            return np.empty((self.n_stars, 0), dtype=np.float32), np.empty(0)
+        by_frame = np.memmap(path, dtype=np.float32, mode='r', shape=(self.n_frames, self.n_stars))
+        order = np.argsort(self.times, kind='stable')
+        return np.ascontiguousarray(by_frame[order].T), np.asarray(self.times)[order]
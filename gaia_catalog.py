@@ -0,0 +1,257 @@
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from astropy.table import Table
+from scipy.spatial import cKDTree
+
+# 本地缓存目录：每个天区一个子目录，保存该天区内的 Gaia 源和变星分类结果
+CACHE_DIR = 'result/gaia_cache'
+# 与原来逐颗 cone search 相同的匹配半径（角秒）
+MATCH_RADIUS = 100.0
+# 天区半径在星点覆盖范围外再放宽的量（度）
+MARGIN = MATCH_RADIUS / 3600
+# 只取比这个 G 星等亮的源：TESS FFI 上能找到并测光的星大约比 T = 16 亮（G 比 T 约暗 0.5 等），
+# 一个相机的天区（半径约 8.5 度）全部 gaia_source 约 10^7 行，G <= 17 时约少一个数量级
+MAX_G_MAG = 17.0
+SOURCE_COLUMNS = ('source_id', 'ra', 'dec', 'phot_g_mean_mag')
+CLASS_COLUMNS = ('source_id', 'best_class_name', 'best_class_score', 'classifier_name')
+
+# max_mag 为 G 星等上限，None 表示不限（旧的缓存条目）
+Region = namedtuple('Region', ['ra', 'dec', 'radius', 'max_mag'], defaults=[None])
+
+
+def unit_vectors(ra, dec) -> np.ndarray:
+    # 赤经赤纬（度）转为单位球面上的三维坐标，球面最近邻等价于三维欧氏最近邻
+    ra, dec = np.radians(np.asarray(ra, dtype=np.float64)), np.radians(np.asarray(dec, dtype=np.float64))
+    return np.column_stack([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)])
+
+
+def _separation(ra1, dec1, ra2, dec2):
+    # 角距离（度），使用 Vincenty 公式，小角度时也稳定
+    v1, v2 = unit_vectors(ra1, dec1), unit_vectors(ra2, dec2)
+    cross = np.linalg.norm(np.cross(v1, v2), axis=1)
+    return np.degrees(np.arctan2(cross, np.sum(v1 * v2, axis=1)))
+
+
+def footprint(ra, dec, margin: float = MARGIN, max_mag: float | None = MAX_G_MAG) -> Region:
+    """
+    覆盖一组坐标（星点或帧的四角）的最小外接圆近似
+    :param max_mag: 天区星表的 G 星等上限，None 表示不限
+    :return: Region(圆心赤经, 圆心赤纬, 半径, G 星等上限)，单位为度
+    """
+    v = unit_vectors(ra, dec).mean(axis=0)
+    v /= np.linalg.norm(v)
+    ra0 = float(np.degrees(np.arctan2(v[1], v[0])) % 360)
+    dec0 = float(np.degrees(np.arcsin(v[2])))
+    radius = float(_separation(ra0, dec0, ra, dec).max()) + margin
+    return Region(ra0, dec0, radius, max_mag)
+
+
+def _region_key(region: Region) -> str:
+    mag = '' if region.max_mag is None else f'g{region.max_mag:.1f}'
+    return f'{region.ra:08.4f}{region.dec:+08.4f}r{region.radius:.4f}{mag}'
+
+
+def _covers(outer: Region, inner: Region) -> bool:
+    # 星等上限不同的星表匹配结果不同，不能互相替代
+    return outer.max_mag == inner.max_mag and _separation(outer.ra, outer.dec, inner.ra, inner.dec)[0] + inner.radius <= outer.radius
+
+
+class GaiaCatalog:
+    """
+    一个天区内的 Gaia 源（source_id, ra, dec, phot_g_mean_mag）和 vari_classifier_result 分类结果
+    建立球面 KD 树，一次匹配所有星点
+    """
+
+    def __init__(self, region: Region, sources: dict, classes: dict):
+        self.region = region
+        self.sources = {c: np.asarray(sources[c]) for c in SOURCE_COLUMNS}
+        order = np.argsort(classes['source_id'])
+        self.classes = {c: np.asarray(classes[c])[order] for c in CLASS_COLUMNS}
+        self._tree = cKDTree(unit_vectors(self.sources['ra'], self.sources['dec']))
+
+    def __len__(self):
+        return len(self.sources['source_id'])
+
+    def match(self, ra, dec, max_sep: float = MATCH_RADIUS) -> tuple:
+        """
+        每个坐标匹配最近的 Gaia 源
+        :param max_sep: 最大匹配距离（角秒）
+        :return: (匹配到的源在 sources 中的序号，未匹配为 -1, 距离（角秒），未匹配为 nan)
+        """
+        chord = 2 * np.sin(np.radians(max_sep / 3600) / 2)
+        dist, idx = self._tree.query(unit_vectors(ra, dec), distance_upper_bound=chord)
+        found = np.isfinite(dist)
+        idx = np.where(found, idx, -1)
+        sep = np.full(len(idx), np.nan)
+        sep[found] = np.degrees(2 * np.arcsin(dist[found] / 2)) * 3600
+        return idx, sep
+
+    def classify(self, source_ids) -> dict:
+        """
+        按 source_id 查找变星分类结果，没有分类的源 best_class_name 为空字符串、分数为 nan
+        """
+        source_ids = np.asarray(source_ids, dtype=np.int64)
+        known = self.classes['source_id']
+        if len(known) == 0:
+            n = len(source_ids)
+            return {'best_class_name': np.full(n, ''), 'best_class_score': np.full(n, np.nan),
+                    'classifier_name': np.full(n, '')}
+        pos = np.minimum(np.searchsorted(known, source_ids), len(known) - 1)
+        hit = known[pos] == source_ids
+        return {
+            'best_class_name': np.where(hit, self.classes['best_class_name'][pos], ''),
+            'best_class_score': np.where(hit, self.classes['best_class_score'][pos], np.nan),
+            'classifier_name': np.where(hit, self.classes['classifier_name'][pos], ''),
+        }
+
+    def crossmatch(self, ra, dec, max_sep: float = MATCH_RADIUS) -> dict:
+        """
+        匹配并附上分类结果，返回按列的 dict（可直接交给 pandas.DataFrame）
+        """
+        idx, sep = self.match(ra, dec, max_sep)
+        found = idx >= 0
+        source_id = np.where(found, self.sources['source_id'][np.maximum(idx, 0)], -1)
+        result = {'source_id': source_id, 'ra': np.asarray(ra), 'dec': np.asarray(dec), 'dist': sep}
+        result.update(self.classify(source_id))
+        return result
+
+    def save(self, cache_dir: str = CACHE_DIR) -> str:
+        path = os.path.join(cache_dir, _region_key(self.region))
+        os.makedirs(path, exist_ok=True)
+        np.savez(os.path.join(path, 'sources.npz'), **self.sources)
+        np.savez(os.path.join(path, 'classes.npz'), **self.classes)
+        with open(os.path.join(path, 'region.json'), 'w') as f:
+            json.dump(self.region._asdict(), f)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'GaiaCatalog':
+        with open(os.path.join(path, 'region.json')) as f:
+            region = Region(**json.load(f))
+        with np.load(os.path.join(path, 'sources.npz')) as s, np.load(os.path.join(path, 'classes.npz')) as c:
+            return cls(region, dict(s), dict(c))
+
+
+def cached_regions(cache_dir: str = CACHE_DIR) -> list:
+    # 缓存中所有天区：[(Region, 目录)]
+    if not os.path.isdir(cache_dir):
+        return []
+    regions = []
+    for name in sorted(os.listdir(cache_dir)):
+        meta = os.path.join(cache_dir, name, 'region.json')
+        if os.path.exists(meta):
+            with open(meta) as f:
+                regions.append((Region(**json.load(f)), os.path.join(cache_dir, name)))
+    return regions
+
+
+def _select(table: Table, region: Region) -> Table:
+    # 只保留天区内且不暗于星等上限的行（与在线查询的条件相同，没有星等列的表不按星等筛选）
+    keep = _separation(region.ra, region.dec, table['ra'], table['dec']) <= region.radius
+    if region.max_mag is not None and 'phot_g_mean_mag' in table.colnames:
+        keep &= _filled(table['phot_g_mean_mag'], np.nan) <= region.max_mag
+    return table[keep]
+
+
+def _filled(column, value) -> np.ndarray:
+    # 在线查询结果和本地文件中的空值是掩码列
+    return np.asarray(column.filled(value) if hasattr(column, 'filled') else column)
+
+
+def from_table(table: Table, region: Region) -> GaiaCatalog:
+    """
+    由一张表（本地替代星表或在线查询结果）建立天区星表
+    表中须有 source_id / ra / dec，可选 phot_g_mean_mag 和分类列 best_class_name / best_class_score / classifier_name
+    """
+    table = _select(table, region)
+    n = len(table)
+    sources = {
+        'source_id': np.asarray(table['source_id'], dtype=np.int64),
+        'ra': np.asarray(table['ra'], dtype=np.float64),
+        'dec': np.asarray(table['dec'], dtype=np.float64),
+        'phot_g_mean_mag': (_filled(table['phot_g_mean_mag'], np.nan).astype(np.float32)
+                            if 'phot_g_mean_mag' in table.colnames else np.full(n, np.nan, dtype=np.float32)),
+    }
+    if 'best_class_name' in table.colnames:
+        name = _filled(table['best_class_name'], '').astype(str)
+        keep = name != ''
+        classes = {
+            'source_id': sources['source_id'][keep],
+            'best_class_name': name[keep],
+            'best_class_score': _filled(table['best_class_score'], np.nan).astype(np.float64)[keep],
+            'classifier_name': (_filled(table['classifier_name'], '').astype(str)[keep]
+                                if 'classifier_name' in table.colnames else np.full(keep.sum(), '')),
+        }
+    else:
+        classes = {'source_id': np.empty(0, dtype=np.int64), 'best_class_name': np.empty(0, dtype=str),
+                   'best_class_score': np.empty(0), 'classifier_name': np.empty(0, dtype=str)}
+    return GaiaCatalog(region, sources, classes)
+
+
+def fetch_region(region: Region) -> GaiaCatalog:
+    """
+    在线查询一个天区：一次取回天区内比 region.max_mag 亮的 Gaia 源，再一次取回其中的变星分类结果
+    """
+    from astroquery.gaia import Gaia
+    circle = f"CIRCLE('ICRS', {region.ra}, {region.dec}, {region.radius})"
+    mag = '' if region.max_mag is None else f'AND g.phot_g_mean_mag <= {region.max_mag}'
+    sources = Gaia.launch_job_async(f"""
+        SELECT g.source_id, g.ra, g.dec, g.phot_g_mean_mag
+        FROM gaiadr3.gaia_source AS g
+        WHERE 1 = CONTAINS(POINT('ICRS', g.ra, g.dec), {circle}) {mag}
+    """).get_results()
+    classes = Gaia.launch_job_async(f"""
+        SELECT v.source_id, v.best_class_name, v.best_class_score, v.classifier_name
+        FROM gaiadr3.vari_classifier_result AS v
+        JOIN gaiadr3.gaia_source AS g ON g.source_id = v.source_id
+        WHERE 1 = CONTAINS(POINT('ICRS', g.ra, g.dec), {circle}) {mag}
+    """).get_results()
+    sources.rename_columns(sources.colnames, [c.lower() for c in sources.colnames])
+    classes.rename_columns(classes.colnames, [c.lower() for c in classes.colnames])
+    catalog = from_table(sources, region)
+    return GaiaCatalog(region, catalog.sources, {
+        'source_id': np.asarray(classes['source_id'], dtype=np.int64),
+        'best_class_name': _filled(classes['best_class_name'], '').astype(str),
+        'best_class_score': _filled(classes['best_class_score'], np.nan).astype(np.float64),
+        'classifier_name': _filled(classes['classifier_name'], '').astype(str),
+    })
+
+
+def get_catalog(region: Region, cache_dir: str = CACHE_DIR, local_catalog: str | None = None) -> GaiaCatalog:
+    """
+    取得覆盖 region 的星表：优先使用缓存中包含该天区的条目，否则从本地文件导入或在线查询，并写入缓存
+    :param local_catalog: 本地替代星表文件（astropy Table.read 能读取的格式，如 csv / ecsv / fits），给出时不联网
+    """
+    for cached, path in cached_regions(cache_dir):
+        if _covers(cached, region):
+            return GaiaCatalog.load(path)
+    if local_catalog is not None:
+        catalog = from_table(Table.read(local_catalog), region)
+    else:
+        catalog = fetch_region(region)
+    catalog.save(cache_dir)
+    return catalog
+
+
+# feat_classify.csv 的列，classify_star 和 query_star 都按这个格式整体重写（带表头）
+CLASSIFY_COLUMNS = ['id', 'source_id', 'ra', 'dec', 'best_class_name', 'best_class_score', 'dist']
+
+
+def write_classification(path: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    按 CLASSIFY_COLUMNS 写出分类结果：没有匹配的 source_id 写为 '未找到'，匹配到但没有分类的写为 '未分类'
+    :param df: 包含 id 和 crossmatch 结果各列的表（source_id 为 -1 表示没有匹配）
+    """
+    df = df.copy()
+    found = df['source_id'] >= 0
+    df['source_id'] = df['source_id'].astype(object).where(found, '未找到')
+    unclassified = found & (df['best_class_name'] == '')
+    df['best_class_score'] = df['best_class_score'].astype(object)
+    df.loc[unclassified, ['best_class_name', 'best_class_score']] = '未分类'
+    df = df[CLASSIFY_COLUMNS]
+    df.to_csv(path, index=False)
+    return df
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+import instrument
+
+# 每个 IN (...) 查询包含的 source_id 数，同步查询最多返回 2000 行
+BATCH_SIZE = 500
+# 同时进行的查询数
+CONCURRENCY = 4
+# 失败重试次数和退避的基础等待时间（秒），第 k 次重试等待 BACKOFF * 2**k 加随机抖动
+RETRIES = 4
+BACKOFF = 1.0
+CLASSIFY_QUERY = """
+    SELECT source_id, best_class_name, best_class_score, classifier_name
+    FROM gaiadr3.vari_classifier_result
+    WHERE source_id IN ({ids})
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def tap_runner(url: str | None = None):
+    """
+    返回一个同步执行 ADQL 的函数 run(query) -> astropy Table
+    :param url: TAP 服务地址（如本地模拟服务），为 None 时使用 Gaia 存档
+    """
+    if url is None:
+        from astroquery.gaia import Gaia
+        tap = Gaia
+    else:
+        from astroquery.utils.tap.core import TapPlus
+        tap = TapPlus(url=url)
+
+    def run(query: str):
+        return tap.launch_job(query).get_results()
+    return run
+
+
+class QueryState:
+    """
+    断点状态：已完成查询的 source_id 追加写入一个 int64 二进制文件，结果行追加写入 csv
+    先写结果再写状态，中断后重新运行时状态中没有的批次会重新查询，结果中的重复行在读取时去掉
+    """
+
+    def __init__(self, state_path: str, results_path: str):
+        self.state_path = state_path
+        self.results_path = results_path
+        os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+        os.makedirs(os.path.dirname(results_path) or '.', exist_ok=True)
+        done = np.fromfile(state_path, dtype=np.int64) if os.path.exists(state_path) else np.empty(0, np.int64)
+        self.done = np.unique(done)
+
+    def pending(self, source_ids) -> np.ndarray:
+        # 还没有查询过的 source_id（去重、保持原顺序）
+        source_ids = np.asarray(source_ids, dtype=np.int64)
+        _, first = np.unique(source_ids, return_index=True)
+        source_ids = source_ids[np.sort(first)]
+        return source_ids[~np.isin(source_ids, self.done)]
+
+    def commit(self, source_ids: np.ndarray, rows: pd.DataFrame):
+        if len(rows):
+            rows.to_csv(self.results_path, mode='a', index=False,
+                        header=not os.path.exists(self.results_path) or os.path.getsize(self.results_path) == 0)
+        with open(self.state_path, 'ab') as f:
+            f.write(np.asarray(source_ids, dtype=np.int64).tobytes())
+
+    def results(self) -> pd.DataFrame:
+        if not os.path.exists(self.results_path) or os.path.getsize(self.results_path) == 0:
+            return pd.DataFrame()
+        return pd.read_csv(self.results_path).drop_duplicates()
+
+
+async def _run_batch(run, batch: np.ndarray, query: str, semaphore: asyncio.Semaphore,
+                     retries: int, backoff: float) -> tuple:
+    """
+    执行一个批次，失败时按指数退避重试
+    :return: (批次的 source_id, 结果表，重试用完仍失败时为 None)
+    """
+    query = query.format(ids=','.join(map(str, batch)))
+    async with semaphore:
+        for attempt in range(retries + 1):
+            try:
+                # astroquery 是同步接口，放到线程中执行
+                t0 = time.perf_counter()
+                table = await asyncio.to_thread(run, query)
+                instrument.record('gaia_client.batch', time.perf_counter() - t0, items=len(batch))
+                return batch, table
+            except Exception as e:
+                if attempt == retries:
+                    logger.error(f'批次查询失败（{len(batch)} 个 source_id）：{e}')
+                    return batch, None
+                delay = backoff * 2 ** attempt * (1 + random.random())
+                logger.warning(f'查询失败（{e}），{delay:.1f} 秒后第 {attempt + 1} 次重试')
+                await asyncio.sleep(delay)
+
+
+async def _query_batches(batches: list, run, state: QueryState, query: str,
+                         concurrency: int, retries: int, backoff: float) -> list:
+    # 所有批次同时提交，由信号量限制并发数；每完成一批立即写入断点状态
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [_run_batch(run, b, query, semaphore, retries, backoff) for b in batches]
+    failed = []
+    for task in asyncio.as_completed(tasks):
+        batch, table = await task
+        if table is None:
+            failed.append(batch)
+            continue
+        rows = table.to_pandas()
+        rows.columns = [c.lower() for c in rows.columns]
+        state.commit(batch, rows)
+    return failed
+
+
+def query_source_ids(source_ids, state_path: str, results_path: str, query: str = CLASSIFY_QUERY,
+                     batch_size: int = BATCH_SIZE, concurrency: int = CONCURRENCY, retries: int = RETRIES,
+                     backoff: float = BACKOFF, run=None) -> pd.DataFrame:
+    """
+    按 source_id 批量查询 Gaia（默认查询 vari_classifier_result），可中断后继续
+    :param query: 含 {ids} 占位符的 ADQL，{ids} 替换为逗号分隔的 source_id
+    :param state_path: 断点状态文件，记录已完成查询的 source_id
+    :param results_path: 结果 csv，每完成一批追加写入
+    :param run: 执行 ADQL 的函数，默认 tap_runner()（Gaia 存档）
+    :return: 所有已完成批次的结果（包括以前运行中完成的）
+    """
+    state = QueryState(state_path, results_path)
+    pending = state.pending(source_ids)
+    batches = [pending[k:k + batch_size] for k in range(0, len(pending), batch_size)]
+    if batches:
+        run = run or tap_runner()
+        failed = asyncio.run(_query_batches(batches, run, state, query, concurrency, retries, backoff))
+        if failed:
+            logger.error(f'{len(failed)} 个批次重试后仍然失败，下次运行时会重新查询')
+    return state.results()
@@ -1,44 +1,225 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
 import numpy as np
-from astropy.io import fits
+from astropy.table import vstack
 from photutils.detection import DAOStarFinder
-from astropy.stats import sigma_clipped_stats
 from tqdm import tqdm
-import pickle
 
+import background
 import file_utils
+import instrument
+import sky
+from detections import DetectionWriter
 
 
 def get_diffs(paths: list) -> tuple:
-    diffs, images, times = [], [], []
+    diffs, times = [], []
+    prev = None
     for file in paths:
-        hdu = fits.open(file)[1]
-        images.append(hdu.data)
-        times.append(hdu.header['TSTART'])  # 或 DATE-OBS / BJD
-    for i in range(len(images) - 1):
-        diff = images[i + 1] - images[i]
-        diffs.append(diff)
+        # 只保留上一帧的内存映射视图，避免同时打开所有文件
+        image_data, header = file_utils.read_frame(file)
+        times.append(header['TSTART'])  # 或 DATE-OBS / BJD
+        if prev is not None:
+            diffs.append(image_data - prev)
+        prev = image_data
     return diffs, times
 
-def get_diff_sources(diffs: list) -> list:
-    diff_sources = []
-    for diff in tqdm(diffs, desc='Finding sources in differences'):
-        _, _, std = sigma_clipped_stats(diff, sigma=3.0)
-        daofind = DAOStarFinder(threshold=5. * std, fwhm=3.0)
-        sources = daofind(diff)
-        diff_sources.append(sources)
-    return diff_sources
+def iter_diffs(paths: list, lag: int = 1):
+    """
+    逐帧生成差分图像，内存中只保留 lag + 1 帧的滑动窗口
+    :return: 生成器，每次给出 (差分序号 k, 第 k + lag 帧减第 k 帧, 第 k 帧的 TSTART)
+    """
+    window = deque(maxlen=lag + 1)
+    for i, file in enumerate(paths):
+        image_data, header = file_utils.read_frame(file)
+        window.append((image_data, header['TSTART']))
+        if len(window) == lag + 1:
+            (first, time), (last, _) = window[0], window[-1]
+            yield i - lag, last - first, time
+
+# 分块找源时每块向外扩展的像素数，需大于 DAOStarFinder 卷积核和测量窗口的半宽
+TILE_HALO = 16
+
+def find_diff_sources(diff: np.ndarray, bkg_mode: str = 'exact', tiles: tuple | None = None, pool=None):
+    """
+    在一帧差分图像上找源
+    :param tiles: (ny, nx) 时把图像切成带重叠边的小块分别找源，再按块的核心区域去重合并
+    :param pool: 分块时使用的进程池，为 None 时在当前进程中逐块处理
+    """
+    _, _, std = background.background_stats(diff, bkg_mode, sigma=3.0)
+    if tiles is None:
+        with instrument.stage('get_diffs.find_sources') as s:
+            daofind = DAOStarFinder(threshold=5. * std, fwhm=3.0)
+            sources = daofind(diff)
+            s.items = 0 if sources is None else len(sources)
+        return sources
+
+    h, w = diff.shape
+    ys = np.linspace(0, h, tiles[0] + 1).astype(int)
+    xs = np.linspace(0, w, tiles[1] + 1).astype(int)
+    jobs = []
+    for y0, y1 in zip(ys[:-1], ys[1:]):
+        for x0, x1 in zip(xs[:-1], xs[1:]):
+            hy0, hx0 = max(y0 - TILE_HALO, 0), max(x0 - TILE_HALO, 0)
+            block = np.asarray(diff[hy0:min(y1 + TILE_HALO, h), hx0:min(x1 + TILE_HALO, w)])
+            jobs.append((block, 5. * std, (hy0, hx0), (y0, y1, x0, x1)))
+    parts = list(pool.map(_find_tile_sources, jobs) if pool is not None else map(_find_tile_sources, jobs))
+    parts = [p for p in parts if p is not None and len(p)]
+    if not parts:
+        return None
+    sources = vstack(parts)
+    # 按整帧找源时的顺序（先 y 后 x）排列并重新编号
+    sources = sources[np.lexsort((sources['xcentroid'], sources['ycentroid']))]
+    sources['id'] = np.arange(1, len(sources) + 1)
+    return sources
+
+def _find_tile_sources(job):
+    block, threshold, (oy, ox), (y0, y1, x0, x1) = job
+    sources = DAOStarFinder(threshold=threshold, fwhm=3.0)(block)
+    if sources is None:
+        return None
+    sources['xcentroid'] += ox
+    sources['ycentroid'] += oy
+    # 只保留质心落在本块核心区域内的源，重叠边上的源由相邻块负责
+    keep = ((sources['ycentroid'] >= y0 - 0.5) & (sources['ycentroid'] < y1 - 0.5)
+            & (sources['xcentroid'] >= x0 - 0.5) & (sources['xcentroid'] < x1 - 0.5))
+    return sources[keep]
+
+def get_diff_sources(diffs: list, bkg_mode: str = 'exact', workers: int = 1, chunksize: int = 4,
+                     tiles: tuple | None = None) -> list:
+    """
+    :param workers: 进程数，大于 1 时各帧按 chunksize 分块分配到进程池，结果仍按帧的顺序返回
+    :param tiles: 给出时每帧切块找源；workers 大于 1 时单帧的各块分配到进程池
+    """
+    if workers <= 1:
+        return [find_diff_sources(diff, bkg_mode, tiles)
+                for diff in tqdm(diffs, desc='Finding sources in differences')]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if tiles is not None:
+            return [find_diff_sources(diff, bkg_mode, tiles, pool)
+                    for diff in tqdm(diffs, desc='Finding sources in differences')]
+        return list(tqdm(pool.map(partial(find_diff_sources, bkg_mode=bkg_mode), diffs, chunksize=chunksize),
+                         total=len(diffs), desc=f'Finding sources in differences ({workers} workers)'))
+
+class DiffWriter:
+    """
+    按块把差分图像压缩保存为 diffs_XXXXX.npz，内存中最多保留 chunk 帧
+    """
+
+    def __init__(self, out_dir: str, chunk: int = 32):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.chunk = chunk
+        self._buffer = []
+        self._start = 0
+
+    def append(self, diff: np.ndarray):
+        self._buffer.append(np.asarray(diff, dtype=np.float32))
+        if len(self._buffer) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        np.savez_compressed(os.path.join(self.out_dir, f'diffs_{self._start:05d}.npz'),
+                            diffs=np.stack(self._buffer), start=self._start)
+        self._start += len(self._buffer)
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+
+def iter_saved_diffs(out_dir: str):
+    # 按顺序读取 DiffWriter 保存的差分图像
+    for name in sorted(f for f in os.listdir(out_dir) if f.startswith('diffs_') and f.endswith('.npz')):
+        with np.load(os.path.join(out_dir, name)) as chunk:
+            yield from chunk['diffs']
+
+# 流式多进程时每个工作进程最多排队的任务数，已提交但尚未写出的结果不超过 2 * workers 个任务
+MAX_PENDING_PER_WORKER = 2
+
+def _diff_sources_from_paths(pairs: list, bkg_mode: str = 'exact') -> list:
+    # 工作进程自己读取帧对并做差分，只返回星点表和时间，不在进程间传递整帧图像
+    results = []
+    for first_path, last_path in pairs:
+        first, header = file_utils.read_frame(first_path)
+        last, _ = file_utils.read_frame(last_path)
+        results.append((find_diff_sources(last - first, bkg_mode), header['TSTART']))
+    return results
+
+def _bounded_map(pool, func, items, max_pending: int):
+    """
+    与 pool.map 相同按顺序给出结果，但最多只有 max_pending 个任务已提交而未被取走
+    （pool.map 会一次提交所有任务，并缓存所有还没被消费的结果）
+    """
+    pending = deque()
+    for item in items:
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+        pending.append(pool.submit(func, item))
+    while pending:
+        yield pending.popleft().result()
+
+def stream_diff_sources(paths: list, store_dir: str, lag: int = 1, bkg_mode: str = 'exact',
+                        diffs_dir: str | None = None, chunk: int = 32,
+                        workers: int = 1, chunksize: int = 4) -> int:
+    """
+    流式差分找源：每生成一个差分图像就找源并追加到检测结果存储（见 detections.py），峰值内存只取决于窗口大小
+    :param store_dir: 检测结果存储目录
+    :param diffs_dir: 需要保留差分图像时给出保存目录，按 chunk 帧一块压缩保存
+    :param workers: 进程数，大于 1 时每个任务处理 chunksize 个帧对，最多 2 * workers 个任务在排队，结果仍按帧的顺序写入
+    :return: 处理的差分帧数
+    """
+    diff_writer = DiffWriter(diffs_dir, chunk) if diffs_dir is not None else None
+    total = max(len(paths) - lag, 0)
+    n = 0
+    with DetectionWriter(store_dir) as writer:
+        if workers > 1:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            pairs = list(zip(paths[:-lag], paths[lag:]))
+            tasks = (pairs[k:k + chunksize] for k in range(0, len(pairs), chunksize))
+            chunks = _bounded_map(pool, partial(_diff_sources_from_paths, bkg_mode=bkg_mode), tasks,
+                                  MAX_PENDING_PER_WORKER * workers)
+            results = ((sources, frame_time, None) for chunk_results in chunks for sources, frame_time in chunk_results)
+        else:
+            pool = None
+            results = ((find_diff_sources(diff, bkg_mode), frame_time, diff)
+                       for _, diff, frame_time in iter_diffs(paths, lag))
+        try:
+            # 每帧的延迟按相邻两帧结果到达的间隔记录，多进程时也反映实际吞吐
+            t0 = time.perf_counter()
+            for k, (sources, frame_time, diff) in enumerate(tqdm(results, total=total,
+                                                                 desc='Finding sources in differences')):
+                writer.append(sources, frame_time)
+                if diff_writer is not None:
+                    if diff is None:
+                        # 多进程时差分图像不从工作进程传回，在主进程中由两帧的内存映射重新相减
+                        diff = file_utils.read_frame(paths[k + lag])[0] - file_utils.read_frame(paths[k])[0]
+                    diff_writer.append(diff)
+                n += 1
+                now = time.perf_counter()
+                instrument.record('get_diffs.frame', now - t0, items=0 if sources is None else len(sources))
+                t0 = now
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    if diff_writer is not None:
+        diff_writer.close()
+    return n
 
 if __name__ == '__main__':
 
+    instrument.start_run('get_diffs')
     ps = file_utils.get_fits_file_paths('data/')
 
     ps = ps[25:]  # 先处理一部分数据
 
-    ds, ts = get_diffs(ps)
-
-    np.save('result/little_star/diffs.npy', ds)
-    np.save('result/little_star/times.npy', ts)
-
-    diff_s = get_diff_sources(ds)
-    with open('result/little_star/diff_sources.pkl', 'wb') as f:
-        pickle.dump(diff_s, f)
\ No newline at end of file
+    # 流式处理，检测结果逐帧追加到 result/little_star/detections，不再把整个差分序列放进内存
+    n = stream_diff_sources(ps, 'result/little_star/detections', bkg_mode='fast', workers=os.cpu_count())
+    print(f'处理了 {n} 帧差分图像')
+    # 一个扇区内指向不变，用第一帧的 WCS 为所有检测计算天球坐标
+    sky.write_sky_coords('result/little_star/detections', file_utils.read_frame(ps[0])[1], grid_step=sky.GRID_STEP)
@@ -0,0 +1,205 @@
+import atexit
+import bisect
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import resource
+import sys
+import threading
+import time
+
+import numpy as np
+
+# 运行报告的保存目录，文件名为 <脚本名>-<开始时间>.json（开启 cProfile 时另存同名 .prof）
+REPORT_DIR = 'result/reports'
+# 设置该环境变量为 1 时 start_run 同时开启 cProfile
+PROFILE_ENV = 'PIPELINE_PROFILE'
+# 每个阶段保留的延迟样本数上限（用于分位数），超过后按蓄水池抽样
+MAX_SAMPLES = 100000
+# 延迟直方图的分箱边界（秒）：1 µs 到约 1 小时，每 10 倍分两箱
+HIST_EDGES = [float(v) for v in 10 ** np.arange(-6, 3.75, 0.5)]
+# 报告中列出的 cProfile 函数数
+PROFILE_TOP = 30
+
+_lock = threading.Lock()
+_stages = {}
+_run = {'name': None, 'started': time.time(), 't0': time.perf_counter(), 'profiler': None}
+
+
+class StageStats:
+    """
+    一个阶段的累计统计：调用次数、总耗时、处理的条目数和字节数、延迟直方图和延迟样本
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max = 0.0
+        self.items = 0
+        self.nbytes = 0
+        self.hist = [0] * (len(HIST_EDGES) + 1)
+        self.samples = []
+
+    def add(self, elapsed: float, items: int = 0, nbytes: int = 0):
+        self.calls += 1
+        self.seconds += elapsed
+        self.max = max(self.max, elapsed)
+        self.items += int(items)
+        self.nbytes += int(nbytes)
+        self.hist[bisect.bisect_right(HIST_EDGES, elapsed)] += 1
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(elapsed)
+        else:
+            k = random.randrange(self.calls)
+            if k < MAX_SAMPLES:
+                self.samples[k] = elapsed
+
+    def summary(self) -> dict:
+        samples = np.asarray(self.samples)
+        p50, p90, p99 = np.percentile(samples, [50, 90, 99]) if len(samples) else (0.0, 0.0, 0.0)
+        edges = ['0'] + [f'{e:.0e}' for e in HIST_EDGES]
+        return {
+            'calls': self.calls,
+            'seconds': self.seconds,
+            'mean_s': self.seconds / self.calls if self.calls else 0.0,
+            'p50_s': float(p50), 'p90_s': float(p90), 'p99_s': float(p99), 'max_s': self.max,
+            'items': self.items,
+            'items_per_s': self.items / self.seconds if self.seconds > 0 else None,
+            'bytes': self.nbytes,
+            'mb_per_s': self.nbytes / 2 ** 20 / self.seconds if self.seconds > 0 else None,
+            # {分箱下界: 次数}，只列出非空的箱
+            'latency_hist': {edges[i]: n for i, n in enumerate(self.hist) if n},
+        }
+
+
+def record(name: str, elapsed: float, items: int = 0, nbytes: int = 0):
+    # 记录一次已经计时的调用（例如工作进程返回的耗时）
+    with _lock:
+        if name not in _stages:
+            _stages[name] = StageStats()
+        _stages[name].add(elapsed, items, nbytes)
+
+
+class stage:
+    """
+    给一段代码计时：with instrument.stage('find_star.convolve', items=n) as s: ...
+    条目数和字节数在进入时未知时，可以在块内设置 s.items / s.nbytes
+    """
+
+    def __init__(self, name: str, items: int = 0, nbytes: int = 0):
+        self.name = name
+        self.items = items
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self._t0, self.items, self.nbytes)
+
+
+def timed(name: str | None = None):
+    # 函数装饰器版本的 stage，默认阶段名为 模块名.函数名
+    def decorator(func):
+        stage_name = name or f'{func.__module__}.{func.__name__}'
+
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+    _run.update(started=time.time(), t0=time.perf_counter())
+
+
+def _io_counters() -> dict:
+    # Linux 下进程实际从磁盘读取的字节数（read_bytes）和所有 read 调用的字节数（rchar）
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return {'read_bytes': int(fields['read_bytes']), 'rchar': int(fields['rchar'])}
+    except (OSError, KeyError, ValueError):
+        return {}
+
+
+def report() -> dict:
+    """
+    当前进程的运行报告：总耗时、CPU 时间、峰值内存、读取字节数和各阶段统计
+    工作进程中的阶段不会自动汇总，需要由主进程用 record 记录它们返回的耗时
+    """
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    with _lock:
+        stages = {name: s.summary() for name, s in _stages.items()}
+    return {
+        'run': _run['name'],
+        'argv': sys.argv,
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(_run['started'])),
+        'wall_s': time.perf_counter() - _run['t0'],
+        'cpu_s': self_usage.ru_utime + self_usage.ru_stime,
+        'children_cpu_s': children.ru_utime + children.ru_stime,
+        # Linux 下 ru_maxrss 单位为 KB
+        'peak_rss_mb': self_usage.ru_maxrss / 1024,
+        'children_peak_rss_mb': children.ru_maxrss / 1024,
+        'io': _io_counters(),
+        'stages': stages,
+    }
+
+
+def _profile_top(profiler: cProfile.Profile, n: int = PROFILE_TOP) -> list:
+    stats = pstats.Stats(profiler, stream=io.StringIO()).sort_stats('cumulative')
+    rows = []
+    for (filename, line, func), (cc, nc, tt, ct, _) in list(stats.stats.items()):
+        rows.append({'function': f'{os.path.basename(filename)}:{line}({func})',
+                     'calls': nc, 'tottime_s': tt, 'cumtime_s': ct})
+    return sorted(rows, key=lambda r: r['cumtime_s'], reverse=True)[:n]
+
+
+def write_report(path: str | None = None) -> str:
+    """
+    把运行报告写成 JSON
+    :param path: 默认为 REPORT_DIR/<脚本名>-<开始时间>.json
+    :return: 报告路径
+    """
+    if path is None:
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(_run['started']))
+        path = os.path.join(REPORT_DIR, f'{_run["name"] or "run"}-{stamp}.json')
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    result = report()
+    profiler = _run['profiler']
+    if profiler is not None:
+        profiler.disable()
+        prof_path = os.path.splitext(path)[0] + '.prof'
+        profiler.dump_stats(prof_path)
+        result['profile'] = {'path': prof_path, 'top': _profile_top(profiler)}
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=4, ensure_ascii=False)
+    return path
+
+
+def start_run(name: str, profile: bool | None = None, path: str | None = None):
+    """
+    在脚本开头调用：清空统计，进程退出时自动写出运行报告
+    :param profile: 是否开启 cProfile，None 时由环境变量 PIPELINE_PROFILE 决定
+    """
+    reset()
+    _run['name'] = name
+    if profile is None:
+        profile = os.environ.get(PROFILE_ENV) == '1'
+    if profile:
+        _run['profiler'] = cProfile.Profile()
+        _run['profiler'].enable()
+
+    def _at_exit():
+        print(f'运行报告已保存到 {write_report(path)}')
+    atexit.register(_at_exit)
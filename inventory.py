@@ -0,0 +1,195 @@
+import hashlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import instrument
+
+# 清单文件保存目录，文件名为 <目录名>-<绝对路径摘要>.npy
+INVENTORY_DIR = 'result/inventory'
+# 读取头信息的线程数（只读几个 2880 字节的块，主要是等待 I/O）
+IO_WORKERS = 16
+# FITS 头信息按 2880 字节的块存放，每张卡片 80 字节
+BLOCK = 2880
+CARD = 80
+# 每个文件记录的内容：文件名、大小和修改时间（判断是否需要重新读取）、校准图像尺寸、时间、相机/CCD、扇区、质量标记
+# ok 为 False 表示头信息不完整（例如下载中断），查询时排除
+# 文件名字段的宽度按每次扫描中最长的文件名确定（make_dtype），这里的 U64 只是字段模板
+DTYPE = np.dtype([('name', 'U64'), ('size', 'i8'), ('mtime_ns', 'i8'), ('height', 'i4'), ('width', 'i4'),
+                  ('tstart', 'f8'), ('tstop', 'f8'), ('camera', 'i2'), ('ccd', 'i2'), ('sector', 'i2'),
+                  ('quality', 'i4'), ('ok', '?')])
+# 需要从头信息中解析的关键字
+KEYS = {b'BITPIX', b'NAXIS', b'NAXIS1', b'NAXIS2', b'NAXIS3', b'PCOUNT', b'GCOUNT',
+        b'TSTART', b'TSTOP', b'CAMERA', b'CCD', b'SECTOR', b'DQUALITY'}
+# TESS FFI 文件名中的扇区、相机和 CCD：tess2018319112938-s0005-1-4-0125-s_ffic.fits
+NAME_PATTERN = re.compile(r'-s(\d{4})-(\d)-(\d)-')
+
+
+def make_dtype(name_length: int) -> np.dtype:
+    # 文件名字段足够放下最长的文件名，定长字段截断后 select_paths 会给出不存在的路径
+    return np.dtype([('name', f'U{max(name_length, 1)}')] + [(n, DTYPE[n]) for n in DTYPE.names[1:]])
+
+
+def _parse_value(text: bytes):
+    # 卡片中 '= ' 之后的值：字符串、逻辑值、整数或浮点数，去掉 / 之后的注释
+    text = text.decode('ascii', errors='replace').strip()
+    if text.startswith("'"):
+        end = text.find("'", 1)
+        while end != -1 and text[end + 1:end + 2] == "'":
+            end = text.find("'", end + 2)
+        return text[1:end].replace("''", "'").rstrip()
+    text = text.split('/', 1)[0].strip()
+    if text in ('T', 'F'):
+        return text == 'T'
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text.replace('D', 'E'))
+    except ValueError:
+        return text
+
+
+def read_headers(path: str, n_hdus: int | None = 2, keys: set = KEYS) -> list:
+    """
+    只读取 FITS 头信息块，按 NAXIS 计算数据段大小后直接跳过，不读取像素
+    :param n_hdus: 读取前几个 HDU 的头信息，None 表示读到文件末尾
+    :return: 每个 HDU 一个 {关键字: 值} 字典（只包含 keys 中的关键字）
+    头信息或数据段被截断（下载中断）时抛出 ValueError
+    """
+    headers = []
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        while n_hdus is None or len(headers) < n_hdus:
+            cards = {}
+            end = False
+            while not end:
+                block = f.read(BLOCK)
+                if len(block) < BLOCK:
+                    if not block and not cards and n_hdus is None:
+                        return headers
+                    raise ValueError(f'{path} 的头信息不完整')
+                for i in range(0, BLOCK, CARD):
+                    key = block[i:i + 8].rstrip()
+                    if key == b'END':
+                        end = True
+                        break
+                    if key in keys and block[i + 8:i + 10] == b'= ':
+                        cards[key.decode()] = _parse_value(block[i + 10:i + CARD])
+            headers.append(cards)
+            naxis = cards.get('NAXIS', 0)
+            if naxis:
+                n = int(np.prod([cards.get(f'NAXIS{k}', 0) for k in range(1, naxis + 1)]))
+                size = abs(cards.get('BITPIX', 8)) // 8 * cards.get('GCOUNT', 1) * (cards.get('PCOUNT', 0) + n)
+                f.seek(-(-size // BLOCK) * BLOCK, os.SEEK_CUR)
+                if f.tell() > file_size:
+                    raise ValueError(f'{path} 的数据不完整')
+    return headers
+
+
+def _record(folder: str, entry: os.DirEntry) -> tuple:
+    stat = entry.stat()
+    row = [entry.name, stat.st_size, stat.st_mtime_ns, -1, -1, np.nan, np.nan, -1, -1, -1, 0, False]
+    match = NAME_PATTERN.search(entry.name)
+    try:
+        primary, cal = read_headers(os.path.join(folder, entry.name))
+    except (OSError, ValueError):
+        return tuple(row)
+    # 相机、CCD 和扇区优先取校准 HDU，其次主 HDU，最后从文件名解析
+    for field, key, group in (('camera', 'CAMERA', 2), ('ccd', 'CCD', 3), ('sector', 'SECTOR', 1)):
+        value = cal.get(key, primary.get(key))
+        if value is None and match:
+            value = int(match.group(group))
+        row[DTYPE.names.index(field)] = -1 if value is None else value
+    row[3:7] = [cal.get('NAXIS2', -1), cal.get('NAXIS1', -1), cal.get('TSTART', primary.get('TSTART', np.nan)),
+                cal.get('TSTOP', primary.get('TSTOP', np.nan))]
+    row[10] = cal.get('DQUALITY', 0)
+    row[11] = True
+    return tuple(row)
+
+
+def default_index_path(folder: str) -> str:
+    digest = hashlib.blake2b(os.path.abspath(folder).encode(), digest_size=4).hexdigest()
+    return os.path.join(INVENTORY_DIR, f'{os.path.basename(os.path.abspath(folder))}-{digest}.npy')
+
+
+def scan(folder: str, index_path: str | None = None, workers: int = IO_WORKERS) -> np.ndarray:
+    """
+    目录中所有 .fits 文件的头信息清单，按文件名排序（与 file_utils.get_fits_file_names 相同）
+    清单保存在 index_path，再次扫描时只重新读取新增或大小、修改时间变化的文件，已删除的文件从清单中去掉
+    :return: 结构化数组，字段与 DTYPE 相同，文件名字段的宽度取最长的文件名
+    """
+    index_path = index_path or default_index_path(folder)
+    old, stored_dtype = {}, None
+    if os.path.exists(index_path):
+        stored = np.load(index_path)
+        if stored.dtype.names == DTYPE.names:
+            old, stored_dtype = {row['name']: row for row in stored}, stored.dtype
+
+    with instrument.stage('inventory.scan') as s:
+        entries = sorted((e for e in os.scandir(folder) if e.name.endswith('.fits') and e.is_file()),
+                         key=lambda e: e.name)
+        rows = [None] * len(entries)
+        stale = []
+        for k, entry in enumerate(entries):
+            row = old.get(entry.name)
+            stat = entry.stat()
+            if row is not None and row['size'] == stat.st_size and row['mtime_ns'] == stat.st_mtime_ns:
+                rows[k] = row
+            else:
+                stale.append(k)
+        s.items = len(stale)
+        if stale:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for k, row in zip(stale, pool.map(lambda k: _record(folder, entries[k]), stale)):
+                    rows[k] = row
+        dtype = make_dtype(max((len(e.name) for e in entries), default=1))
+        inventory = np.array([tuple(row) for row in rows], dtype=dtype)
+        if not all(name == entry.name for name, entry in zip(inventory['name'], entries)):
+            raise ValueError(f'{folder} 中有文件名无法完整保存到清单中')
+
+    if stale or len(inventory) != len(old) or inventory.dtype != stored_dtype:
+        os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+        tmp_path = index_path + '.tmp.npy'
+        np.save(tmp_path, inventory)
+        os.replace(tmp_path, index_path)
+    return inventory
+
+
+def query(inventory: np.ndarray, tmin: float | None = None, tmax: float | None = None,
+          bitmask: int | None = None, camera: int | None = None, ccd: int | None = None,
+          sector: int | None = None, skip: int = 0) -> np.ndarray:
+    """
+    按条件选择帧
+    :param tmin, tmax: TSTART 的范围（BTJD，含端点）
+    :param bitmask: 排除 DQUALITY 与 bitmask 有交集的帧（例如 quality.DEFAULT_BITMASK）
+    :param skip: 先去掉按文件名排序的前 skip 帧（原来的 paths[skip:]）
+    :return: 布尔掩码，头信息不完整的文件总是排除
+    """
+    keep = inventory['ok'].copy()
+    keep[:skip] = False
+    if tmin is not None:
+        keep &= inventory['tstart'] >= tmin
+    if tmax is not None:
+        keep &= inventory['tstart'] <= tmax
+    if bitmask is not None:
+        keep &= (inventory['quality'] & bitmask) == 0
+    for field, value in (('camera', camera), ('ccd', ccd), ('sector', sector)):
+        if value is not None:
+            keep &= inventory[field] == value
+    return keep
+
+
+def select_paths(folder: str, index_path: str | None = None, **criteria) -> list:
+    # 扫描（增量）后按 query 的条件选出帧的路径
+    inventory = scan(folder, index_path)
+    return [os.path.join(folder, name) for name in inventory['name'][query(inventory, **criteria)]]
+
+
+def quality_by_time(inventory: np.ndarray) -> dict:
+    # {TSTART: DQUALITY}，与 quality.read_quality 的结果相同，但不需要再打开文件
+    ok = inventory['ok']
+    return dict(zip(inventory['tstart'][ok].tolist(), inventory['quality'][ok].tolist()))
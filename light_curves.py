@@ -1,55 +1,230 @@
+import inspect
+import os
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
 import matplotlib.pyplot as plt
-from astropy.stats import sigma_clipped_stats
 
+import background
+import detections
 import file_utils
+import filtering
+import instrument
+import inventory
 import numpy as np
 from find_star import find_star
 from tqdm import tqdm
 from scipy.ndimage import median_filter
 from astropy.timeseries import LombScargle
+from sector_cube import SectorCube
+from flux_store import FluxStore, store_signature
+import photometry
+import quality
 
 def get_light_curve(fits_file_paths: list,
                     source: any,
-                    box_size: int = 5) -> tuple:
-    fluxes = [[] for _ in range(len(source))]
+                    box_size: int = 5,
+                    radius: float | None = None,
+                    annulus: tuple | None = None,
+                    workers: int = 1,
+                    bkg_mode: str = 'exact',
+                    filter_mode: str = 'full') -> tuple:
+    """
+    逐帧提取所有星点的光度，每帧对所有孔径做一次向量化测光
+    :param box_size: 方形孔径边长（radius 为 None 时使用）
+    :param radius: 圆形孔径半径，边缘像素按面积比例加权
+    :param annulus: (内半径, 外半径) 局部背景环，为 None 时使用全图 sigma-clipped 中值作为背景
+    :param workers: 进程数，大于 1 时各帧分配到进程池并行处理，结果与串行完全相同
+    :param bkg_mode: 全图背景的估计方式，见 background.MODES
+    :param filter_mode: 中值滤波方式，见 filtering.MODES；星点稀疏时 sparse 只滤波孔径附近的像素
+    :return: (stars × frames) float32 光度数组和时间列表（与 fits_file_paths 顺序一致）
+    """
+    if not fits_file_paths:
+        return np.empty((len(source), 0), dtype=np.float32), []
+    # 孔径和需要滤波的区域只依赖星点位置和图像尺寸，预先计算一次
+    shape = file_utils.read_frame(fits_file_paths[0])[0].shape
+    apertures = make_apertures(source, shape, box_size, radius, annulus)
+    regions = filtering.aperture_regions(apertures, shape) if filter_mode == 'sparse' else None
+    if workers > 1:
+        return _get_light_curve_parallel(fits_file_paths, apertures, workers, bkg_mode, filter_mode, regions)
+
+    fluxes = np.empty((len(source), len(fits_file_paths)), dtype=np.float32)
     times = []
-    for path in tqdm(fits_file_paths, desc="从 FITS 文件中提取每个星的光度", unit="file", colour="green"):
-
-        image_data, header = file_utils.read_image_data(path)
-        times.append(header['TSTART']) # 获取时间戳
-
-        # 使用中值滤波来减少噪声
-        image_data = median_filter(image_data, size=3)
-        # 计算图像的统计量
-        mean, median, std = sigma_clipped_stats(image_data, sigma=3.0)
-        # 计算每个星点在当前图像中的光度
-        for i, (x, y) in enumerate(zip(source['xcentroid'], source['ycentroid'])):
-            half = box_size // 2
-            # 计算指定位置的光度
-            sub_image = image_data[int(y - half):int(y + half + 1), int(x - half):int(x + half + 1)]
-            flux = np.sum(sub_image - median)  # 减去背景中值
-            fluxes[i].append(flux)
+    for j, path in enumerate(tqdm(fits_file_paths, desc="从 FITS 文件中提取每个星的光度", unit="file", colour="green")):
+        with instrument.stage('light_curves.frame', items=len(apertures)):
+            time, fluxes[:, j] = measure_frame(path, apertures, bkg_mode, filter_mode, regions)
+        times.append(time)
     return fluxes, times
 
-if __name__ == '__main__':
+def measure_frame(path: str, apertures: photometry.Apertures, bkg_mode: str = 'exact',
+                  filter_mode: str = 'full', regions: list | None = None, filter_workers: int | None = None) -> tuple:
+    """
+    处理单帧：中值滤波、背景估计、测光
+    :param regions: filter_mode 为 sparse 时孔径覆盖的区域（filtering.aperture_regions）
+    :param filter_workers: tiled / sparse 滤波的线程数，None 为 CPU 核数；在进程池中调用时为 1
+    :return: (TSTART, 所有星点的光度)
+    """
+    image_data, header = file_utils.read_frame(path)
+    # 使用中值滤波来减少噪声
+    with instrument.stage(f'light_curves.median_filter.{filter_mode}', nbytes=image_data.nbytes):
+        image_data, stats_data = filtering.filter_frame(image_data, filter_mode, regions, bkg_mode,
+                                                        workers=filter_workers)
+    # 计算图像的统计量
+    mean, median, std = background.background_stats(stats_data, bkg_mode, sigma=3.0)
+    # 一次性计算所有星点在当前图像中的光度（减去背景中值）
+    with instrument.stage('light_curves.photometry', items=len(apertures)):
+        return header['TSTART'], photometry.aperture_photometry(image_data, apertures, median)
+
+# 工作进程中的共享光度矩阵和孔径
+_worker = {}
+
+def _init_worker(shm_name: str, shape: tuple, apertures: photometry.Apertures, bkg_mode: str,
+                 filter_mode: str, regions: list | None):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker['shm'] = shm
+    _worker['fluxes'] = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    _worker['apertures'] = apertures
+    _worker['bkg_mode'] = bkg_mode
+    _worker['filter_mode'] = filter_mode
+    _worker['regions'] = regions
+    # 各帧已经分配到多个进程，进程内的滤波不再开线程池，否则线程数为 进程数 x CPU 核数
+    _worker['filter_workers'] = 1
+
+def _measure_frame_shared(j: int, path: str) -> tuple:
+    # 工作进程中的统计不会回到主进程，返回本帧耗时由主进程记录
+    t0 = perf_counter()
+    time, _worker['fluxes'][:, j] = measure_frame(path, _worker['apertures'], _worker['bkg_mode'],
+                                                  _worker['filter_mode'], _worker['regions'],
+                                                  _worker['filter_workers'])
+    return j, time, perf_counter() - t0
+
+def _get_light_curve_parallel(fits_file_paths: list, apertures: photometry.Apertures,
+                              workers: int, bkg_mode: str, filter_mode: str = 'full',
+                              regions: list | None = None) -> tuple:
+    shape = (len(apertures), len(fits_file_paths))
+    shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 4, 1))
+    try:
+        fluxes = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        times = [None] * len(fits_file_paths)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(shm.name, shape, apertures, bkg_mode, filter_mode, regions)) as pool:
+            futures = [pool.submit(_measure_frame_shared, j, path) for j, path in enumerate(fits_file_paths)]
+            for future in tqdm(as_completed(futures), total=len(futures),
+                               desc=f"并行提取每个星的光度（{workers} 进程）", unit="file", colour="green"):
+                # 按帧序号写回时间，保证与光度矩阵的列一一对应
+                j, time, elapsed = future.result()
+                times[j] = time
+                instrument.record('light_curves.frame', elapsed, items=len(apertures))
+        result = fluxes.copy()
+        del fluxes
+    finally:
+        shm.close()
+        shm.unlink()
+    return result, times
 
-    paths = file_utils.get_fits_file_paths('data/')
+# 光度存储摘要中记录的 get_light_curve 参数
+STORE_PARAMS = ('box_size', 'radius', 'annulus', 'bkg_mode', 'filter_mode')
+
+def update_light_curves(fits_file_paths: list, source: any, store_dir: str, **kwargs) -> tuple:
+    """
+    增量提取光变曲线：只对存储中还没有的帧（按文件名和 TSTART 判断）测光，并追加到光度存储
+    :param store_dir: 光度存储目录（见 flux_store.FluxStore）
+    :param kwargs: 传给 get_light_curve 的参数（孔径、进程数、背景方式、滤波方式）
+    :return: (新处理的帧数, 存储)
+    """
+    # 影响光度数值的参数（进程数不影响结果），与星点位置一起记录在存储中，变化时拒绝追加
+    defaults = inspect.signature(get_light_curve).parameters
+    params = {name: kwargs.get(name, defaults[name].default) for name in STORE_PARAMS}
+    store = FluxStore(store_dir, len(source), store_signature(source['xcentroid'], source['ycentroid'], params))
+    new = store.new_frames(fits_file_paths)
+    if new:
+        fluxes, times = get_light_curve(new, source, **kwargs)
+        store.append(new, fluxes, times)
+    return len(new), store
+
+def make_apertures(source: any, shape: tuple, box_size: int = 5,
+                   radius: float | None = None, annulus: tuple | None = None) -> photometry.Apertures:
+    xs, ys = source['xcentroid'], source['ycentroid']
+    if radius is None and annulus is None:
+        return photometry.box_apertures(xs, ys, shape, box_size)
+    return photometry.circular_apertures(xs, ys, shape, radius or box_size / 2, annulus)
+
+def get_light_curve_cube(cube: SectorCube,
+                         source: any,
+                         box_size: int = 5,
+                         frames: slice = slice(None)) -> tuple:
+    """
+    从帧立方体中提取光变曲线，结果与 get_light_curve 一致（背景中值在打包立方体时已算好）
+    按分块把星点分组，每组只读取一次覆盖该组所有星点盒子（外扩 1 像素供中值滤波使用）的区域
+    :return: (stars × frames) float32 光度数组和时间列表
+    """
+    half = box_size // 2
+    xs = np.asarray(source['xcentroid'], dtype=float)
+    ys = np.asarray(source['ycentroid'], dtype=float)
+    # 与逐帧切片 image_data[int(y - half):int(y + half + 1), ...] 的取整方式一致，越界部分截掉
+    y0 = np.clip((ys - half).astype(int), 0, cube.height)
+    y1 = np.clip((ys + half + 1).astype(int), 0, cube.height)
+    x0 = np.clip((xs - half).astype(int), 0, cube.width)
+    x1 = np.clip((xs + half + 1).astype(int), 0, cube.width)
+
+    median = cube.bkg_median[frames]
+    fluxes = np.zeros((len(xs), len(median)))
+    groups = (y0 // cube.tile) * (cube.width // cube.tile + 1) + x0 // cube.tile
+    for g in tqdm(np.unique(groups), desc="从帧立方体中提取每个星的光度", unit="tile", colour="green"):
+        idx = np.flatnonzero(groups == g)
+        r0, r1 = y0[idx].min() - 1, y1[idx].max() + 1
+        c0, c1 = x0[idx].min() - 1, x1[idx].max() + 1
+        block = cube.stamp(r0, r1, c0, c1, frames)
+        r0, c0 = max(r0, 0), max(c0, 0)
+        # 只在空间方向上做 3x3 中值滤波，区域贴着图像边缘时与整帧滤波的边界处理相同
+        block = median_filter(block, size=(1, 3, 3))
+        for i in idx:
+            sub = block[:, y0[i] - r0:y1[i] - r0, x0[i] - c0:x1[i] - c0]
+            fluxes[i] = np.sum(sub - median[:, None, None], axis=(1, 2))
+    return fluxes.astype(np.float32), cube.times[frames].tolist()
+
+if __name__ == '__main__':
 
-    # 去除前 25 张图像
-    paths = paths[25:]
+    instrument.start_run('light_curves')
+    # 头信息清单（只在文件变化时重新读取头信息），去除前 25 张图像
+    # 也可以按时间或质量选帧，例如 inventory.select_paths('data/', tmin=1438.0, bitmask=quality.DEFAULT_BITMASK)
+    inv = inventory.scan('data/')
+    paths = [os.path.join('data/', name) for name in inv['name'][inventory.query(inv, skip=25)]]
     print(f'读取到 {len(paths)} 个 FITS 文件')
 
-    sc = np.load('result/find_star/source_fixed.npy', allow_pickle=True)
+    # 也可以使用 reference.py 在叠加图像上得到的星表 result/reference/sources（不依赖单帧）
+    sc = detections.load_sources('result/find_star/source_fixed')
     print(f'读取到 {len(sc)} 个星点数据')
 
-    fs, ts = get_light_curve(paths, sc)
+    # 如果已经用 sector_cube.py 打包过帧立方体，直接从立方体中读取
+    if os.path.exists('result/cube/meta.json'):
+        cube = SectorCube('result/cube')
+        fs, ts = get_light_curve_cube(cube, sc, frames=slice(25, None))
+        epoch_flags = cube.quality[25:]
+    else:
+        # 增量模式：只处理新下载的帧，追加到光度存储；没有新帧时不重写结果
+        n_new, store = update_light_curves(paths, sc, 'result/light_curves/store',
+                                           workers=os.cpu_count(), bkg_mode='fast', filter_mode='sparse')
+        print(f'新处理 {n_new} 帧，共 {store.n_frames} 帧')
+        if n_new == 0 and os.path.exists('result/light_curves/data/fluxes.npy'):
+            raise SystemExit
+        fs, ts = store.read()
+        # 质量标记取自头信息清单，按 TSTART 对齐到光度矩阵的列
+        epoch_flags = quality.epoch_quality(ts, inventory.quality_by_time(inv))
 
-    # 索引 121 位置处异常
-    for f in fs:
-        f[121] = (f[120] + f[122]) / 2  # 简单插值修正
+    # 找出坏历元：头信息 DQUALITY 标记的帧，以及所有星共同偏离（共模离群）的帧，对整个光度矩阵一次插值修补
+    with instrument.stage('light_curves.quality', items=fs.size):
+        bad, reasons = quality.flag_epochs(fs, epoch_flags)
+        quality.repair_epochs(fs, ts, bad, 'interpolate')
+    for name, n in reasons.items():
+        print(f'坏历元 {name}: {n} 个')
+    print(f'共 {bad.sum()} / {len(bad)} 个历元被插值修补')
 
     np.save('result/light_curves/data/fluxes.npy', fs)
     np.save('result/light_curves/data/times.npy', ts)
+    # 好历元的掩码，cycle_analysis 计算周期图时只使用好历元
+    np.save('result/light_curves/data/epoch_mask.npy', ~bad)
 
     # for flux in fs:
     #     plt.figure(figsize=(10, 5))
@@ -0,0 +1,156 @@
+import hashlib
+import os
+from collections import namedtuple
+
+import numpy as np
+from astropy.timeseries import LombScargle
+
+# 每批处理的星数和频率数，决定中间矩阵 (星数, 频率数) 的大小
+STAR_CHUNK = 1024
+FREQ_CHUNK = 2048
+
+Periodogram = namedtuple('Periodogram', ['frequency', 'best_frequency', 'max_power',
+                                         'false_alarm_probability', 'false_alarm_level'])
+
+
+def frequency_grid(t: np.ndarray, min_period: float, max_period: float, samples_per_peak: int = 5) -> np.ndarray:
+    # 与 LombScargle.autopower 使用相同的频率网格，网格只取决于时间
+    return LombScargle(t, np.ones_like(t)).autofrequency(samples_per_peak=samples_per_peak,
+                                                         minimum_frequency=1 / max_period,
+                                                         maximum_frequency=1 / min_period)
+
+
+def _trig_terms(t: np.ndarray, frequency: np.ndarray) -> tuple:
+    """
+    计算一段频率上与星无关的三角函数项（浮动均值的广义 Lomb-Scargle，Zechmeister & Kürster 2009）
+    :return: (cos, sin, CC, SS, CS, D)，cos / sin 形状为 (频率数, 历元数)
+    """
+    arg = 2 * np.pi * frequency[:, None] * t[None, :]
+    cos, sin = np.cos(arg), np.sin(arg)
+    c, s = cos.mean(axis=1), sin.mean(axis=1)
+    cc = (cos * cos).mean(axis=1) - c * c
+    ss = (sin * sin).mean(axis=1) - s * s
+    cs = (cos * sin).mean(axis=1) - c * s
+    return cos, sin, cc, ss, cs, cc * ss - cs * cs
+
+
+def batch_power(t: np.ndarray, fluxes: np.ndarray, frequency: np.ndarray,
+                star_chunk: int = STAR_CHUNK, freq_chunk: int = FREQ_CHUNK) -> tuple:
+    """
+    对所有星计算 standard 归一化的功率谱，只保留每颗星的最大功率
+    三角函数项每段频率只算一次，所有星按 star_chunk 分批做矩阵乘法
+    :param fluxes: (星数, 历元数) 的光度曲线矩阵，所有星共用时间 t
+    :return: (每颗星最大功率所在的频率序号, 最大功率)
+    """
+    t = np.asarray(t, dtype=np.float64)
+    n_stars, n = fluxes.shape
+    best = np.zeros(n_stars, dtype=np.int64)
+    max_power = np.full(n_stars, -np.inf)
+    for f0 in range(0, len(frequency), freq_chunk):
+        cos, sin, cc, ss, cs, d = _trig_terms(t, frequency[f0:f0 + freq_chunk])
+        for s0 in range(0, n_stars, star_chunk):
+            y = np.asarray(fluxes[s0:s0 + star_chunk], dtype=np.float64)
+            y = y - y.mean(axis=1, keepdims=True)
+            yy = (y * y).mean(axis=1, keepdims=True)
+            yc = y @ cos.T / n
+            ys = y @ sin.T / n
+            with np.errstate(invalid='ignore', divide='ignore'):
+                power = (ss * yc * yc + cc * ys * ys - 2 * cs * yc * ys) / (d * yy)
+            # 常数光度曲线没有周期信号
+            power[~np.isfinite(power)] = 0
+            k = power.argmax(axis=1)
+            p = power[np.arange(len(k)), k]
+            better = p > max_power[s0:s0 + star_chunk]
+            best[s0:s0 + star_chunk][better] = f0 + k[better]
+            max_power[s0:s0 + star_chunk][better] = p[better]
+    return best, max_power
+
+
+def batch_lomb_scargle(t: np.ndarray, fluxes: np.ndarray, min_period: float = 0.05, max_period: float = 5,
+                       samples_per_peak: int = 5, fap: float = 0.01,
+                       star_chunk: int = STAR_CHUNK, freq_chunk: int = FREQ_CHUNK) -> Periodogram:
+    """
+    批量计算所有光度曲线的 Lomb-Scargle 周期图，结果与逐颗星调用 LombScargle(t, f).autopower 一致
+    :param fluxes: (星数, 历元数) 的光度曲线矩阵
+    :param fap: 虚警概率，返回该概率对应的功率阈值 false_alarm_level
+    :return: Periodogram，false_alarm_probability 为每颗星最大功率的虚警概率（Baluev 近似）
+    虚警概率只取决于时间采样和频率范围，所有星共用一个 false_alarm_level
+    """
+    t = np.asarray(t, dtype=np.float64)
+    frequency = frequency_grid(t, min_period, max_period, samples_per_peak)
+    best, max_power = batch_power(t, fluxes, frequency, star_chunk, freq_chunk)
+    ls = LombScargle(t, np.ones_like(t))
+    kwargs = dict(minimum_frequency=1 / max_period, maximum_frequency=1 / min_period,
+                  samples_per_peak=samples_per_peak)
+    return Periodogram(
+        frequency=frequency,
+        best_frequency=frequency[best],
+        max_power=max_power,
+        false_alarm_probability=ls.false_alarm_probability(max_power, **kwargs),
+        false_alarm_level=float(ls.false_alarm_level(fap, **kwargs)),
+    )
+
+
+def row_digests(fluxes: np.ndarray) -> np.ndarray:
+    # 每颗星光度曲线内容的摘要，用于判断哪些星需要重新计算
+    fluxes = np.ascontiguousarray(fluxes)
+    return np.array([hashlib.blake2b(row.tobytes(), digest_size=16).digest() for row in fluxes], dtype='S16')
+
+
+def cached_lomb_scargle(t: np.ndarray, fluxes: np.ndarray, cache_path: str, min_period: float = 0.05,
+                        max_period: float = 5, samples_per_peak: int = 5, fap: float = 0.01,
+                        rows: np.ndarray | None = None) -> tuple:
+    """
+    带缓存的 batch_lomb_scargle：只重新计算光度曲线（或时间、参数）与上次不同的星
+    :param cache_path: 缓存文件（.npz），保存上次每颗星的摘要和结果
+    :param rows: 需要周期图的星的布尔掩码（如 screening.screen 的结果），为 None 时计算所有星；
+                 其余星的结果为 nan，它们以前的缓存结果保留，下次被选中时如果光度曲线没变可以直接使用
+    :return: (Periodogram, 本次重新计算的星的布尔掩码)
+    """
+    t = np.asarray(t, dtype=np.float64)
+    params = np.array([min_period, max_period, samples_per_peak, fap], dtype=np.float64)
+    n_stars = len(fluxes)
+    rows = np.ones(n_stars, dtype=bool) if rows is None else np.asarray(rows, dtype=bool)
+    digests = np.zeros(n_stars, dtype='S16')
+    digests[rows] = row_digests(fluxes[rows])
+
+    cache = None
+    if os.path.exists(cache_path):
+        cache = dict(np.load(cache_path))
+        # 时间或参数变化时频率网格和虚警阈值都会变，所有星都要重新计算
+        if not (np.array_equal(cache['t'], t) and np.array_equal(cache['params'], params)
+                and len(cache['digests']) == n_stars and 'computed' in cache):
+            cache = None
+    if cache is None:
+        cache = {
+            'digests': np.zeros(n_stars, dtype='S16'),
+            'computed': np.zeros(n_stars, dtype=bool),
+            'best_frequency': np.full(n_stars, np.nan),
+            'max_power': np.full(n_stars, np.nan),
+            'false_alarm_probability': np.full(n_stars, np.nan),
+            'false_alarm_level': np.nan,
+        }
+
+    changed = rows & ~(cache['computed'] & (cache['digests'] == digests))
+    best_frequency = cache['best_frequency']
+    max_power = cache['max_power']
+    probability = cache['false_alarm_probability']
+    level = float(cache['false_alarm_level'])
+    if changed.any():
+        part = batch_lomb_scargle(t, fluxes[changed], min_period, max_period, samples_per_peak, fap)
+        best_frequency[changed] = part.best_frequency
+        max_power[changed] = part.max_power
+        probability[changed] = part.false_alarm_probability
+        level = part.false_alarm_level
+        cache['digests'][changed] = digests[changed]
+        cache['computed'][changed] = True
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        np.savez(cache_path, t=t, params=params, digests=cache['digests'], computed=cache['computed'],
+                 best_frequency=best_frequency, max_power=max_power, false_alarm_probability=probability,
+                 false_alarm_level=level)
+
+    def selected(values):
+        return np.where(rows, values, np.nan)
+    result = Periodogram(frequency_grid(t, min_period, max_period, samples_per_peak), selected(best_frequency),
+                         selected(max_power), selected(probability), level)
+    return result, changed
@@ -0,0 +1,163 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import detections
+import file_utils
+import get_diffs
+import instrument
+import light_curves
+import periodogram
+import quality
+import screening
+import tracking
+import transit
+from find_star import find_star
+from stage_cache import StageCache
+
+# 各阶段的参数，改动某个参数只会重新计算用到它的阶段及其下游
+PARAMS = {
+    'find_star': {'frame': 49, 'fwhm': 3.0, 'threshold_factor': 5.0, 'bkg_mode': 'fast',
+                  'sharpness': 0.3, 'roundness': 0.5},
+    'light_curves': {'box_size': 5, 'bkg_mode': 'fast', 'skip': 25, 'repair': 'interpolate',
+                     'common_mode_sigma': quality.COMMON_MODE_SIGMA},
+    # cuts 与 cycle_analysis 相同（screening.CUTS），周期图之前先按变化统计量筛选；BLS 只按 bls_cuts 筛选
+    'periodogram': {'min_period': 0.05, 'max_period': 5.0, 'cuts': dict(screening.CUTS),
+                    'bls_cuts': dict(screening.BLS_CUTS), 'min_snr': transit.MIN_SNR},
+    # 差分图像流式找源，只缓存检测结果；keep_diffs 为 True 时才同时保存差分图像（整个扇区有几十 GB）
+    'diff_sources': {'skip': 25, 'lag': 1, 'bkg_mode': 'fast', 'keep_diffs': False},
+    'tracks': {'max_step': 5.0, 'min_length': 10, 'min_speed': 0.1},
+}
+
+
+def _find_star_stage(path: str, p: dict):
+    def compute(out_dir):
+        image_data, header = file_utils.read_frame(path)
+        # 与 find_star.py 相同：在固定值裁剪的图像上找星，再按 sharpness / roundness1 过滤
+        sources = find_star(np.clip(image_data, 100, 400), p['fwhm'], p['threshold_factor'], p['bkg_mode'])
+        sources = sources[(sources['sharpness'] > p['sharpness']) & (np.abs(sources['roundness1']) < p['roundness'])]
+        detections.write_catalog(os.path.join(out_dir, 'sources'), [sources])
+    return compute
+
+
+def _light_curves_stage(paths: list, sources_dir: str, p: dict):
+    def compute(out_dir):
+        source = detections.load_sources(sources_dir)
+        fs, ts = light_curves.get_light_curve(paths, source, box_size=p['box_size'], bkg_mode=p['bkg_mode'])
+        # 与 light_curves.py 相同：修补坏历元，保存好历元的掩码
+        bad, _ = quality.flag_epochs(fs, quality.epoch_quality(ts, quality.read_quality(paths)),
+                                     sigma=p['common_mode_sigma'])
+        quality.repair_epochs(fs, ts, bad, p['repair'])
+        np.save(os.path.join(out_dir, 'fluxes.npy'), fs)
+        np.save(os.path.join(out_dir, 'times.npy'), np.asarray(ts, dtype=np.float64))
+        np.save(os.path.join(out_dir, 'epoch_mask.npy'), ~bad)
+    return compute
+
+
+def _periodogram_stage(lc_dir: str, sources_dir: str, p: dict):
+    def compute(out_dir):
+        fs = np.load(os.path.join(lc_dir, 'fluxes.npy'))
+        t = np.load(os.path.join(lc_dir, 'times.npy'))
+        good = np.load(os.path.join(lc_dir, 'epoch_mask.npy'))
+        fs, t = fs[:, good], t[good]
+        sc = detections.load_sources(sources_dir)
+        # 与 cycle_analysis 相同：先按 screening 的统计量筛选，周期图只算候选星，BLS 只算极差足够的星，
+        # 周期图的周期在范围内或 BLS 信噪比足够的星写入 feat.csv
+        stats = screening.variability_stats(fs)
+        candidates, _ = screening.screen(stats, p['cuts'])
+        bls_candidates, _ = screening.screen(stats, p['bls_cuts'])
+        n_stars = len(fs)
+        ls_period = np.full(n_stars, np.nan)
+        ls = {name: np.full(n_stars, np.nan) for name in ('max_power', 'best_frequency', 'false_alarm_probability')}
+        if candidates.any():
+            result = periodogram.batch_lomb_scargle(t, fs[candidates], p['min_period'], p['max_period'])
+            for name in ls:
+                ls[name][candidates] = getattr(result, name)
+            ls_period[candidates] = 1 / result.best_frequency
+        ls_valid = (ls_period > p['min_period']) & (ls_period < p['max_period'])
+        bls = {name: np.full(n_stars, np.nan) for name in ('period', 'power', 'depth', 'duration', 'epoch', 'snr')}
+        if bls_candidates.any():
+            bls_min_period = max(p['min_period'], 2 * max(transit.DURATIONS))
+            found = transit.batch_bls(t, fs[bls_candidates], transit.DURATIONS, bls_min_period, p['max_period'])
+            for name in bls:
+                bls[name][bls_candidates] = getattr(found, name)
+        bls_valid = bls['snr'] >= p['min_snr']
+        rows = np.flatnonzero(ls_valid | bls_valid)
+        # 周期图的周期不在范围内时周期图的列留空
+        for name in ls:
+            ls[name][~ls_valid] = np.nan
+        ls_period[~ls_valid] = np.nan
+        pd.DataFrame({
+            'id': rows,
+            'std': stats['std'][rows],
+            'ptp': stats['ptp'][rows],
+            'mad': stats['mad'][rows],
+            'von_neumann': stats['von_neumann'][rows],
+            'autocorr': stats['autocorr'][rows],
+            'max_power': ls['max_power'][rows],
+            'best_frequency': ls['best_frequency'][rows],
+            'best_period': ls_period[rows],
+            'false_alarm_probability': ls['false_alarm_probability'][rows],
+            **{f'bls_{name}': values[rows] for name, values in bls.items()},
+            'x_pixel': np.asarray(sc['xcentroid'])[rows],
+            'y_pixel': np.asarray(sc['ycentroid'])[rows],
+        }).to_csv(os.path.join(out_dir, 'feat.csv'), index=False)
+    return compute
+
+
+def _diff_sources_stage(paths: list, p: dict):
+    def compute(out_dir):
+        # 与 get_diffs.py 相同：每个差分图像找源后直接追加到检测结果存储，不保存整个差分序列
+        diffs_dir = os.path.join(out_dir, 'diffs') if p['keep_diffs'] else None
+        get_diffs.stream_diff_sources(paths, os.path.join(out_dir, 'detections'), p['lag'], p['bkg_mode'],
+                                      diffs_dir=diffs_dir, workers=os.cpu_count())
+    return compute
+
+
+def _tracks_stage(detections_dir: str, p: dict):
+    def compute(out_dir):
+        frames, _ = detections.read_detections(detections_dir)
+        tracks = tracking.link_tracks(frames, max_step=p['max_step'], min_length=p['min_length'],
+                                      min_speed=p['min_speed'])
+        tracking.save_tracks(os.path.join(out_dir, 'tracks.npz'), tracks)
+    return compute
+
+
+def run_pipeline(paths: list, params: dict = PARAMS, cache: StageCache | None = None) -> dict:
+    """
+    按依赖顺序运行各阶段，每个阶段的键由输入文件签名、参数和上游阶段的键决定，命中缓存时跳过
+    :return: {阶段名: Stage}，Stage.path 为该阶段的输出目录
+    """
+    cache = cache or StageCache()
+    p = params
+    stages = {}
+
+    frame = paths[p['find_star']['frame']]
+    stages['find_star'] = cache.run('find_star', _find_star_stage(frame, p['find_star']), p['find_star'],
+                                    inputs=[frame])
+    sources_dir = os.path.join(stages['find_star'].path, 'sources')
+
+    lc_paths = paths[p['light_curves']['skip']:]
+    stages['light_curves'] = cache.run('light_curves', _light_curves_stage(lc_paths, sources_dir, p['light_curves']),
+                                       p['light_curves'], inputs=lc_paths, upstream=[stages['find_star']])
+    stages['periodogram'] = cache.run('periodogram',
+                                      _periodogram_stage(stages['light_curves'].path, sources_dir, p['periodogram']),
+                                      p['periodogram'], upstream=[stages['light_curves'], stages['find_star']])
+
+    diff_paths = paths[p['diff_sources']['skip']:]
+    stages['diff_sources'] = cache.run('diff_sources', _diff_sources_stage(diff_paths, p['diff_sources']),
+                                       p['diff_sources'], inputs=diff_paths)
+    stages['tracks'] = cache.run('tracks',
+                                 _tracks_stage(os.path.join(stages['diff_sources'].path, 'detections'), p['tracks']),
+                                 p['tracks'], upstream=[stages['diff_sources']])
+    return stages
+
+
+if __name__ == '__main__':
+
+    instrument.start_run('pipeline')
+    paths = file_utils.get_fits_file_paths('data/')
+    stages = run_pipeline(paths)
+    for name, stage in stages.items():
+        print(f'{name:<14}{"缓存命中" if stage.hit else "重新计算":<8} {stage.path}')
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import sys
+import warnings
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import file_utils
+import instrument
+
+# 预览缓存目录，每帧一个 <文件名>-<摘要>.npz，摘要包括文件路径、大小、修改时间和下面的参数
+PREVIEW_DIR = 'result/preview'
+# 金字塔各层的缩小倍数（块内取平均），4 倍约 500x500，足够快速查看
+PYRAMID_FACTORS = (4, 8, 16)
+# 三种裁剪方式，顺序与 file_utils.clip_image_data 的返回值相同
+CLIP_MODES = ('fixed', 'percentile', 'statistics')
+# 每种裁剪方式的直方图分箱数（与原来 plt.hist 的 bins=100 相同）
+HIST_BINS = 100
+# 保存的分位数表（0 到 100，步长 0.1），其它百分位裁剪可以直接插值得到，不需要再读取整帧
+QUANTILES = np.linspace(0, 100, 1001)
+
+Preview = namedtuple('Preview', ['shape', 'levels', 'limits', 'histograms', 'quantiles'])
+
+
+def downsample(image_data: np.ndarray, factor: int) -> np.ndarray:
+    # factor x factor 块内的平均值（忽略 nan），不能整除的边缘行列丢弃
+    h, w = image_data.shape[0] // factor * factor, image_data.shape[1] // factor * factor
+    blocks = np.asarray(image_data[:h, :w], dtype=np.float32).reshape(h // factor, factor, w // factor, factor)
+    with warnings.catch_warnings():
+        # 全部为 nan 的块
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmean(blocks, axis=(1, 3))
+
+
+def build_pyramid(image_data: np.ndarray, factors: tuple = PYRAMID_FACTORS) -> dict:
+    # 第一层由原图缩小，之后每层由上一层缩小，每个像素只读一次
+    levels = {}
+    source, scale = image_data, 1
+    for factor in sorted(factors):
+        levels[factor] = downsample(source, factor // scale)
+        source, scale = levels[factor], factor
+    return levels
+
+
+def histograms(sorted_pixels: np.ndarray, limits: dict, bins: int = HIST_BINS) -> dict:
+    """
+    裁剪后图像的直方图，与 np.histogram(np.clip(image, vmin, vmax), bins, (vmin, vmax)) 相同：
+    小于 vmin 的像素计入第一箱，大于 vmax 的计入最后一箱
+    :param sorted_pixels: 排好序的有限像素值，每种裁剪只需要在上面二分查找分箱边界
+    :return: {裁剪方式: (计数, 分箱边界)}
+    """
+    result = {}
+    for mode, (vmin, vmax) in limits.items():
+        if vmax <= vmin:
+            # 与 np.histogram 相同，上下限相等时范围扩大到 ±0.5
+            vmin, vmax = vmin - 0.5, vmax + 0.5
+        # np.histogram 的分箱边界与像素同一精度（float32 图像的边界也是 float32），这样计数完全一致
+        edges = np.linspace(vmin, vmax, bins + 1, dtype=np.result_type(sorted_pixels.dtype, 1.0))
+        idx = np.searchsorted(sorted_pixels, edges, side='left')
+        idx[0], idx[-1] = 0, len(sorted_pixels)
+        result[mode] = (np.diff(idx), edges)
+    return result
+
+
+def sorted_quantiles(sorted_pixels: np.ndarray, q: np.ndarray = QUANTILES) -> np.ndarray:
+    # 排好序的数组上直接按位置线性插值，与 np.percentile 的默认方法相同，不需要再做一次划分
+    if not len(sorted_pixels):
+        return np.full(len(q), np.nan)
+    pos = np.asarray(q) / 100 * (len(sorted_pixels) - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, len(sorted_pixels) - 1)
+    lower = sorted_pixels[lo].astype(np.float64)
+    return lower + (sorted_pixels[hi] - lower) * (pos - lo)
+
+
+def build(image_data: np.ndarray, bkg_mode: str = 'exact', factors: tuple = PYRAMID_FACTORS,
+          bins: int = HIST_BINS) -> Preview:
+    # 对一帧计算预览：金字塔、三种裁剪的上下限（file_utils.clip_limits）、直方图和分位数表
+    with instrument.stage('preview.build', items=1, nbytes=image_data.nbytes):
+        levels = build_pyramid(image_data, factors)
+        limits = file_utils.clip_limits(image_data, bkg_mode)
+        limits = {mode: tuple(float(v) for v in limits[mode]) for mode in CLIP_MODES}
+        pixels = np.asarray(image_data).ravel()
+        pixels = np.sort(pixels[np.isfinite(pixels)])
+        return Preview(tuple(image_data.shape), levels, limits, histograms(pixels, limits, bins),
+                       sorted_quantiles(pixels))
+
+
+def cache_path(fits_path: str, bkg_mode: str = 'exact', factors: tuple = PYRAMID_FACTORS, bins: int = HIST_BINS,
+               cache_dir: str = PREVIEW_DIR) -> str:
+    # 文件被替换或修改、参数变化后摘要都会变化，旧的预览不会被误用
+    st = os.stat(fits_path)
+    payload = repr((os.path.abspath(fits_path), st.st_size, st.st_mtime_ns, bkg_mode, tuple(sorted(factors)), bins))
+    digest = hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+    return os.path.join(cache_dir, f'{os.path.splitext(os.path.basename(fits_path))[0]}-{digest}.npz')
+
+
+def save(path: str, preview: Preview):
+    arrays = {f'level{factor}': level for factor, level in preview.levels.items()}
+    arrays['shape'] = np.array(preview.shape)
+    arrays['limits'] = np.array([preview.limits[mode] for mode in CLIP_MODES])
+    arrays['counts'] = np.array([preview.histograms[mode][0] for mode in CLIP_MODES])
+    arrays['edges'] = np.array([preview.histograms[mode][1] for mode in CLIP_MODES])
+    arrays['quantiles'] = preview.quantiles
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # 先写临时文件再改名，中断时不会留下不完整的预览
+    tmp_path = f'{path}.tmp-{os.getpid()}.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load(path: str, factors: tuple | None = None) -> Preview:
+    # npz 中的数组按需读取，factors 只列出需要的金字塔层时其它层不会被读入
+    with np.load(path) as data:
+        stored = sorted(int(name[5:]) for name in data.files if name.startswith('level'))
+        levels = {factor: data[f'level{factor}'] for factor in stored if factors is None or factor in factors}
+        limits = {mode: tuple(v) for mode, v in zip(CLIP_MODES, data['limits'].tolist())}
+        hists = {mode: (c, e) for mode, c, e in zip(CLIP_MODES, data['counts'], data['edges'])}
+        return Preview(tuple(data['shape'].tolist()), levels, limits, hists, data['quantiles'])
+
+
+def get(fits_path: str, bkg_mode: str = 'exact', factors: tuple | None = None,
+        cache_dir: str = PREVIEW_DIR) -> Preview:
+    """
+    读取一帧的预览，没有缓存时读取整帧计算并保存
+    :param factors: 需要读取的金字塔层，None 表示全部
+    """
+    path = cache_path(fits_path, bkg_mode, cache_dir=cache_dir)
+    if os.path.exists(path):
+        with instrument.stage('preview.load', items=1):
+            return load(path, factors)
+    image_data, _ = file_utils.read_frame(fits_path, header_keys=())
+    preview = build(image_data, bkg_mode)
+    save(path, preview)
+    if factors is not None:
+        preview = preview._replace(levels={f: v for f, v in preview.levels.items() if f in factors})
+    return preview
+
+
+def _prepare_one(args):
+    fits_path, bkg_mode, cache_dir = args
+    path = cache_path(fits_path, bkg_mode, cache_dir=cache_dir)
+    if os.path.exists(path):
+        return False
+    get(fits_path, bkg_mode, cache_dir=cache_dir)
+    return True
+
+
+def prepare(paths: list, bkg_mode: str = 'exact', workers: int | None = None, cache_dir: str = PREVIEW_DIR) -> int:
+    """
+    为一组帧预先计算预览，已有缓存的帧跳过
+    :param workers: 进程数，为 0 时在当前进程中计算
+    :return: 新计算的帧数
+    """
+    workers = os.cpu_count() if workers is None else workers
+    jobs = [(path, bkg_mode, cache_dir) for path in paths]
+    if workers > 0 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return sum(pool.map(_prepare_one, jobs))
+    return sum(map(_prepare_one, jobs))
+
+
+def percentile_limits(preview: Preview, p_min: float = 1, p_max: float = 99) -> tuple:
+    # 由分位数表插值得到任意百分位的裁剪上下限
+    return tuple(float(v) for v in np.interp([p_min, p_max], QUANTILES, preview.quantiles))
+
+
+if __name__ == '__main__':
+    instrument.start_run('preview')
+    folder = sys.argv[1] if len(sys.argv) > 1 else 'data/'
+    paths = file_utils.get_fits_file_paths(folder)
+    n = prepare(paths)
+    print(f'{len(paths)} 帧，新计算预览 {n} 帧，保存在 {PREVIEW_DIR}')
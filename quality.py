@@ -0,0 +1,120 @@
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+from astropy.io import fits
+from scipy.ndimage import median_filter
+
+import instrument
+
+# 头信息 DQUALITY 中视为坏帧的标记位，与 lightkurve 的 default 相同：
+# 1 姿态调整，2 安全模式，4 粗指向，8 对地指向，32 动量卸载，128 人工排除
+DEFAULT_BITMASK = 1 | 2 | 4 | 8 | 32 | 128
+# 共模序列（每个历元所有星相对光度的中值）去掉滑动中值趋势后，偏离超过这么多倍 MAD 的历元视为坏帧
+# 许多星的中值非常稳定，MAD 很小且残差的尾部比正态分布重，阈值取得比通常的 5 倍大
+COMMON_MODE_SIGMA = 10.0
+# 共模趋势的滑动中值窗口（历元数）
+COMMON_MODE_WINDOW = 25
+# 计算共模时最多使用的星数（均匀抽取），限制 (星数, 历元数) 临时矩阵的大小
+COMMON_MODE_STARS = 5000
+# 一个历元中光度为 nan 的星超过这个比例时视为坏帧
+MAX_MISSING = 0.5
+# interpolate: 坏历元的光度按时间在前后最近的好历元之间线性插值；mask: 置为 nan
+REPAIR_MODES = ('interpolate', 'mask')
+
+
+def read_quality(paths: list) -> dict:
+    """
+    只解析校准 HDU 的头信息，不读取像素
+    :return: {TSTART: DQUALITY}，没有 DQUALITY 时为 0
+    """
+    result = {}
+    with instrument.stage('quality.read_headers', items=len(paths)):
+        for path in paths:
+            header = fits.getheader(path, 1)
+            result[float(header['TSTART'])] = int(header.get('DQUALITY', 0))
+    return result
+
+
+def epoch_quality(times: np.ndarray, quality_by_time: dict) -> np.ndarray:
+    # 按 TSTART 对齐到光度矩阵的列，找不到的历元为 0
+    return np.array([quality_by_time.get(float(t), 0) for t in times], dtype=np.int64)
+
+
+def common_mode(fluxes: np.ndarray, max_stars: int = COMMON_MODE_STARS) -> np.ndarray:
+    """
+    每个历元所有星相对光度（光度 / 该星中值 - 1）的中值，星自身的变化互相抵消，剩下所有星共同的变化
+    只使用中值为正的星，星数超过 max_stars 时均匀抽取
+    :return: (历元数,) 数组，全部为 nan 的历元为 nan
+    """
+    rows = np.arange(0, len(fluxes), max(1, -(-len(fluxes) // max_stars)))
+    f = np.asarray(fluxes[rows], dtype=np.float64)
+    with warnings.catch_warnings():
+        # 全部为 nan 的星或历元
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median = np.nanmedian(f, axis=1)
+        positive = median > 0
+        if not positive.any():
+            return np.full(f.shape[1], np.nan)
+        return np.nanmedian(f[positive] / median[positive, None] - 1, axis=0)
+
+
+def common_mode_outliers(series: np.ndarray, sigma: float = COMMON_MODE_SIGMA,
+                         window: int = COMMON_MODE_WINDOW) -> np.ndarray:
+    # 共模序列减去滑动中值后按 MAD 判断离群；序列中的 nan 先用中值补上，本身算作离群
+    finite = np.isfinite(series)
+    if not finite.any():
+        return np.ones(len(series), dtype=bool)
+    filled = np.where(finite, series, np.median(series[finite]))
+    residual = filled - median_filter(filled, size=min(window, len(filled)), mode='nearest')
+    mad = 1.4826 * np.median(np.abs(residual[finite] - np.median(residual[finite])))
+    if mad == 0:
+        return ~finite
+    return ~finite | (np.abs(residual) > sigma * mad)
+
+
+def flag_epochs(fluxes: np.ndarray, quality: np.ndarray | None = None, bitmask: int = DEFAULT_BITMASK,
+                sigma: float = COMMON_MODE_SIGMA, window: int = COMMON_MODE_WINDOW,
+                max_missing: float = MAX_MISSING) -> tuple:
+    """
+    对 (星数, 历元数) 的光度矩阵一次找出所有坏历元
+    :param quality: 每个历元的 DQUALITY（epoch_quality），为 None 时只用光度判断
+    :return: (坏历元的布尔掩码, OrderedDict 原因 -> 历元数)，一个历元可以同时属于多个原因
+    """
+    n_epochs = fluxes.shape[1]
+    reasons = OrderedDict()
+    if quality is not None:
+        reasons['quality'] = (np.asarray(quality) & bitmask) != 0
+    reasons['missing'] = np.isnan(fluxes).mean(axis=0) > max_missing if len(fluxes) else np.zeros(n_epochs, bool)
+    reasons['common_mode'] = common_mode_outliers(common_mode(fluxes), sigma, window)
+    bad = np.zeros(n_epochs, dtype=bool)
+    for mask in reasons.values():
+        bad |= mask
+    return bad, OrderedDict((name, int(mask.sum())) for name, mask in reasons.items())
+
+
+def repair_epochs(fluxes: np.ndarray, times: np.ndarray, bad: np.ndarray, mode: str = 'interpolate') -> np.ndarray:
+    """
+    一次处理所有星的坏历元（原地修改 fluxes）
+    interpolate：按时间在前后最近的好历元之间线性插值，两端的坏历元取最近的好历元；mask：置为 nan
+    """
+    if mode not in REPAIR_MODES:
+        raise ValueError(f'未知的处理方式: {mode}，可选 {REPAIR_MODES}')
+    bad = np.asarray(bad, dtype=bool)
+    if not bad.any():
+        return fluxes
+    if mode == 'mask' or bad.all():
+        fluxes[:, bad] = np.nan
+        return fluxes
+    times = np.asarray(times, dtype=np.float64)
+    good = np.flatnonzero(~bad)
+    idx = np.flatnonzero(bad)
+    # 每个坏历元前后最近的好历元
+    right = good[np.minimum(np.searchsorted(good, idx), len(good) - 1)]
+    left = good[np.maximum(np.searchsorted(good, idx) - 1, 0)]
+    span = times[right] - times[left]
+    weight = np.where(span > 0, (times[idx] - times[left]) / np.where(span > 0, span, 1), 0.0)
+    # 两端：只有一侧有好历元时 left == right，weight 为 0
+    weight = np.clip(weight, 0, 1)
+    fluxes[:, idx] = fluxes[:, left] * (1 - weight) + fluxes[:, right] * weight
+    return fluxes
@@ -4,12 +4,12 @@ import json
 import numpy as np
 import pandas as pd
 from astropy.coordinates import SkyCoord
-from astropy.wcs import WCS, FITSFixedWarning
+from astropy.wcs import FITSFixedWarning
 from astroquery.gaia import Gaia
 import astropy.units as u
-from tqdm import tqdm
 
-from classify_star import query_single_classify
+import gaia_catalog
+import sky
 import warnings
 warnings.simplefilter('ignore', FITSFixedWarning)
 import logging
@@ -18,8 +18,8 @@ logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %
 
 
 def query_star(id, x, y, hdr):
-    wcs = WCS(hdr)
-    ra, dec = wcs.all_pix2world(x, y, 0)
+    # WCS 按头信息缓存，不再每次调用都重新构造
+    ra, dec = sky.get_wcs(hdr).all_pix2world(x, y, 0)
     coord = SkyCoord(ra=ra * u.deg, dec=dec * u.deg)
     job = Gaia.cone_search_async(coordinate=coord, radius=100 * u.arcsec)  # 半径100 arcsec
     results = job.get_results()
@@ -36,6 +36,8 @@ def query_star(id, x, y, hdr):
 
 # 从.npy文件中读取星点数据
 if __name__ == '__main__':
+    # 离线运行时给出本地替代星表文件，为 None 时在线查询（结果缓存在 gaia_catalog.CACHE_DIR）
+    local_catalog = None
 
     # 加载头信息
     with open('result/light_curves/header.json', 'r') as f:
@@ -45,35 +47,16 @@ if __name__ == '__main__':
 
     ids = pd.read_csv('result/light_curves/data/feat.csv')['id'].tolist()
 
-    start_num = 0 # len(feat_classify.csv)
-
-    for ID in tqdm(ids[start_num:], desc="处理每个星点", unit="id", colour="green"):
-        x, y = sources[ID]['xcentroid'], sources[ID]['ycentroid']
-
-        print(f"查询的星: id: {ID}, x: {x}, y: {y}")
-        star_info = query_star(ID, x, y, hdr)
-
-        sid = star_info['source_id']
-        print(f"查询到的星点信息: {star_info}")
-
-        query_res = query_single_classify(sid)
-        print(f"查询结果: {query_res}")
-        # 追加到 csv 文件中
-        res = {
-            'id': ID,
-            'source_id': sid,
-            'x': x,
-            'y': y,
-            'ra': star_info['ra'],
-            'dec': star_info['dec'],
-            'best_class_name': query_res['best_class_name'] if len(query_res) > 0 else None,
-            'best_class_score': query_res['best_class_score'] if len(query_res) > 0 else None,
-            'classifier_name': query_res['classifier_name'] if len(query_res) > 0 else None,
-        }
-        # # 将结果追加到 CSV 文件中
-        df = pd.DataFrame([res])
-        df.to_csv('result/light_curves/data/feat_classify.csv', mode='a', header=False, index=False)
-
-
+    x = np.asarray(sources['xcentroid'])[ids]
+    y = np.asarray(sources['ycentroid'])[ids]
+    # source_origin 的坐标与原来一样按整帧像素坐标换算
+    ra, dec = sky.pix2world(hdr, x, y, offset=(0, 0))
 
+    # 一次取回覆盖所有星点的天区，所有星点一次匹配，代替逐颗 cone search 和分类查询
+    catalog = gaia_catalog.get_catalog(gaia_catalog.footprint(ra, dec), local_catalog=local_catalog)
+    matched = catalog.crossmatch(ra, dec)
+    print(f"匹配到 {np.sum(matched['source_id'] >= 0)} 个 Gaia 源")
 
+    # 与 classify_star 写出同一种格式（整体重写，带表头），两个脚本先后运行也不会混出损坏的 CSV
+    gaia_catalog.write_classification('result/light_curves/data/feat_classify.csv',
+                                      pd.DataFrame({'id': ids, **matched}))
@@ -1,20 +1,34 @@
-from astropy.io import fits
 import sys
 import os
 
+import inventory
+
 # 默认 FITS 文件路径
 FITS_PATH = 'data/tess2018319112938-s0005-1-4-0125-s_ffic.fits'
 
 def print_fits_shapes(fits_path):
+    # 只读取头信息块，按 NAXIS 给出每个 HDU 的形状，不读取像素
     if not os.path.exists(fits_path):
         print(f"文件不存在: {fits_path}")
         return
-    with fits.open(fits_path) as hdul:
-        for i, hdu in enumerate(hdul):
-            shape = hdu.data.shape if hdu.data is not None else None
-            print(f"HDU {i}: shape = {shape}")
+    for i, header in enumerate(inventory.read_headers(fits_path, n_hdus=None)):
+        naxis = header.get('NAXIS', 0)
+        shape = tuple(header.get(f'NAXIS{k}') for k in range(naxis, 0, -1)) if naxis else None
+        print(f"HDU {i}: shape = {shape}")
+
+def print_folder_shapes(folder):
+    # 目录中所有帧的头信息清单（增量更新），每行一帧
+    inv = inventory.scan(folder)
+    print(f"{'文件名':<48}{'形状':>14}{'TSTART':>14}{'相机':>6}{'CCD':>5}{'扇区':>6}{'DQUALITY':>10}")
+    for row in inv:
+        shape = f"({row['height']}, {row['width']})" if row['ok'] else '不完整'
+        print(f"{row['name']:<48}{shape:>14}{row['tstart']:>14.5f}{row['camera']:>6}{row['ccd']:>5}"
+              f"{row['sector']:>6}{row['quality']:>10}")
+    print(f"共 {len(inv)} 个文件，头信息不完整 {(~inv['ok']).sum()} 个")
 
 if __name__ == '__main__':
     path = sys.argv[1] if len(sys.argv) > 1 else FITS_PATH
-    print_fits_shapes(path)
-
+    if os.path.isdir(path):
+        print_folder_shapes(path)
+    else:
+        print_fits_shapes(path)
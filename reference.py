@@ -0,0 +1,215 @@
+import os
+
+import numpy as np
+from astropy.table import Table
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from tqdm import tqdm
+
+import detections
+import file_utils
+import inventory
+import sky
+from find_star import Variant, find_star_variants
+from sector_cube import SectorCube
+
+# 中值叠加时一个行带（所有帧的同一组行）占用的内存上限（字节）
+STACK_MEMORY = 512 * 2 ** 20
+# 合并逐帧检测时的匹配半径（像素），同时也是空间哈希的格子边长
+MERGE_RADIUS = 1.5
+STACK_METHODS = ('median', 'mean')
+
+
+def _band_rows(n_frames: int, width: int, memory: int) -> int:
+    return max(1, memory // (n_frames * width * 4))
+
+
+def _median(block: np.ndarray) -> np.ndarray:
+    # 没有 NaN 时用更快的 np.median，有坏像素时按 nanmedian 忽略
+    if np.isnan(block).any():
+        return np.nanmedian(block, axis=0)
+    return np.median(block, axis=0, overwrite_input=True)
+
+
+def stack_frames(paths: list, method: str = 'median', memory: int = STACK_MEMORY,
+                 out_path: str | None = None) -> np.ndarray:
+    """
+    把多帧（去边框后的）图像叠加成一幅参考图像，任何时候都不需要把所有帧放进内存
+    mean：逐帧累加，一次遍历，只占一帧的内存
+    median：按行带分多次遍历，每次从所有帧中读取同一组行（内存映射，只读这些行）求中值，行带大小由 memory 决定
+    :param out_path: 给出时结果写到该 .npy 文件（内存映射）
+    :return: float32 叠加图像
+    """
+    if method not in STACK_METHODS:
+        raise ValueError(f'未知的叠加方式 {method}，可选 {STACK_METHODS}')
+    h, w = file_utils.read_frame(paths[0])[0].shape
+    if out_path is not None:
+        stack = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float32, shape=(h, w))
+    else:
+        stack = np.empty((h, w), dtype=np.float32)
+
+    if method == 'mean':
+        total = np.zeros((h, w))
+        count = np.zeros((h, w), dtype=np.int32)
+        for path in tqdm(paths, desc='叠加参考图像（平均）', unit='file', colour='green'):
+            image_data = file_utils.read_frame(path)[0]
+            good = np.isfinite(image_data)
+            total += np.where(good, image_data, 0)
+            count += good
+        with np.errstate(invalid='ignore'):
+            stack[:] = total / count
+        return stack
+
+    rows = _band_rows(len(paths), w, memory)
+    block = np.empty((len(paths), rows, w), dtype=np.float32)
+    for r0 in tqdm(range(0, h, rows), desc='叠加参考图像（中值）', unit='band', colour='green'):
+        r1 = min(r0 + rows, h)
+        for t, path in enumerate(paths):
+            block[t, :r1 - r0] = file_utils.read_frame(path)[0][r0:r1]
+        stack[r0:r1] = _median(block[:, :r1 - r0])
+    return stack
+
+
+def stack_cube(cube: SectorCube, method: str = 'median', frames: slice = slice(None)) -> np.ndarray:
+    """
+    从帧立方体（sector_cube.py）叠加：每个分块的所有时刻连续存放，按分块读取一次即可，不需要多次遍历文件
+    """
+    if method not in STACK_METHODS:
+        raise ValueError(f'未知的叠加方式 {method}，可选 {STACK_METHODS}')
+    ny, nx = cube.data.shape[:2]
+    tile = cube.tile
+    stack = np.empty((ny * tile, nx * tile), dtype=np.float32)
+    for ty in tqdm(range(ny), desc=f'从帧立方体叠加参考图像（{method}）', unit='row', colour='green'):
+        for tx in range(nx):
+            block = np.array(cube.data[ty, tx, frames])
+            value = _median(block) if method == 'median' else np.nanmean(block, axis=0)
+            stack[ty * tile:(ty + 1) * tile, tx * tile:(tx + 1) * tile] = value
+    return stack[:cube.height, :cube.width]
+
+
+def merge_positions(x, y, radius: float = MERGE_RADIUS) -> tuple:
+    """
+    用空间哈希把相距小于 radius 的检测归为同一个源
+    每个检测落入边长为 radius 的格子，同一格子内的检测先合并；相邻格子的平均位置相距小于 radius 时再连通
+    （朋友的朋友方式，密集区域中相邻的源可能被连成一组）
+    :return: (每个检测所属的组号, 组数)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) == 0:
+        return np.empty(0, dtype=np.int64), 0
+    cx = np.floor(x / radius).astype(np.int64)
+    cy = np.floor(y / radius).astype(np.int64)
+    cx -= cx.min() - 1
+    cy -= cy.min() - 1
+    stride = int(cx.max()) + 2
+    cells, inverse = np.unique(cy * stride + cx, return_inverse=True)
+    count = np.bincount(inverse)
+    mx = np.bincount(inverse, weights=x) / count
+    my = np.bincount(inverse, weights=y) / count
+
+    # 只需要检查一半的相邻格子，另一半由对方检查
+    rows, cols = [], []
+    for dy, dx in ((0, 1), (1, -1), (1, 0), (1, 1)):
+        target = cells + dy * stride + dx
+        k = np.minimum(np.searchsorted(cells, target), len(cells) - 1)
+        hit = np.flatnonzero((cells[k] == target) & (np.hypot(mx - mx[k], my - my[k]) < radius))
+        rows.append(hit)
+        cols.append(k[hit])
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    graph = coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(len(cells), len(cells)))
+    n_groups, labels = connected_components(graph, directed=False)
+    return labels[inverse], n_groups
+
+
+def merge_frame_detections(catalog: detections.DetectionCatalog, radius: float = MERGE_RADIUS,
+                           min_frames: int = 3) -> Table:
+    """
+    合并逐帧检测结果（detections.DetectionCatalog）并去重：同一帧中落入同一组的多个检测只计一次
+    :param min_frames: 至少在这么多帧中被检测到才保留，去掉宇宙线和噪声
+    :return: 含 xcentroid, ycentroid, peak, flux, n_frames 列的星表，位置和光度为组内平均
+    """
+    labels, n_groups = merge_positions(catalog['x'], catalog['y'], radius)
+    count = np.bincount(labels, minlength=n_groups)
+    pairs = np.unique(labels.astype(np.int64) * max(catalog.n_frames, 1) + catalog['frame'])
+    n_frames = np.bincount(pairs // max(catalog.n_frames, 1), minlength=n_groups)
+    keep = n_frames >= min_frames
+    merged = {name: (np.bincount(labels, weights=catalog[name], minlength=n_groups) / np.maximum(count, 1))[keep]
+              for name in ('xcentroid', 'ycentroid', 'peak', 'flux')}
+    merged['n_frames'] = n_frames[keep]
+    return Table(merged)
+
+
+def merge_catalogs(stack_sources, frame_sources: Table, radius: float = MERGE_RADIUS) -> Table:
+    """
+    在叠加图像的星表中补充只在逐帧检测中出现的源
+    与叠加图像星点相距小于 radius 的逐帧源视为重复，保留叠加图像的测量（信噪比更高）
+    :param frame_sources: merge_frame_detections 的结果
+    :return: 与 merge_frame_detections 相同的列，n_frames 对叠加图像的星点为 0
+    """
+    n_stack = len(stack_sources)
+    labels, n_groups = merge_positions(
+        np.concatenate([np.asarray(stack_sources['xcentroid']), np.asarray(frame_sources['xcentroid'])]),
+        np.concatenate([np.asarray(stack_sources['ycentroid']), np.asarray(frame_sources['ycentroid'])]), radius)
+    covered = np.zeros(n_groups, dtype=bool)
+    covered[labels[:n_stack]] = True
+    extra = ~covered[labels[n_stack:]]
+    merged = {name: np.concatenate([np.asarray(stack_sources[name], dtype=np.float64),
+                                    np.asarray(frame_sources[name])[extra]])
+              for name in ('xcentroid', 'ycentroid', 'peak', 'flux')}
+    merged['n_frames'] = np.concatenate([np.zeros(n_stack, dtype=np.int64), np.asarray(frame_sources['n_frames'])[extra]])
+    return Table(merged)
+
+
+def detect_frames(paths: list, store_dir: str, variant: Variant, fwhm: float = 3.0, bkg_mode: str = 'fast',
+                  sharpness_min: float | None = None, roundness_max: float | None = None) -> detections.DetectionCatalog:
+    """
+    逐帧找星并追加到检测结果存储，内存中只有当前帧；中断后重新运行时从已写入的帧之后继续
+    """
+    with detections.DetectionWriter(store_dir, append=True) as writer:
+        for path in tqdm(paths[writer.n_frames:], desc='逐帧找星', unit='file', colour='green'):
+            image_data, header = file_utils.read_frame(path)
+            sources = find_star_variants(image_data, [variant], fwhm, bkg_mode,
+                                         sharpness_min=sharpness_min, roundness_max=roundness_max)[variant.name]
+            writer.append(sources, header.get('TSTART', np.nan))
+    return detections.DetectionCatalog(store_dir)
+
+
+if __name__ == '__main__':
+
+    # 与 light_curves.py 一致，去除前 25 张图像（按头信息清单选帧，不打开每个文件）
+    paths = inventory.select_paths('data/', skip=25)
+    print(f'读取到 {len(paths)} 个 FITS 文件')
+
+    STACK_METHOD = 'median'
+    MERGE_FRAMES = False  # 是否再合并逐帧检测结果（需要对每帧找星，耗时较长）
+    BKG_MODE = 'fast'
+    # 与 find_star.py 的 source_fixed 使用相同的裁剪和过滤条件
+    variant = Variant('fixed', (100, 400), 5.0)
+    cuts = dict(sharpness_min=0.3, roundness_max=0.5)
+    os.makedirs('result/reference', exist_ok=True)
+
+    if os.path.exists('result/cube/meta.json'):
+        stack = stack_cube(SectorCube('result/cube'), STACK_METHOD, frames=slice(25, None))
+        np.save('result/reference/stack.npy', stack)
+    else:
+        stack = stack_frames(paths, STACK_METHOD, out_path='result/reference/stack.npy')
+    sources = find_star_variants(stack, [variant], bkg_mode=BKG_MODE, **cuts)[variant.name]
+    if sources is None:
+        # 叠加图像上没有星点时用空表，逐帧检测仍可以补充
+        sources = Table({name: np.empty(0) for name in ('xcentroid', 'ycentroid', 'peak', 'flux')})
+    print(f'叠加图像找到 {len(sources)} 个星点')
+
+    if MERGE_FRAMES:
+        catalog = detect_frames(paths, 'result/reference/frame_detections', variant, bkg_mode=BKG_MODE, **cuts)
+        frame_sources = merge_frame_detections(catalog)
+        sources = merge_catalogs(sources, frame_sources)
+        print(f'逐帧检测补充 {int(np.sum(sources["n_frames"] > 0))} 个星点，共 {len(sources)} 个')
+
+    if not len(sources):
+        raise SystemExit('没有找到星点，不写出 result/reference/sources，请检查裁剪范围和找星阈值')
+
+    # 与 find_star.py 的结果格式相同，light_curves.py 等可以直接读取 result/reference/sources
+    hdr = file_utils.read_frame(paths[0])[1]
+    detections.write_catalog('result/reference/sources', [sources])
+    sky.write_sky_coords('result/reference/sources', hdr)
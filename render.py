@@ -0,0 +1,182 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+MODES = ('png', 'sheet', 'pdf', 'none')
+# 提交后尚未完成的任务上限，超过时等待最早的任务，避免数据在队列中堆积
+MAX_PENDING = 256
+# 缩略图总览每页的 (行, 列) 和每格大小（英寸）
+SHEET_SHAPE = (5, 5)
+SHEET_CELL = (3.2, 2.4)
+DPI = 100
+
+
+def light_curve(ax, t, f, title):
+    ax.plot(t, f)
+    ax.set_title(title)
+    ax.set_xlabel('Time(day)')
+    ax.set_ylabel('Flux')
+    ax.grid()
+
+
+def track(ax, x, y, title):
+    ax.plot(x, y, 'o-')
+    ax.set_title(title)
+    ax.set_xlabel('X (pixel)')
+    ax.set_ylabel('Y (pixel)')
+    ax.invert_yaxis()
+
+
+def flux_change(ax, f, title):
+    ax.plot(f, marker='o')
+    ax.set_title(title)
+    ax.set_xlabel('Time (30min)')
+    ax.set_ylabel('Flux')
+
+
+# 绘图模板：名称 -> (绘制函数, 单独出图时的图像大小)
+TEMPLATES = {
+    'light_curve': (light_curve, (10, 5)),
+    'track': (track, (6.4, 4.8)),
+    'flux_change': (flux_change, (6.4, 4.8)),
+}
+
+# 每个进程复用同一个 Agg 画布，不经过 pyplot 的图形管理
+_figure = None
+
+
+def _get_figure(size) -> Figure:
+    global _figure
+    if _figure is None:
+        _figure = Figure()
+        FigureCanvasAgg(_figure)
+    _figure.clear()
+    _figure.set_size_inches(size)
+    return _figure
+
+
+def _draw(ax, job):
+    name, _, data = job
+    TEMPLATES[name][0](ax, **data)
+
+
+def _render_png(job):
+    name, path, _ = job
+    fig = _get_figure(TEMPLATES[name][1])
+    _draw(fig.add_subplot(), job)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fig.savefig(path, dpi=DPI)
+
+
+def _render_sheet(jobs, path, shape=SHEET_SHAPE):
+    # 一页缩略图：每个任务画在网格中的一格
+    rows, cols = shape
+    fig = _get_figure((cols * SHEET_CELL[0], rows * SHEET_CELL[1]))
+    for k, job in enumerate(jobs):
+        ax = fig.add_subplot(rows, cols, k + 1)
+        _draw(ax, job)
+        ax.title.set_fontsize(7)
+        ax.xaxis.label.set_fontsize(6)
+        ax.yaxis.label.set_fontsize(6)
+        ax.tick_params(labelsize=5)
+    fig.tight_layout()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fig.savefig(path, dpi=DPI)
+
+
+def _render_pdf(jobs, path):
+    # 所有任务按顺序写成一个多页 PDF
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with PdfPages(path) as pdf:
+        for job in jobs:
+            fig = _get_figure(TEMPLATES[job[0]][1])
+            _draw(fig.add_subplot(), job)
+            pdf.savefig(fig)
+
+
+class Renderer:
+    """
+    延迟绘图：主流程只提交绘图任务（模板名 + 数据 + 输出路径），由后台进程池渲染，不在 PNG 编码上阻塞
+    :param mode: 'png' 每个任务一张图；'sheet' 每 rows x cols 个任务拼成一页缩略图；
+                 'pdf' 所有任务写成一个多页 PDF；'none' 不绘图
+    :param output: sheet 模式为输出目录，pdf 模式为输出文件
+    :param workers: 渲染进程数，为 0 时在当前进程中渲染
+    """
+
+    def __init__(self, mode: str = 'png', output: str | None = None, workers: int | None = None,
+                 sheet_shape: tuple = SHEET_SHAPE, max_pending: int = MAX_PENDING):
+        if mode not in MODES:
+            raise ValueError(f'未知的绘图模式: {mode}，可选 {MODES}')
+        if mode in ('sheet', 'pdf') and output is None:
+            raise ValueError(f'{mode} 模式需要给出 output')
+        self.mode = mode
+        self.output = output
+        self.sheet_shape = sheet_shape
+        self.max_pending = max_pending
+        self.n_jobs = 0
+        self._jobs = []
+        self._pending = deque()
+        self._sheets = 0
+        workers = os.cpu_count() if workers is None else workers
+        self._pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 and mode != 'none' else None
+
+    def submit(self, template: str, path: str | None = None, **data):
+        """
+        提交一个绘图任务
+        :param template: TEMPLATES 中的模板名
+        :param path: png 模式的输出文件，其他模式忽略
+        """
+        if template not in TEMPLATES:
+            raise ValueError(f'未知的绘图模板: {template}')
+        self.n_jobs += 1
+        if self.mode == 'none':
+            return
+        data = {k: np.asarray(v) if isinstance(v, (list, np.memmap)) else v for k, v in data.items()}
+        job = (template, path, data)
+        if self.mode == 'png':
+            self._dispatch(_render_png, job)
+            return
+        self._jobs.append(job)
+        if self.mode == 'sheet' and len(self._jobs) == self.sheet_shape[0] * self.sheet_shape[1]:
+            self._flush_sheet()
+
+    def _flush_sheet(self):
+        if not self._jobs:
+            return
+        path = os.path.join(self.output, f'sheet_{self._sheets:04d}.png')
+        self._dispatch(_render_sheet, self._jobs, path, self.sheet_shape)
+        self._sheets += 1
+        self._jobs = []
+
+    def _dispatch(self, func, *args):
+        if self._pool is None:
+            func(*args)
+            return
+        self._pending.append(self._pool.submit(func, *args))
+        while len(self._pending) > self.max_pending:
+            self._pending.popleft().result()
+
+    def close(self):
+        # 提交剩余任务并等待所有渲染完成，渲染中的异常在这里抛出
+        if self.mode == 'sheet':
+            self._flush_sheet()
+        elif self.mode == 'pdf' and self._jobs:
+            self._dispatch(_render_pdf, self._jobs, self.output)
+            self._jobs = []
+        try:
+            while self._pending:
+                self._pending.popleft().result()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
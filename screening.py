@@ -0,0 +1,73 @@
+from collections import OrderedDict
+
+import numpy as np
+
+# 每批处理的星数，限制 (星数, 历元数) float64 临时矩阵的大小
+STAR_CHUNK = 4096
+# 默认的筛选条件：名称 -> (统计量, 比较方式, 阈值)，阈值为 None 的条件不使用
+# 原来 cycle_analysis 在周期图之后才去掉 ptp < 100 的星，这里提前到周期图之前
+CUTS = OrderedDict([
+    ('ptp_min', ('ptp', '>=', 100.0)),
+    ('std_min', ('std', '>=', None)),
+    ('mad_min', ('mad', '>=', None)),
+    # 白噪声的 von Neumann 比约为 2（标准差约 2 / sqrt(历元数)）：慢变化时明显小于 2，接近采样间隔的快速周期时大于 2
+    # 偏离 2 不到 5 倍标准差的星与白噪声无法区分，不计算周期图
+    ('white_noise', ('von_neumann_sigma', '>=', 5.0)),
+    ('von_neumann_max', ('von_neumann', '<=', None)),
+    # 白噪声的一阶自相关约为 0，平滑变化时接近 1
+    ('autocorr_min', ('autocorr', '>=', None)),
+])
+# BLS 搜索只用极差筛选：短持续时间的凌星（食）只占很少的历元，von Neumann 比接近白噪声，
+# 按 white_noise 筛选会把它们全部去掉
+BLS_CUTS = OrderedDict([('ptp_min', CUTS['ptp_min'])])
+STATISTICS = ('std', 'ptp', 'mad', 'von_neumann', 'von_neumann_sigma', 'autocorr')
+
+
+def variability_stats(fluxes: np.ndarray, star_chunk: int = STAR_CHUNK) -> dict:
+    """
+    对 (星数, 历元数) 的光度矩阵一次计算所有星的变化统计量
+    :return: {'std', 'ptp', 'mad', 'von_neumann', 'von_neumann_sigma', 'autocorr'}，每项为 (星数,) 数组
+    mad 为中值绝对偏差（乘 1.4826 换算为正态分布的标准差）
+    von_neumann = 相邻差分的平方和 / 离差平方和，von_neumann_sigma 为它偏离白噪声期望值 2 的标准差倍数，
+    autocorr 为一阶自相关系数；常数光度曲线这三项为 nan
+    """
+    n_stars = len(fluxes)
+    result = {name: np.empty(n_stars) for name in STATISTICS}
+    for s0 in range(0, n_stars, star_chunk):
+        sl = slice(s0, s0 + star_chunk)
+        f = np.asarray(fluxes[sl], dtype=np.float64)
+        result['std'][sl] = f.std(axis=1)
+        result['ptp'][sl] = np.ptp(f, axis=1)
+        median = np.median(f, axis=1, keepdims=True)
+        result['mad'][sl] = 1.4826 * np.median(np.abs(f - median), axis=1)
+        d = f - f.mean(axis=1, keepdims=True)
+        ss = (d * d).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result['von_neumann'][sl] = (np.diff(f, axis=1) ** 2).sum(axis=1) / ss
+            result['autocorr'][sl] = (d[:, 1:] * d[:, :-1]).sum(axis=1) / ss
+        result['von_neumann_sigma'][sl] = np.abs(result['von_neumann'][sl] - 2) * np.sqrt(f.shape[1]) / 2
+    return result
+
+
+def screen(stats: dict, cuts: dict = CUTS) -> tuple:
+    """
+    按顺序应用筛选条件
+    :param cuts: 名称 -> (统计量, '>=' 或 '<=', 阈值)，阈值为 None 时跳过
+    :return: (保留的星的布尔掩码, OrderedDict 名称 -> 该条件去掉的星数（只计前面条件保留下来的星）)
+    统计量为 nan 的星不满足任何条件
+    """
+    n_stars = len(next(iter(stats.values())))
+    keep = np.ones(n_stars, dtype=bool)
+    removed = OrderedDict()
+    for name, (stat, op, threshold) in cuts.items():
+        if threshold is None:
+            continue
+        if op == '>=':
+            passed = stats[stat] >= threshold
+        elif op == '<=':
+            passed = stats[stat] <= threshold
+        else:
+            raise ValueError(f'未知的比较方式: {op}')
+        removed[name] = int(np.sum(keep & ~passed))
+        keep &= passed
+    return keep, removed
@@ -0,0 +1,114 @@
+import json
+import os
+
+import numpy as np
+from scipy.ndimage import median_filter
+from tqdm import tqdm
+
+import background
+import file_utils
+
+# 每个分块的边长（像素），一个分块内同一位置所有时刻的像素连续存放
+TILE = 64
+
+
+def build_cube(paths: list, out_dir: str, tile: int = TILE, bkg_mode: str | None = 'exact') -> str:
+    """
+    将一个扇区的 FFI 打包成一个分块存储的帧立方体，只需要在数据下载后执行一次
+    立方体形状为 (ny, nx, T, tile, tile)：每个分块的全部时刻连续存放，读取某个位置的像素盒子时只需一次连续读取
+    :param paths: 按时间顺序排列的 FITS 文件路径
+    :param out_dir: 输出目录，包含 cube.npy 和 index.npz
+    :param tile: 分块边长
+    :param bkg_mode: 同时计算每帧中值滤波后的背景统计量（与 get_light_curve 中一致），None 表示不计算
+    :return: 输出目录
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    first, _ = file_utils.read_frame(paths[0])
+    h, w = first.shape
+    ny, nx = -(-h // tile), -(-w // tile)
+    cube = np.lib.format.open_memmap(os.path.join(out_dir, 'cube.npy'), mode='w+',
+                                     dtype=np.float32, shape=(ny, nx, len(paths), tile, tile))
+
+    times = np.full(len(paths), np.nan)
+    quality = np.zeros(len(paths), dtype=np.int32)
+    bkg = np.full((len(paths), 2), np.nan)
+    padded = np.zeros((ny * tile, nx * tile), dtype=np.float32)
+    for t, path in enumerate(tqdm(paths, desc='打包 FFI 到帧立方体', unit='file', colour='green')):
+        image_data, header = file_utils.read_frame(path)
+        if image_data.shape != (h, w):
+            raise ValueError(f'{path} 的图像尺寸 {image_data.shape} 与第一帧 {(h, w)} 不一致')
+        times[t] = header.get('TSTART', np.nan)
+        quality[t] = header.get('DQUALITY', 0)
+        padded[:h, :w] = image_data
+        cube[:, :, t] = padded.reshape(ny, tile, nx, tile).transpose(0, 2, 1, 3)
+        if bkg_mode is not None:
+            _, median, std = background.background_stats(median_filter(image_data, size=3), bkg_mode, sigma=3.0)
+            bkg[t] = median, std
+    cube.flush()
+
+    np.savez(os.path.join(out_dir, 'index.npz'),
+             times=times, quality=quality, bkg_median=bkg[:, 0], bkg_std=bkg[:, 1],
+             names=np.array([os.path.basename(p) for p in paths]))
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump({'shape': [len(paths), h, w], 'tile': tile}, f, indent=4)
+    return out_dir
+
+
+class SectorCube:
+    """
+    只读打开 build_cube 生成的帧立方体（内存映射）
+    """
+
+    def __init__(self, cube_dir: str):
+        with open(os.path.join(cube_dir, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        self.n_frames, self.height, self.width = meta['shape']
+        self.tile = meta['tile']
+        self.data = np.load(os.path.join(cube_dir, 'cube.npy'), mmap_mode='r')
+        index = np.load(os.path.join(cube_dir, 'index.npz'))
+        self.times = index['times']
+        self.quality = index['quality']
+        self.bkg_median = index['bkg_median']
+        self.bkg_std = index['bkg_std']
+        self.names = index['names'].tolist()
+
+    def __len__(self):
+        return self.n_frames
+
+    @property
+    def shape(self) -> tuple:
+        return self.n_frames, self.height, self.width
+
+    def stamp(self, y0: int, y1: int, x0: int, x1: int, frames: slice = slice(None)) -> np.ndarray:
+        """
+        读取 [y0:y1, x0:x1] 区域在所有（或 frames 指定）时刻的像素，超出图像的部分会被截掉
+        :return: 形状为 (T, y1 - y0, x1 - x0) 的数组
+        """
+        y0, y1 = max(y0, 0), min(y1, self.height)
+        x0, x1 = max(x0, 0), min(x1, self.width)
+        n = len(range(self.n_frames)[frames])
+        out = np.empty((n, max(y1 - y0, 0), max(x1 - x0, 0)), dtype=np.float32)
+        tile = self.tile
+        for ty in range(y0 // tile, (y1 - 1) // tile + 1):
+            ys0, ys1 = max(y0, ty * tile), min(y1, (ty + 1) * tile)
+            for tx in range(x0 // tile, (x1 - 1) // tile + 1):
+                xs0, xs1 = max(x0, tx * tile), min(x1, (tx + 1) * tile)
+                out[:, ys0 - y0:ys1 - y0, xs0 - x0:xs1 - x0] = \
+                    self.data[ty, tx, frames, ys0 - ty * tile:ys1 - ty * tile, xs0 - tx * tile:xs1 - tx * tile]
+        return out
+
+    def frame(self, t: int) -> np.ndarray:
+        # 还原第 t 帧的完整（去边框后）图像
+        ny, nx = self.data.shape[:2]
+        img = self.data[:, :, t].transpose(0, 2, 1, 3).reshape(ny * self.tile, nx * self.tile)
+        return img[:self.height, :self.width]
+
+
+if __name__ == '__main__':
+
+    paths = file_utils.get_fits_file_paths('data/')
+    print(f'读取到 {len(paths)} 个 FITS 文件')
+
+    build_cube(paths, 'result/cube')
+    cube = SectorCube('result/cube')
+    print(f'帧立方体形状: {cube.shape}，分块大小: {cube.tile}')
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS, FITSFixedWarning
+from scipy.ndimage import map_coordinates
+
+import detections
+import file_utils
+
+# 星点坐标来自去边框后的图像（见 file_utils.CROP），换算天球坐标前加回去掉的列数和行数 (x, y)
+CROP_OFFSET = (file_utils.CROP[1].start or 0, file_utils.CROP[0].start or 0)
+# 插值网格的步长（像素）
+GRID_STEP = 16
+# 头信息中没有图像尺寸时使用 TESS FFI 的尺寸（行, 列）
+FFI_SHAPE = (2078, 2136)
+CACHE_SIZE = 16
+_cache = OrderedDict()
+
+
+def header_hash(header) -> str:
+    # 只对 WCS 相关关键字取哈希，时间等关键字不同的帧共用同一个 WCS
+    cards = sorted((k, str(v)) for k, v in dict(header).items() if file_utils.WCS_KEY_PATTERN.match(k))
+    return hashlib.sha1(json.dumps(cards).encode()).hexdigest()
+
+
+def _cached(key, compute):
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+    value = compute()
+    _cache[key] = value
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return value
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def _build_wcs(header) -> WCS:
+    if not isinstance(header, fits.Header):
+        header = fits.Header({k: v for k, v in dict(header).items() if file_utils.WCS_KEY_PATTERN.match(k)})
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FITSFixedWarning)
+        return WCS(header)
+
+
+def get_wcs(header) -> WCS:
+    """
+    由头信息（fits.Header 或 find_star 保存的 json dict）构造 WCS，按 WCS 关键字的哈希缓存
+    """
+    return _cached(('wcs', header_hash(header)), lambda: _build_wcs(header))
+
+
+def _gnomonic(ra, dec, ra0, dec0) -> tuple:
+    # 以 (ra0, dec0) 为切点的标准坐标 (xi, eta)，单位为弧度
+    ra, dec, ra0, dec0 = np.radians(ra), np.radians(dec), np.radians(ra0), np.radians(dec0)
+    cos_c = np.sin(dec0) * np.sin(dec) + np.cos(dec0) * np.cos(dec) * np.cos(ra - ra0)
+    xi = np.cos(dec) * np.sin(ra - ra0) / cos_c
+    eta = (np.cos(dec0) * np.sin(dec) - np.sin(dec0) * np.cos(dec) * np.cos(ra - ra0)) / cos_c
+    return xi, eta
+
+
+def _inverse_gnomonic(xi, eta, ra0, dec0) -> tuple:
+    ra0, dec0 = np.radians(ra0), np.radians(dec0)
+    denom = np.cos(dec0) - eta * np.sin(dec0)
+    ra = ra0 + np.arctan2(xi, denom)
+    dec = np.arctan2(np.sin(dec0) + eta * np.cos(dec0), np.hypot(xi, denom))
+    return np.degrees(ra) % 360, np.degrees(dec)
+
+
+class SkyGrid:
+    """
+    在粗网格上用精确的 all_pix2world 计算天球坐标，转为以 CRVAL 为切点的标准坐标后做双线性插值
+    SIP 畸变和投影都是像素坐标的光滑函数，插值后只需一次解析的反投影
+    """
+
+    def __init__(self, wcs: WCS, shape: tuple, step: int = GRID_STEP):
+        self.step = step
+        self.ra0, self.dec0 = wcs.wcs.crval
+        # 网格比图像多出一格，边缘的点也在网格内部插值
+        gy = np.arange(-step, shape[0] + 2 * step, step, dtype=np.float64)
+        gx = np.arange(-step, shape[1] + 2 * step, step, dtype=np.float64)
+        self.origin = (gy[0], gx[0])
+        xx, yy = np.meshgrid(gx, gy)
+        ra, dec = wcs.all_pix2world(xx, yy, 0)
+        xi, eta = _gnomonic(ra, dec, self.ra0, self.dec0)
+        self._xi, self._eta = xi, eta
+
+    def pix2world(self, x, y) -> tuple:
+        # x, y 为整帧图像中从 0 开始的像素坐标
+        coords = np.array([(np.asarray(y, dtype=np.float64) - self.origin[0]) / self.step,
+                           (np.asarray(x, dtype=np.float64) - self.origin[1]) / self.step])
+        xi = map_coordinates(self._xi, coords, order=1, mode='nearest')
+        eta = map_coordinates(self._eta, coords, order=1, mode='nearest')
+        return _inverse_gnomonic(xi, eta, self.ra0, self.dec0)
+
+
+def _frame_shape(header, wcs: WCS) -> tuple:
+    header = dict(header)
+    if 'NAXIS1' in header and 'NAXIS2' in header:
+        return int(header['NAXIS2']), int(header['NAXIS1'])
+    return wcs.pixel_shape[::-1] if wcs.pixel_shape is not None else FFI_SHAPE
+
+
+def get_grid(header, step: int = GRID_STEP) -> SkyGrid:
+    wcs = get_wcs(header)
+    return _cached(('grid', header_hash(header), step), lambda: SkyGrid(wcs, _frame_shape(header, wcs), step))
+
+
+def pix2world(header, x, y, offset: tuple = CROP_OFFSET, grid_step: int | None = None) -> tuple:
+    """
+    一次换算整个星表的像素坐标为 RA/Dec（度）
+    :param x: 去边框图像中从 0 开始的像素坐标（DAOStarFinder 的 xcentroid）
+    :param offset: 去边框时去掉的 (列数, 行数)，坐标本来就在整帧图像中时传 (0, 0)
+    :param grid_step: 给出时使用该步长的插值网格（适合数百万个点），为 None 时使用精确的 all_pix2world
+    """
+    x = np.asarray(x, dtype=np.float64) + offset[0]
+    y = np.asarray(y, dtype=np.float64) + offset[1]
+    if grid_step is None:
+        return get_wcs(header).all_pix2world(x, y, 0)
+    return get_grid(header, grid_step).pix2world(x, y)
+
+
+def write_sky_coords(store_dir: str, header, offset: tuple = CROP_OFFSET, grid_step: int | None = None):
+    """
+    为检测结果存储（detections.DetectionCatalog）计算所有行的 RA/Dec，作为 ra / dec 列保存在存储中
+    一个扇区内指向不变，所有帧共用同一个头信息
+    """
+    catalog = detections.DetectionCatalog(store_dir)
+    ra, dec = pix2world(header, catalog['x'], catalog['y'], offset, grid_step)
+    detections.write_extra_columns(store_dir, ra=ra, dec=dec)
+
+
+def source_sky_coords(sources, header, ids=slice(None), offset: tuple = CROP_OFFSET) -> tuple:
+    # 星点表中已经保存了 ra / dec 时直接读取，否则按头信息换算
+    if isinstance(sources, detections.DetectionCatalog) and 'ra' in sources.columns:
+        return np.asarray(sources['ra'])[ids], np.asarray(sources['dec'])[ids]
+    return pix2world(header, np.asarray(sources['xcentroid'])[ids], np.asarray(sources['ycentroid'])[ids], offset)
+
+
+def compare_with_exact(header, step: int = GRID_STEP, n: int = 100000, seed: int = 0) -> dict:
+    """
+    在整帧范围内随机取点，比较插值网格与精确 all_pix2world 的差别
+    :return: 最大误差和均方根误差（角秒）
+    """
+    wcs = get_wcs(header)
+    h, w = _frame_shape(header, wcs)
+    rng = np.random.default_rng(seed)
+    x, y = rng.uniform(0, w - 1, n), rng.uniform(0, h - 1, n)
+    ra, dec = wcs.all_pix2world(x, y, 0)
+    ra_g, dec_g = get_grid(header, step).pix2world(x, y)
+    # 小角度时的角距离
+    err = np.hypot(((ra_g - ra + 180) % 360 - 180) * np.cos(np.radians(dec)), dec_g - dec) * 3600
+    return {'max': float(err.max()), 'rms': float(np.sqrt(np.mean(err ** 2)))}
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import namedtuple
+
+# 缓存目录和磁盘预算（字节），超过预算时按最近使用时间淘汰最旧的条目
+CACHE_DIR = 'result/cache'
+DISK_BUDGET = 20 * 2 ** 30
+META_FILE = 'meta.json'
+
+Stage = namedtuple('Stage', ['name', 'key', 'path', 'hit'])
+
+
+def file_signature(paths) -> list:
+    # 输入文件的 (文件名, 大小, 修改时间)，文件被替换或修改后键会变化
+    signature = []
+    for path in paths:
+        st = os.stat(path)
+        signature.append((os.path.abspath(path), st.st_size, st.st_mtime_ns))
+    return signature
+
+
+def stage_key(name: str, params: dict, inputs=(), upstream=()) -> str:
+    """
+    阶段的内容键：阶段名、参数、输入文件签名和上游阶段的键一起取哈希
+    上游的键包含了它自己的参数和输入，所以改动一个参数只会改变它下游各阶段的键
+    """
+    payload = {
+        'name': name,
+        'params': params,
+        'inputs': file_signature(inputs),
+        'upstream': list(upstream),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+class StageCache:
+    """
+    按内容键缓存各阶段的输出目录：<cache_dir>/<阶段名>-<键>/，目录中有 meta.json 才算完整
+    每次命中时更新 meta.json 的修改时间作为最近使用时间
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, budget: int = DISK_BUDGET):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.budget = budget
+        # 本次运行用到的条目不会被淘汰
+        self._in_use = set()
+
+    def entry_path(self, name: str, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{name}-{key[:16]}')
+
+    def run(self, name: str, compute, params: dict, inputs=(), upstream=()) -> Stage:
+        """
+        命中时直接返回缓存目录，否则调用 compute(输出目录) 生成该阶段的所有输出
+        :param compute: 把输出写到给定目录的函数
+        :param inputs: 该阶段直接读取的输入文件
+        :param upstream: 上游阶段（Stage），它们的键参与本阶段的键
+        """
+        key = stage_key(name, params, inputs, [s.key for s in upstream])
+        path = self.entry_path(name, key)
+        meta_path = os.path.join(path, META_FILE)
+        self._in_use.add(path)
+        if os.path.exists(meta_path):
+            os.utime(meta_path)
+            return Stage(name, key, path, True)
+
+        tmp = f'{path}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        t0 = time.perf_counter()
+        try:
+            compute(tmp)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        meta = {'name': name, 'key': key, 'params': params, 'upstream': [s.key for s in upstream],
+                'n_inputs': len(inputs), 'seconds': time.perf_counter() - t0, 'bytes': _dir_size(tmp)}
+        with open(os.path.join(tmp, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=4, default=str)
+        # 整个目录写完后再改名，中断时不会留下不完整的条目
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        self.evict()
+        return Stage(name, key, path, False)
+
+    def entries(self) -> list:
+        # [(最近使用时间, 大小, 路径)]
+        result = []
+        for name in os.listdir(self.cache_dir):
+            meta_path = os.path.join(self.cache_dir, name, META_FILE)
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    size = json.load(f)['bytes']
+                result.append((os.path.getmtime(meta_path), size, os.path.join(self.cache_dir, name)))
+        return sorted(result)
+
+    def evict(self) -> list:
+        """
+        总大小超过预算时，从最久没有使用的条目开始删除
+        :return: 删除的目录
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for _, size, path in entries:
+            if total <= self.budget:
+                break
+            if path in self._in_use:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed.append(path)
+        return removed
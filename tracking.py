@@ -0,0 +1,134 @@
+from collections import namedtuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+from tqdm import tqdm
+
+# 一条轨迹：frames 为各点所在的帧序号，points 为 (k, 4) 的 [x, y, peak, flux]
+Track = namedtuple('Track', ['frames', 'points'])
+
+DETECTION_COLUMNS = ('xcentroid', 'ycentroid', 'peak', 'flux')
+
+
+def detections_to_array(sources) -> np.ndarray:
+    """
+    将一帧的 DAOStarFinder 结果（astropy Table，没有检测到目标时为 None）转换为 (n, 4) 数组
+    """
+    if sources is None or len(sources) == 0:
+        return np.empty((0, 4))
+    return np.column_stack([np.asarray(sources[c], dtype=float) for c in DETECTION_COLUMNS])
+
+
+class _Hypothesis:
+    __slots__ = ('frames', 'index', 'misses', 'resid')
+
+    def __init__(self, frames, index, misses=0, resid=0.0):
+        self.frames = frames
+        self.index = index
+        self.misses = misses
+        self.resid = resid
+
+    def score(self):
+        # 越长越好，长度相同时残差越小越好
+        return -len(self.frames), self.resid / len(self.frames)
+
+
+def _velocity(points, hyp):
+    # 匀速模型：用首尾两点估计每帧的位移
+    p0 = points[hyp.frames[0]][hyp.index[0], :2]
+    p1 = points[hyp.frames[-1]][hyp.index[-1], :2]
+    return p1, (p1 - p0) / (hyp.frames[-1] - hyp.frames[0])
+
+
+def _grow(t0, a, points, trees, used, max_step, tol, max_gap, beam):
+    """
+    从第 t0 帧的第 a 个检测出发，用束搜索（beam search）沿匀速运动方向延伸，返回最优假设
+    """
+    n_frames = len(points)
+    start = points[t0][a, :2]
+    hyps = []
+    # 种子：后续 max_gap + 1 帧内位移不超过 max_step（每帧）的检测
+    for t in range(t0 + 1, min(t0 + 2 + max_gap, n_frames)):
+        if trees[t] is None:
+            continue
+        for b in trees[t].query_ball_point(start, max_step * (t - t0)):
+            if not used[t][b]:
+                hyps.append(_Hypothesis([t0, t], [a, b], misses=t - t0 - 1))
+    if not hyps:
+        return None
+
+    best = min(hyps, key=_Hypothesis.score)
+    t = t0 + 2
+    while hyps and t < n_frames:
+        new_hyps = []
+        alive = [h for h in hyps if h.frames[-1] < t]
+        waiting = [h for h in hyps if h.frames[-1] >= t]
+        if alive and trees[t] is not None:
+            preds = np.array([p + v * (t - h.frames[-1])
+                              for h in alive for p, v in [_velocity(points, h)]])
+            matches = trees[t].query_ball_point(preds, tol)
+            for h, pred, cand in zip(alive, preds, matches):
+                for b in cand:
+                    if used[t][b]:
+                        continue
+                    r = np.hypot(*(points[t][b, :2] - pred))
+                    new_hyps.append(_Hypothesis(h.frames + [t], h.index + [b], 0, h.resid + r))
+        for h in alive:
+            # 允许漏检 max_gap 帧
+            if h.misses < max_gap:
+                new_hyps.append(_Hypothesis(h.frames, h.index, h.misses + 1, h.resid))
+        hyps = sorted(new_hyps + waiting, key=_Hypothesis.score)[:beam]
+        if hyps and hyps[0].score() < best.score():
+            best = hyps[0]
+        t += 1
+    return best
+
+
+def link_tracks(frames: list, max_step: float = 5.0, tol: float = 1.5, max_gap: int = 1,
+                min_length: int = 10, beam: int = 8, min_speed: float = 0.0) -> list:
+    """
+    连接各帧差分图像中的检测结果，寻找匀速运动的目标
+    每帧建立 KD 树，从每个尚未使用的检测出发做束搜索，找到的轨迹会占用其中的检测，因此总耗时近似与检测总数成正比
+    :param frames: 每帧一个 (n, 4) 数组 [x, y, peak, flux]（见 detections_to_array）
+    :param max_step: 相邻两帧之间允许的最大位移（像素）
+    :param tol: 匀速预测位置与实际检测之间允许的最大偏差（像素）
+    :param max_gap: 允许连续漏检的帧数
+    :param min_length: 轨迹的最少点数
+    :param beam: 每个起点保留的候选假设数
+    :param min_speed: 最小速度（像素/帧），低于该速度的轨迹视为静止源（例如变星），不输出但仍占用检测
+    :return: Track 列表
+    """
+    points = [np.asarray(f, dtype=float).reshape(-1, 4) for f in frames]
+    trees = [cKDTree(p[:, :2]) if len(p) else None for p in points]
+    used = [np.zeros(len(p), dtype=bool) for p in points]
+
+    tracks = []
+    for t0 in tqdm(range(len(points) - 1), desc='连接移动目标轨迹', unit='frame'):
+        for a in range(len(points[t0])):
+            if used[t0][a]:
+                continue
+            hyp = _grow(t0, a, points, trees, used, max_step, tol, max_gap, beam)
+            if hyp is None or len(hyp.frames) < min_length:
+                continue
+            for t, j in zip(hyp.frames, hyp.index):
+                used[t][j] = True
+            _, v = _velocity(points, hyp)
+            if np.hypot(*v) >= min_speed:
+                tracks.append(Track(np.array(hyp.frames),
+                                    np.array([points[t][j] for t, j in zip(hyp.frames, hyp.index)])))
+    return tracks
+
+
+def save_tracks(path: str, tracks: list):
+    # 所有轨迹拼接保存为一个 npz：每条轨迹的点数、帧序号和点
+    lengths = np.array([len(tr.frames) for tr in tracks], dtype=np.int64)
+    frames = np.concatenate([tr.frames for tr in tracks]) if tracks else np.empty(0, dtype=np.int64)
+    points = np.concatenate([tr.points for tr in tracks]) if tracks else np.empty((0, 4))
+    np.savez(path, lengths=lengths, frames=frames, points=points)
+
+
+def load_tracks(path: str) -> list:
+    with np.load(path) as data:
+        bounds = np.concatenate([[0], np.cumsum(data['lengths'])])
+        frames, points = data['frames'], data['points']
+    return [Track(frames[a:b], points[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
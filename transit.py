@@ -0,0 +1,147 @@
+from collections import namedtuple
+
+import numpy as np
+import scipy.sparse as sp
+from astropy.timeseries import BoxLeastSquares
+
+# 默认搜索的凌星（食）持续时间（天）：1 到 6 小时
+DURATIONS = (1 / 24, 2 / 24, 3 / 24, 4 / 24, 6 / 24)
+# 相位网格的分辨率：每个持续时间的起点间隔为 持续时间 / OVERSAMPLE（与 astropy BoxLeastSquares 的 oversample 含义相同）
+OVERSAMPLE = 10
+# 每批处理的星数，中间矩阵 (相位箱数, 星数) 保持在 CPU 缓存内
+STAR_CHUNK = 128
+# 每批周期的相位分箱只算一次，供所有星使用
+PERIOD_CHUNK = 256
+# 深度信噪比不低于此值才算找到凌星（食），纯白噪声星的最大信噪比一般在 4 到 6 之间
+MIN_SNR = 7.0
+
+Transit = namedtuple('Transit', ['period_grid', 'period', 'power', 'depth', 'duration', 'epoch', 'snr'])
+# 一个周期上与星无关的部分：历元到相位箱的稀疏矩阵，所有候选窗口（起点箱、持续箱数、窗口内历元数、权重），
+# 以及每个持续时间的窗口在其中所占的行 segments = [(持续箱数, 起点间隔, 第一行, 最后一行 + 1)]
+Fold = namedtuple('Fold', ['period', 'binning', 'start', 'dur', 'n_in', 'weight', 'segments'])
+
+
+def period_grid(t: np.ndarray, durations=DURATIONS, min_period: float | None = None,
+                max_period: float | None = None, frequency_factor: float = 1.0) -> np.ndarray:
+    # 与 BoxLeastSquares.autoperiod 相同的周期网格（频率均匀），网格只取决于时间和持续时间
+    return np.asarray(BoxLeastSquares(t, np.ones_like(t)).autoperiod(
+        np.asarray(durations), minimum_period=min_period, maximum_period=max_period,
+        frequency_factor=frequency_factor))
+
+
+def _fold(t_rel: np.ndarray, period: float, bin_width: float, dur_bins: np.ndarray, oversample: int) -> Fold:
+    """
+    按周期折叠时间：历元落入宽 bin_width 的相位箱，列出每个持续时间在相位网格上的所有窗口
+    窗口可以跨过相位 0（箱号对 n_bins 取模）
+    """
+    n = len(t_rel)
+    n_bins = int(np.ceil(period / bin_width))
+    phase_bin = np.minimum((np.mod(t_rel, period) / bin_width).astype(np.int64), n_bins - 1)
+    order = np.argsort(phase_bin, kind='stable')
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(phase_bin, minlength=n_bins))])
+    binning = sp.csr_matrix((np.ones(n), order, indptr), shape=(n_bins, n))
+
+    starts, durs, segments = [], [], []
+    row = 0
+    for d in np.minimum(dur_bins, n_bins):
+        step = max(1, d // oversample)
+        start = np.arange(0, n_bins, step)
+        starts.append(start)
+        durs.append(np.full(len(start), d))
+        segments.append((int(d), int(step), row, row + len(start)))
+        row += len(start)
+    start, dur = np.concatenate(starts), np.concatenate(durs)
+    # indptr 延长一周，窗口终点超过 n_bins 时从头累计
+    count = np.concatenate([indptr, n + indptr[1:]])
+    n_in = count[start + dur] - count[start]
+    n_out = n - n_in
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = np.where((n_in > 0) & (n_out > 0), n / (np.sqrt(n_in) * n_out), 0.0)
+    return Fold(period, binning, start, dur, n_in, weight, segments)
+
+
+def batch_bls(t: np.ndarray, fluxes: np.ndarray, durations=DURATIONS, min_period: float | None = None,
+              max_period: float | None = None, frequency_factor: float = 1.0, oversample: int = OVERSAMPLE,
+              star_chunk: int = STAR_CHUNK, period_chunk: int = PERIOD_CHUNK,
+              periods: np.ndarray | None = None) -> Transit:
+    """
+    批量计算所有光度曲线的 Box Least Squares 周期图，只保留每颗星功率最大的模型
+    所有星共用时间、周期网格和持续时间网格，每个周期的相位分箱和窗口只算一次；星按 star_chunk 分批，
+    每批的箱内求和是一次稀疏矩阵乘法，窗口内的和由累加和相减得到
+    目标函数与 BoxLeastSquares(t, f, dy=每颗星的标准差) 的 likelihood 相同
+    :param fluxes: (星数, 历元数) 的光度曲线矩阵
+    :param periods: 周期网格，为 None 时用 period_grid(t, durations, min_period, max_period, frequency_factor)
+    :return: Transit，depth 为食的深度（光度单位），duration 为持续时间，epoch 为第一次食的中心时间，
+             snr 为深度除以其误差，power 为对数似然的提升；没有找到变暗窗口的星为 nan
+    """
+    t = np.asarray(t, dtype=np.float64)
+    durations = np.sort(np.asarray(durations, dtype=np.float64))
+    if periods is None:
+        periods = period_grid(t, durations, min_period, max_period, frequency_factor)
+    periods = np.asarray(periods, dtype=np.float64)
+    if periods.min() <= durations.max():
+        raise ValueError(f'最短周期 {periods.min()} 必须大于最长持续时间 {durations.max()}')
+
+    n_stars, n = fluxes.shape
+    bin_width = durations[0] / oversample
+    dur_bins = np.maximum(np.round(durations / bin_width).astype(np.int64), 1)
+    t_rel = t - t.min()
+    sigma = np.empty(n_stars)
+    # 每颗星当前最好的窗口：得分 = 窗口内的和 * 权重，越负对数似然提升越大（0.5 * 得分² / sigma²）
+    best_score = np.zeros(n_stars)
+    best_period = np.full(n_stars, np.nan)
+    best_dur = np.zeros(n_stars, dtype=np.int64)
+    best_start = np.zeros(n_stars, dtype=np.int64)
+    best_sum = np.zeros(n_stars)
+    best_n_in = np.zeros(n_stars, dtype=np.int64)
+    for p0 in range(0, len(periods), period_chunk):
+        folds = [_fold(t_rel, period, bin_width, dur_bins, oversample) for period in periods[p0:p0 + period_chunk]]
+        for s0 in range(0, n_stars, star_chunk):
+            sl = slice(s0, s0 + star_chunk)
+            y = np.asarray(fluxes[sl], dtype=np.float64)
+            if p0 == 0:
+                sigma[sl] = y.std(axis=1)
+            # (历元数, 星数)：去掉均值后，窗口内的和为负说明窗口内比平均暗
+            yt = np.ascontiguousarray((y - y.mean(axis=1, keepdims=True)).T)
+            for fold in folds:
+                n_bins = fold.binning.shape[0]
+                extra = int(min(dur_bins[-1], n_bins))
+                binned = fold.binning @ yt
+                # 累加和，末尾接上第二周的前 extra 个箱，跨过相位 0 的窗口也是两个累加和之差
+                cs = np.empty((n_bins + extra + 1, yt.shape[1]))
+                cs[0] = 0
+                np.cumsum(binned, axis=0, out=cs[1:n_bins + 1])
+                cs[n_bins + 1:] = cs[n_bins] + cs[1:extra + 1]
+                # 得分 = 窗口内的和 * 权重，每个持续时间的窗口是累加和的两个等间隔切片之差
+                score = np.empty((len(fold.start), yt.shape[1]))
+                for d, step, r0, r1 in fold.segments:
+                    np.subtract(cs[d:d + n_bins:step], cs[:n_bins:step], out=score[r0:r1])
+                score *= fold.weight[:, None]
+                low = score.min(axis=0)
+                better = low < best_score[sl]
+                if not better.any():
+                    continue
+                # 只对得分刷新的星找窗口位置
+                cols = np.flatnonzero(better)
+                k = score[:, cols].argmin(axis=0)
+                idx = cols + s0
+                best_score[idx] = low[cols]
+                best_period[idx] = fold.period
+                best_dur[idx] = fold.dur[k]
+                best_start[idx] = fold.start[k]
+                best_sum[idx] = low[cols] / fold.weight[k]
+                best_n_in[idx] = fold.n_in[k]
+
+    found = np.isfinite(best_period) & (sigma > 0)
+    n_in = np.where(found, best_n_in, 1)
+    n_out = np.where(found, n - best_n_in, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        depth = -best_sum * n / (n_in * n_out)
+        epoch = t.min() + np.mod((best_start + best_dur / 2) * bin_width, best_period)
+        snr = depth / (sigma * np.sqrt(1 / n_in + 1 / n_out))
+        power = 0.5 * best_score ** 2 / sigma ** 2
+
+    def masked(values):
+        return np.where(found, values, np.nan)
+    return Transit(periods, masked(best_period), masked(power), masked(depth), masked(best_dur * bin_width),
+                   masked(epoch), masked(snr))